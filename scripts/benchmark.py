@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the parse and ingest hot path.
+
+Synthetic storage integration streams are generated for the main payload
+shapes and pushed through each stage of the client:
+
+- json_loads: decoding of the raw lines with the standard library json.loads
+- default_loads: decoding of the raw lines with the default JSON decoder of the
+  client (orjson or msgspec when installed)
+- ttn_parse: parsing of the decoded uplinks, reading every value; the parsed
+  values of the whole stream are kept, so the peak memory is their footprint
+- stream: a full fetch from a local HTTP stand-in of the storage integration
+
+Lines per second are measured on a plain run and the peak memory traced by
+tracemalloc on a second one. The thresholds are set for the default 20000
+lines. With --check the results are compared with the
+regression thresholds in benchmark_thresholds.json.
+
+Usage: python scripts/benchmark.py [--lines 20000] [--check] [--json results.json]
+"""
+
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+import json
+import logging
+import pathlib
+import random
+import sys
+import time
+import tracemalloc
+
+from aiohttp import web
+
+import ttn_client
+from ttn_client import client as ttn_client_module
+from ttn_client.json_decoder import default_loads
+from ttn_client.parsers import cayenne_lpp_decoder, register_decoder, ttn_parse
+from ttn_client.timestamp import format_timestamp, ns_to_datetime
+
+THRESHOLDS = pathlib.Path(__file__).with_name("benchmark_thresholds.json")
+DEVICES = 50
+SEED = 1234
+START_NS = 1_720_000_000 * 1_000_000_000
+APPLICATION_ID = "benchmark"
+CHUNK_SIZE = 64 * 1024
+
+_Payload = tuple[dict | None, dict | None]
+
+
+def default_payload(rng: random.Random, index: int) -> _Payload:
+    """Cayenne LPP style payload of the default parser."""
+    return {
+        "analog_in_3": round(rng.uniform(0, 5), 2),
+        "digital_in_1": rng.randint(0, 1),
+        "humidity_2": round(rng.uniform(20, 90), 1),
+        "illuminance_44": rng.randint(0, 5000),
+        "temperature_1": round(rng.uniform(-10, 35), 1),
+        "accelerometer_77": {
+            "x": round(rng.uniform(-1, 1), 3),
+            "y": round(rng.uniform(-1, 1), 3),
+            "z": round(rng.uniform(-1, 1), 3),
+        },
+        "boolean_1": index % 2 == 0,
+        "raw": [rng.randint(0, 255) for _ in range(4)],
+    }, None
+
+
+def sensor_attr_payload(rng: random.Random, _index: int) -> _Payload:
+    """Payload annotated with nested _sensor_attr."""
+    return {
+        "BatV": round(rng.uniform(3, 3.6), 3),
+        "TempC_SHT": round(rng.uniform(-10, 35), 2),
+        "Hum_SHT": round(rng.uniform(20, 90), 1),
+        "_sensor_attr": {
+            "BatV": {"unit": "V", "device_class": "voltage"},
+            "TempC_SHT": {"unit": "°C", "device_class": "temperature"},
+            "Hum_SHT": {"unit": "%", "device_class": "humidity"},
+        },
+    }, None
+
+
+def gps_payload(rng: random.Random, _index: int) -> _Payload:
+    """Payload of a tracker."""
+    return {
+        "gps_1": {
+            "latitude": round(rng.uniform(48, 49), 6),
+            "longitude": round(rng.uniform(9, 10), 6),
+            "altitude": rng.randint(200, 600),
+        },
+        "battery": rng.randint(0, 100),
+    }, None
+
+
+def sensecap_payload(rng: random.Random, _index: int) -> _Payload:
+    """Payload of a SenseCAP S2120 weather station."""
+    measurements = (
+        ("4097", "Air Temperature", round(rng.uniform(-10, 35), 1)),
+        ("4098", "Air Humidity", rng.randint(20, 90)),
+        ("4099", "Light Intensity", rng.randint(0, 60000)),
+        ("4190", "UV Index", rng.randint(0, 10)),
+        ("4105", "Wind Speed", round(rng.uniform(0, 20), 1)),
+        ("4104", "Wind Direction Sensor", rng.randint(0, 359)),
+        ("4113", "Rain Gauge", round(rng.uniform(0, 5), 1)),
+        ("4101", "Barometric Pressure", rng.randint(95000, 105000)),
+    )
+    return {
+        "err": 0,
+        "messages": [
+            {"measurementId": measurement_id, "measurementValue": value, "type": name}
+            for measurement_id, name, value in measurements
+        ]
+        + [{"Battery(%)": rng.randint(0, 100)}],
+        "payload": "0100854D00000F4700001502007F0000000026EE0364",
+        "valid": True,
+    }, {
+        "brand_id": "sensecap",
+        "model_id": "sensecaps2120-8-in-1",
+        "hardware_version": "1.0",
+        "firmware_version": "1.0",
+        "band_id": "EU_863_870",
+    }
+
+
+def cayenne_lpp_payload(_rng: random.Random, _index: int) -> _Payload:
+    """Cayenne LPP frm_payload decoded by the client.
+
+    The uplinks of the ttn_parse stage keep the decoded_payload of the timed
+    run, so its peak memory does not include the decoding.
+    """
+    return None, None
+
+
+SCENARIOS: dict[str, Callable[[random.Random, int], _Payload]] = {
+    "default": default_payload,
+    "sensor_attr": sensor_attr_payload,
+    "gps": gps_payload,
+    "sensecap": sensecap_payload,
+    "cayenne_lpp": cayenne_lpp_payload,
+}
+
+
+def storage_entry(rng: random.Random, scenario: str, index: int) -> dict:
+    """Build a storage integration entry with realistic metadata."""
+    device_id = f"device-{index % DEVICES:03}"
+    received_at = format_timestamp(ns_to_datetime(START_NS + index * 1_000_000_000))
+    decoded_payload, version_ids = SCENARIOS[scenario](rng, index)
+    uplink_message = {
+        "session_key_id": "AYZ0Jxw3Ke0Nc+4mXQjyWg==",
+        "f_port": 1,
+        "f_cnt": index // DEVICES,
+        "frm_payload": "AWcA4gJoUAMCAUo=",
+        "rx_metadata": [
+            {
+                "gateway_ids": {"gateway_id": f"gateway-{gateway}", "eui": "0" * 16},
+                "time": received_at,
+                "timestamp": rng.randint(0, 2**32),
+                "rssi": rng.randint(-120, -40),
+                "channel_rssi": rng.randint(-120, -40),
+                "snr": round(rng.uniform(-10, 10), 1),
+                "location": {"latitude": 48.7, "longitude": 9.1, "source": "REGISTRY"},
+                "uplink_token": "ChIKEAoOZ2F0ZXdheS0wMDAxEOPRjAQ=",
+                "received_at": received_at,
+            }
+            for gateway in range(rng.randint(1, 3))
+        ],
+        "settings": {
+            "data_rate": {"lora": {"bandwidth": 125000, "spreading_factor": 7}},
+            "frequency": "868100000",
+        },
+        "received_at": received_at,
+        "consumed_airtime": "0.061696s",
+        "network_ids": {"net_id": "000013", "tenant_id": "ttn"},
+    }
+    if decoded_payload is not None:
+        uplink_message["decoded_payload"] = decoded_payload
+    if version_ids is not None:
+        uplink_message["version_ids"] = version_ids
+    return {
+        "result": {
+            "end_device_ids": {
+                "device_id": device_id,
+                "application_ids": {"application_id": APPLICATION_ID},
+                "dev_eui": f"{index % DEVICES:016X}",
+            },
+            "correlation_ids": [f"as:up:{index:026}"],
+            "received_at": received_at,
+            "uplink_message": uplink_message,
+        }
+    }
+
+
+def generate_lines(scenario: str, lines: int) -> list[bytes]:
+    """Generate the lines of a storage integration stream."""
+    rng = random.Random(SEED)
+    return [
+        json.dumps(storage_entry(rng, scenario, index)).encode() + b"\n\n"
+        for index in range(lines)
+    ]
+
+
+async def measure(run: Callable[[], Awaitable[int]]) -> dict[str, float]:
+    """Return the lines per second and peak memory of run."""
+    start = time.perf_counter()
+    lines = await run()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        await run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "lines_per_s": round(lines / elapsed),
+        "peak_kib": round(peak / 1024),
+    }
+
+
+async def serve(lines: list[bytes]) -> web.AppRunner:
+    """Start a local stand-in of the storage integration streaming lines."""
+
+    async def uplink_message(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse()
+        await response.prepare(request)
+        chunk = bytearray()
+        for line in lines:
+            chunk += line
+            if len(chunk) >= CHUNK_SIZE:
+                await response.write(bytes(chunk))
+                chunk.clear()
+        await response.write(bytes(chunk))
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get(
+        "/api/v3/as/applications/{app_id}/packages/storage/uplink_message",
+        uplink_message,
+    )
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+async def benchmark_scenario(scenario: str, line_count: int) -> dict[str, dict]:
+    """Benchmark every stage of a scenario."""
+    lines = generate_lines(scenario, line_count)
+    json_loads = default_loads()
+    entries = [json_loads(line)["result"] for line in lines]
+
+    def decode(loads: Callable[[bytes], dict]) -> Callable[[], Awaitable[int]]:
+        async def run() -> int:
+            for line in lines:
+                loads(line)
+            return len(lines)
+
+        return run
+
+    async def parse() -> int:
+        parsed = [ttn_parse(entry) for entry in entries]
+        for ttn_output in parsed:
+            for value in ttn_output.values():
+                _ = value.value
+        return len(parsed)
+
+    runner = await serve(lines)
+    port = runner.addresses[0][1]
+
+    async def stream() -> int:
+        async with ttn_client.TTNClient(
+            f"127.0.0.1:{port}", APPLICATION_ID, "NNSXS.benchmark"
+        ) as client:
+            count = 0
+            async for _ in client.iter_uplinks():
+                count += 1
+            return count
+
+    try:
+        return {
+            "json_loads": await measure(decode(json.loads)),
+            "default_loads": await measure(decode(json_loads)),
+            "ttn_parse": await measure(parse),
+            "stream": await measure(stream),
+        }
+    finally:
+        await runner.cleanup()
+
+
+def check(results: dict[str, dict[str, dict]], thresholds: dict) -> list[str]:
+    """Return the results beyond their regression thresholds."""
+    regressions = []
+    for scenario, stages in thresholds.items():
+        for stage, limits in stages.items():
+            result = results[scenario][stage]
+            if result["lines_per_s"] < limits["min_lines_per_s"]:
+                regressions.append(
+                    f"{scenario}/{stage}: {result['lines_per_s']} lines/s"
+                    f" < {limits['min_lines_per_s']}"
+                )
+            if result["peak_kib"] > limits["max_peak_kib"]:
+                regressions.append(
+                    f"{scenario}/{stage}: {result['peak_kib']} KiB"
+                    f" > {limits['max_peak_kib']}"
+                )
+    return regressions
+
+
+async def main() -> int:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=20000, help="lines per stream")
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--json", type=pathlib.Path, help="write the results")
+    parser.add_argument(
+        "--check", action="store_true", help="fail on regression thresholds"
+    )
+    args = parser.parse_args()
+
+    # The stand-in serves plain HTTP on localhost
+    ttn_client_module.TTN_DATA_STORAGE_URL = (
+        ttn_client_module.TTN_DATA_STORAGE_URL.replace("https://", "http://")
+    )
+    logging.basicConfig(level=logging.ERROR)
+    register_decoder(cayenne_lpp_decoder)
+
+    results = {}
+    for scenario in args.scenario or SCENARIOS:
+        results[scenario] = await benchmark_scenario(scenario, args.lines)
+        for stage, result in results[scenario].items():
+            print(
+                f"{scenario:12} {stage:13} {result['lines_per_s']:>10} lines/s"
+                f" {result['peak_kib']:>10} KiB peak"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    if args.check:
+        thresholds = json.loads(THRESHOLDS.read_text(encoding="utf-8"))
+        regressions = check(
+            results,
+            {
+                scenario: stages
+                for scenario, stages in thresholds.items()
+                if scenario in results
+            },
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
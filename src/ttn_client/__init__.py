@@ -1,5 +1,10 @@
 """Export public classes."""
 
 from .client import TTNClient  # noqa: F401
+from .diagnostics import TTNDiagnostics  # noqa: F401
+from .metrics import TTNMetrics  # noqa: F401
+from .poller import TTNPoller  # noqa: F401
+from .scheduler import TTNAdaptiveScheduler, TTNFixedScheduler  # noqa: F401
+from .state_store import TTNStateStore  # noqa: F401
 from .values import *  # noqa: F401,F403
 from .exceptions import *  # noqa: F401,F403
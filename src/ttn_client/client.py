@@ -1,118 +1,894 @@
 """Client for The Thinks Network."""
 
-from collections.abc import Awaitable, Callable
-from datetime import datetime
-import json
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    MutableSet,
+)
+from concurrent.futures import Executor
+from contextlib import AbstractAsyncContextManager, nullcontext
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
 import logging
+import time
+from typing import Any
 
 import aiohttp
-from aiohttp.hdrs import ACCEPT, AUTHORIZATION
+from aiohttp.hdrs import ACCEPT, AUTHORIZATION, RETRY_AFTER
 
-from .const import DEFAULT_TIMEOUT, TTN_DATA_STORAGE_URL
-from .values import TTNBaseValue
-from .exceptions import TTNAuthError
+from .const import (
+    BACKFILL_WINDOW,
+    DEFAULT_BACKFILL_CONCURRENCY,
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_TIMEOUT,
+    DIAGNOSTICS_LOG_INTERVAL,
+    DUPLICATE_HISTORY_SIZE,
+    MQTT_RECONNECT_MAX_DELAY,
+    MQTT_RECONNECT_MIN_DELAY,
+    RETRY_BACKOFF,
+    RETRY_MAX_DELAY,
+    TTN_DATA_STORAGE_URL,
+    TTN_DEVICE_DATA_STORAGE_URL,
+    TTN_MQTT_PORT,
+    TTN_MQTT_TENANT,
+    TTN_MQTT_UPLINK_TOPIC,
+)
+from .diagnostics import TTNDiagnostics
+from .values import TTNBaseValue, TTNValueSeries
+from .exceptions import (
+    TTNAuthError,
+    TTNConnectionError,
+    TTNRateLimitError,
+    TTNServerError,
+)
+from .json_decoder import JSONLoads, default_loads
+from .mqtt import MQTTTransport, aiomqtt_transport
+from .metrics import TTNMetrics
 from .parsers import ttn_parse
+from .state_store import TTNStateStore
+from .stream import RequestStats, StreamParser
+from .timestamp import format_timestamp, timestamp_ns
 
 _LOGGER = logging.getLogger(__name__)
 
 
-class TTNClient:  # pylint: disable=too-few-public-methods
-    """Client to connect to the Things Network."""
+class TTNClient:  # pylint: disable=too-many-instance-attributes
+    """Client to connect to the Things Network.
+
+    The client keeps one connection-pooled aiohttp session for all its requests so
+    that periodic polls reuse keep-alive connections. A session can also be injected
+    to share a single bounded connector across many clients - in that case the
+    caller remains responsible for closing it.
+
+    Parsed values keep a reference to the raw uplink unless retain_uplink is
+    False, which saves memory when the latest values of many devices are cached.
+
+    Rate limiting, server errors and dropped connections are retried up to
+    max_retries times with exponential backoff (honouring Retry-After - waits
+    longer than RETRY_MAX_DELAY raise TTNRateLimitError at once). An
+    interrupted stream resumes after the last uplink processed.
+
+    JSON is decoded with orjson or msgspec when installed. Another decoder for the
+    storage integration entries can be given with json_loads - e.g.
+    json_decoder.storage_entry_loads() to decode only the fields used by the
+    parsers.
+
+    Decoding and parsing of the storage integration entries run on the event loop
+    unless an executor is given: lines are then handed to it in batches, so big
+    backfills use several cores while the event loop stays responsive. With a
+    ProcessPoolExecutor json_loads must be picklable and custom parsers and
+    payload decoders must be registered when their module is imported.
+
+    The storage integration requests can be narrowed on the server side: only
+    the given device_ids are fetched (one request per device), field_mask
+    selects the uplink fields returned (const.TTN_DECODED_FIELD_MASK has the
+    ones used by the parsers) and limit caps the uplinks of each request - the
+    next fetch continues after the last one, or after the last one of the
+    device furthest behind when devices are fetched separately.
+
+    When a push_callback is given, run_push subscribes to the uplinks of the
+    application over MQTT and forwards them as they arrive.
+
+    Incremental fetches start after the newest received_at processed so far and
+    uplinks already processed are dropped, so each uplink is parsed only once.
+    Both only move once a fetch completes: the uplinks of a fetch which failed
+    midway are fetched again.
+    Uplinks pushed over MQTT are dropped from later fetches but do not move
+    where they start.
+    With a state_store the cursor and latest values survive restarts: the first
+    fetch_data returns the stored values and only fetches what is newer.
+
+    With changes_only, fetch_data and push_callback only get the fields whose
+    value differs from the last one they returned for the same device, so
+    consumers do not need to diff the whole state. iter_uplinks, fetch_series
+    and backfill still yield every value.
+
+    Each storage integration request is made within the context manager
+    returned by request_limiter, e.g. to bound the concurrent requests of many
+    clients. Retry delays are waited outside of it.
+
+    A TTNMetrics given as metrics is told the latency, size, decode and parse
+    time, skipped entries and retries of every storage integration request.
+
+    Uplinks and fields rejected by the parsers are counted per device and
+    reason in diagnostics. Their warnings are rate limited and each fetch logs
+    a summary of its rejects, as a warning at most once every
+    DIAGNOSTICS_LOG_INTERVAL and at debug level otherwise.
+    """
 
     DATA_TYPE = dict[str, dict[str, TTNBaseValue]]
+    SERIES_TYPE = dict[str, dict[str, TTNValueSeries]]
 
-    def __init__(  # pylint: disable=too-many-arguments
+    def __init__(  # pylint: disable=too-many-arguments,too-many-locals
         self,
         hostname: str,
         application_id: str,
         access_key: str,
         first_fetch_h: int = 24,
         push_callback: Callable[[DATA_TYPE], Awaitable[None]] | None = None,
+        *,
+        session: aiohttp.ClientSession | None = None,
+        mqtt_username: str | None = None,
+        mqtt_transport: MQTTTransport = aiomqtt_transport,
+        retain_uplink: bool = True,
+        json_loads: JSONLoads | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        executor: Executor | None = None,
+        device_ids: Collection[str] | None = None,
+        field_mask: Collection[str] | None = None,
+        limit: int | None = None,
+        state_store: TTNStateStore | None = None,
+        changes_only: bool = False,
+        metrics: TTNMetrics | None = None,
+        request_limiter: Callable[[], AbstractAsyncContextManager] | None = None,
     ) -> None:
         self.__hostname = hostname
         self.__application_id = application_id
         self.__access_key = access_key
         self.__first_fetch_h = first_fetch_h
-        self.__push_callback = push_callback  # TBD: add support for MQTT to get faster updates # pylint: disable=W0238
+        self.__push_callback = push_callback
+        self.__mqtt_username = mqtt_username or f"{application_id}@{TTN_MQTT_TENANT}"
+        self.__mqtt_transport = mqtt_transport
+        self.__retain_uplink = retain_uplink
+        self.__mqtt_json_loads = default_loads()
+        self.__max_retries = max_retries
+        self.__device_ids = tuple(device_ids) if device_ids else None
+        self.__field_mask = ",".join(field_mask) if field_mask else None
+        self.__limit = limit
+        self.__state_store = state_store
+        self.__state_restored = False
+        self.__changes_only = changes_only
+        self.__metrics = metrics
+        self.__request_limiter = request_limiter or nullcontext
+        self.__diagnostics = TTNDiagnostics()
+        self.__next_summary_log = 0.0
+        self.__stream_parser = StreamParser(
+            application_id,
+            json_loads or self.__mqtt_json_loads,
+            retain_uplink=retain_uplink,
+            executor=executor,
+            diagnostics=self.__diagnostics,
+            metrics=metrics,
+        )
+        # Last value returned for each (device_id, field_id) in changes_only mode
+        self.__last_values: dict[tuple[str, str], tuple[bool, Any]] = {}
+
+        self.__session = session
+        self.__owns_session = session is None
 
         self.__last_measurement_datetime: datetime | None = None
+        # Newest received_at processed and the identities of recent uplinks
+        self.__cursor: str | None = None
+        self.__cursor_ns = 0
+        self.__processed: OrderedDict[tuple[str, str], None] = OrderedDict()
+        # fetch_data in flight, shared by concurrent callers
+        self.__fetch: _SharedFetch | None = None
+        # Values of a fetch whose callers were all cancelled
+        self.__undelivered: TTNClient.DATA_TYPE = {}
+        # Values of the state store until returned by fetch_data
+        self.__restored: TTNClient.DATA_TYPE = {}
+
+    @property
+    def hostname(self) -> str:
+        """hostname of the TTN cluster."""
+        return self.__hostname
+
+    @property
+    def application_id(self) -> str:
+        """application_id fetched by this client."""
+        return self.__application_id
+
+    @property
+    def diagnostics(self) -> TTNDiagnostics:
+        """counters of the uplinks and fields rejected by the parsers."""
+        return self.__diagnostics
+
+    async def __aenter__(self) -> "TTNClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the HTTP session if it was created by this client."""
+        if self.__owns_session and self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        """Return the session, creating a pooled one on first use."""
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(
+                timeout=DEFAULT_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit=DEFAULT_CONNECTION_LIMIT),
+            )
+        return self.__session
 
     async def fetch_data(self) -> DATA_TYPE:
-        """Fetch data stored by the TTN Storage since the last time we fetched/received data."""
+        """Fetch data stored by the TTN Storage since the last time we fetched/received data.
+
+        Concurrent calls share one in-flight fetch and get the same result, so the
+        cursor is only advanced by one of them. Cancelling a caller does not cancel
+        the shared fetch: if all its callers were cancelled (e.g. timed out), its
+        values are returned by the next call.
+        """
+
+        if self.__fetch is None:
+            self.__fetch = _SharedFetch(asyncio.create_task(self.__fetch_data()))
+            self.__fetch.task.add_done_callback(self.__fetch_done)
+        fetch = self.__fetch
+        fetch.waiters += 1
+        try:
+            ttn_values = await asyncio.shield(fetch.task)
+            fetch.delivered = True
+            return ttn_values
+        finally:
+            fetch.waiters -= 1
+            self.__keep_undelivered(fetch)
+
+    def __fetch_done(self, _task: asyncio.Task) -> None:
+        """Let the next fetch_data start a new fetch."""
+        fetch, self.__fetch = self.__fetch, None
+        assert fetch is not None
+        self.__keep_undelivered(fetch)
+
+    def __keep_undelivered(self, fetch: "_SharedFetch") -> None:
+        """Keep the values (or retrieve the error) of a fetch no caller received."""
+        task = fetch.task
+        if fetch.waiters or fetch.delivered or not task.done() or task.cancelled():
+            return
+        fetch.delivered = True
+        if task.exception() is None:
+            self.__undelivered = task.result()
+
+    async def __fetch_data(self) -> DATA_TYPE:
+        """Fetch the data of fetch_data."""
+
+        ttn_values: TTNClient.DATA_TYPE = {}
+        async for device_id, ttn_output in self.iter_uplinks():
+            if device_id in ttn_values:
+                ttn_values[device_id] |= ttn_output
+            else:
+                ttn_values[device_id] = ttn_output
+        # Values restored from the state store, even by iter_uplinks
+        restored, self.__restored = self.__restored, {}
+        ttn_values = _merge_values(restored, ttn_values)
+        if self.__changes_only:
+            ttn_values = self.__changed_values(ttn_values)
+        # Older values not received by the callers of a cancelled fetch
+        undelivered, self.__undelivered = self.__undelivered, {}
+        return _merge_values(undelivered, ttn_values)
+
+    def __changed_values(self, ttn_values: DATA_TYPE) -> DATA_TYPE:
+        """Return the values which changed since they were last returned."""
+
+        changed: TTNClient.DATA_TYPE = {}
+        for device_id, device_values in ttn_values.items():
+            for field_id, ttn_value in device_values.items():
+                # Numbers often alternate between int and float but True == 1
+                value = ttn_value.value
+                last_value = (isinstance(value, bool), value)
+                if self.__last_values.get((device_id, field_id)) == last_value:
+                    continue
+                self.__last_values[(device_id, field_id)] = last_value
+                changed.setdefault(device_id, {})[field_id] = ttn_value
+        return changed
+
+    async def fetch_series(self) -> SERIES_TYPE:
+        """Fetch data like fetch_data but keep every sample instead of the last one.
 
+        Useful for backfills: each field of each device is returned as a
+        TTNValueSeries holding all samples in received_at order. Uplinks without
+        received_at have no place in a series and are skipped.
+        """
+
+        ttn_series: TTNClient.SERIES_TYPE = {}
+        async for device_id, ttn_output in self.iter_uplinks():
+            received_at_ns = _received_at_ns(ttn_output)
+            if received_at_ns is None:
+                continue
+            device_series = ttn_series.setdefault(device_id, {})
+            for field_id, ttn_value in ttn_output.items():
+                if field_id not in device_series:
+                    device_series[field_id] = TTNValueSeries(device_id, field_id)
+                device_series[field_id].append(received_at_ns, ttn_value.value)
+        return ttn_series
+
+    async def iter_uplinks(
+        self,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Yield the values of each uplink stored since the last fetch as it arrives.
+
+        Same as fetch_data but each uplink is yielded while the download is still
+        running instead of merging all of them in one dictionary. The cursor only
+        moves once the iteration completes: the uplinks of a failed or interrupted
+        iteration are fetched again by the next one.
+        """
+
+        await self.__restore_state()
         now = datetime.now()
+        params = self.__fetch_params(now)
+        floor_ns = self.__cursor_ns
+        # Uplinks processed by this fetch, committed once it completes
+        processed: dict[tuple[str, str], int] = {}
+        # Entries returned and last received_at of each device with a limit
+        returned: dict[str, tuple[int, str | None]] = {}
+        count_returned = self.__limit is not None and self.__device_ids is not None
+
+        def accept(application_up: dict) -> bool:
+            if count_returned:
+                device_id = application_up["end_device_ids"]["device_id"]
+                count, last = returned.get(device_id, (0, None))
+                returned[device_id] = (
+                    count + 1,
+                    application_up.get("received_at", last),
+                )
+            return self.__is_new_uplink(application_up, floor_ns, processed)
+
+        latest: TTNClient.DATA_TYPE = {}
+        async for device_id, ttn_output in self.__storage_api_fetch(params, accept):
+            if self.__state_store is not None:
+                latest.setdefault(device_id, {}).update(ttn_output)
+            yield device_id, ttn_output
+
+        cursor, cursor_ns = self.__next_cursor(
+            processed, returned if count_returned else None
+        )
+
+        if self.__state_store is not None:
+            await self.__save_state(latest, cursor)
+        self.__last_measurement_datetime = now
+        self.__record_processed(processed)
+        self.__cursor, self.__cursor_ns = cursor, cursor_ns
+
+        self.__log_fetch_summary()
+
+    def __log_fetch_summary(self) -> None:
+        """Log the rejects of the fetch, as a warning at most once per interval."""
 
-        if not self.__last_measurement_datetime:
+        summary = self.__diagnostics.fetch_summary()
+        if summary:
+            level = logging.DEBUG
+            monotonic = time.monotonic()
+            if monotonic >= self.__next_summary_log:
+                level = logging.WARNING
+                self.__next_summary_log = monotonic + DIAGNOSTICS_LOG_INTERVAL
+            _LOGGER.log(
+                level,
+                "Uplinks of %s rejected while parsing: %s",
+                self.__application_id,
+                ", ".join(
+                    f"{reason} {rejects}x ({devices} devices)"
+                    for reason, (rejects, devices) in summary.items()
+                ),
+            )
+
+    def __fetch_params(self, now: datetime) -> dict[str, str]:
+        """Return the query parameters of the next incremental fetch."""
+
+        params: dict[str, str]
+        if self.__cursor:
+            # Continue after the newest uplink processed so far
+            params = {"after": self.__cursor, "order": "received_at"}
+            _LOGGER.info("Fetch of ttn data after: %s", self.__cursor)
+        elif not self.__last_measurement_datetime:
             fetch_last = f"{self.__first_fetch_h}h"
+            params = {"last": fetch_last, "order": "received_at"}
             _LOGGER.info("First fetch of tth data: %s", fetch_last)
         else:
-            # Fetch new measurements since last time (with an extra minute margin)
+            # No uplink received yet: fetch new measurements since last time
+            # (with an extra minute margin)
             delta = now - self.__last_measurement_datetime
             delta_s = delta.total_seconds() + 60
             fetch_last = f"{delta_s}s"
+            params = {"last": fetch_last, "order": "received_at"}
             _LOGGER.info("Fetch of ttn data: %s", fetch_last)
-        self.__last_measurement_datetime = now
 
         # Discover entities
         # See API docs
         # at https://www.thethingsindustries.com/docs/reference/api/storage_integration/
-        return await self.__storage_api_call(f"?last={fetch_last}&order=received_at")
+        if self.__limit is not None:
+            params["limit"] = str(self.__limit)
+        return params
+
+    def __next_cursor(
+        self,
+        processed: dict[tuple[str, str], int],
+        returned: dict[str, tuple[int, str | None]] | None,
+    ) -> tuple[str | None, int]:
+        """Return the cursor after the newest uplink processed by a fetch.
+
+        With returned (the entries and last received_at of each device), the
+        cursor is moved back to the oldest device cut by the limit: it is shared
+        by the requests of all devices, so the uplinks of a device which reached
+        the limit earlier would be skipped otherwise. Uplinks fetched again are
+        dropped by the duplicate history.
+        """
+
+        cursor, cursor_ns = self.__cursor, self.__cursor_ns
+        for (_, received_at), received_at_ns in processed.items():
+            if received_at_ns > cursor_ns:
+                cursor, cursor_ns = received_at, received_at_ns
+        if returned is None:
+            return cursor, cursor_ns
+
+        assert self.__limit is not None
+        for count, last in returned.values():
+            if count < self.__limit or last is None:
+                continue
+            last_ns = timestamp_ns(last)
+            if last_ns < cursor_ns:
+                cursor, cursor_ns = last, last_ns
+        return cursor, cursor_ns
+
+    async def __restore_state(self) -> None:
+        """Load the cursor and the values kept for fetch_data from the state store.
+
+        Only done once.
+        """
+
+        if self.__state_store is None or self.__state_restored:
+            return
+        self.__state_restored = True
+
+        cursor, ttn_values = await asyncio.to_thread(
+            self.__state_store.load, self.__hostname, self.__application_id
+        )
+        if cursor is not None and self.__cursor is None:
+            _LOGGER.info("Restored ttn data cursor: %s", cursor)
+            self.__cursor = cursor
+            self.__cursor_ns = timestamp_ns(cursor)
+        self.__restored = ttn_values
+
+    async def __save_state(self, ttn_values: DATA_TYPE, cursor: str | None) -> None:
+        """Store the cursor and the given values in the state store."""
+
+        assert self.__state_store is not None
+        await asyncio.to_thread(
+            self.__state_store.save,
+            self.__hostname,
+            self.__application_id,
+            cursor,
+            ttn_values,
+        )
+
+    async def backfill(
+        self,
+        start: datetime,
+        end: datetime | None = None,
+        *,
+        window: timedelta = BACKFILL_WINDOW,
+        max_concurrency: int = DEFAULT_BACKFILL_CONCURRENCY,
+        checkpoint: MutableSet[tuple[datetime, datetime]] | None = None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Yield the values of each uplink stored between start and end (now).
+
+        The range is split in windows which are downloaded concurrently, up to
+        max_concurrency at a time, and yielded in received_at order. The bounds of
+        each window yielded completely are added to checkpoint: windows already in
+        it are skipped, so an interrupted backfill resumes where it stopped when
+        called again with the same start, window and checkpoint.
+
+        The backfill is independent of the fetch_data cursor.
+        """
+
+        if end is None:
+            end = datetime.now(start.tzinfo)
+        windows: deque[tuple[datetime, datetime]] = deque()
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            if checkpoint is None or (window_start, window_end) not in checkpoint:
+                windows.append((window_start, window_end))
+            window_start = window_end
+
+        pending: deque[
+            tuple[
+                tuple[datetime, datetime],
+                asyncio.Task[list[tuple[str, dict[str, TTNBaseValue]]]],
+            ]
+        ] = deque()
+        try:
+            while windows or pending:
+                # Keep max_concurrency windows downloading while yielding
+                while windows and len(pending) < max_concurrency:
+                    bounds = windows.popleft()
+                    pending.append(
+                        (bounds, asyncio.create_task(self.__fetch_window(*bounds)))
+                    )
+                bounds, task = pending.popleft()
+                for uplink in await task:
+                    yield uplink
+                if checkpoint is not None:
+                    checkpoint.add(bounds)
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def __fetch_window(
+        self, start: datetime, end: datetime
+    ) -> list[tuple[str, dict[str, TTNBaseValue]]]:
+        """Return the values of the uplinks received in [start, end)."""
 
-    async def __storage_api_call(self, options) -> DATA_TYPE:
-        url = TTN_DATA_STORAGE_URL.format(
-            app_id=self.__application_id, hostname=self.__hostname, options=options
+        params = {
+            "after": format_timestamp(start),
+            "before": format_timestamp(end),
+            "order": "received_at",
+        }
+        _LOGGER.info("Backfill of ttn data: %s - %s", params["after"], params["before"])
+        accept = _window_filter(
+            timestamp_ns(params["after"]), timestamp_ns(params["before"])
         )
+        uplinks = [uplink async for uplink in self.__storage_api_fetch(params, accept)]
+        if self.__device_ids is not None and len(self.__device_ids) > 1:
+            # Merge the uplinks of the devices, requested one after the other
+            # (uplinks without received_at first)
+            uplinks.sort(key=lambda uplink: _received_at_ns(uplink[1]) or 0)
+        return uplinks
+
+    def __is_new_uplink(
+        self,
+        application_up: dict,
+        floor_ns: int,
+        processed: dict[tuple[str, str], int],
+    ) -> bool:
+        """Add the uplink to processed and return False if already processed.
+
+        Uplinks older than floor_ns were covered by a previous fetch. processed
+        maps the identities of the uplinks of a fetch to their received_at
+        nanoseconds until they are recorded in the duplicate history.
+        """
+
+        received_at = application_up.get("received_at")
+        if received_at is None:
+            return True
+        received_at_ns = timestamp_ns(received_at)
+        if received_at_ns < floor_ns:
+            return False
+
+        identity = (application_up["end_device_ids"]["device_id"], received_at)
+        if identity in self.__processed or identity in processed:
+            return False
+        processed[identity] = received_at_ns
+        return True
+
+    def __record_processed(self, processed: dict[tuple[str, str], int]) -> None:
+        """Add the identities of processed uplinks to the duplicate history."""
+
+        for identity in processed:
+            self.__processed[identity] = None
+        while len(self.__processed) > DUPLICATE_HISTORY_SIZE:
+            self.__processed.popitem(last=False)
+
+    async def run_push(self) -> None:
+        """Receive uplinks over MQTT and forward them to push_callback until cancelled.
+
+        The connection is re-established with exponential backoff when it is lost.
+        Messages which fail to decode or parse are counted in diagnostics and
+        skipped.
+        """
+
+        if self.__push_callback is None:
+            raise ValueError("push_callback is required for push mode")
+
+        topic = TTN_MQTT_UPLINK_TOPIC.format(username=self.__mqtt_username)
+        delay = MQTT_RECONNECT_MIN_DELAY
+        while True:
+            try:
+                async for payload in self.__mqtt_transport(
+                    self.__hostname,
+                    TTN_MQTT_PORT,
+                    self.__mqtt_username,
+                    self.__access_key,
+                    topic,
+                ):
+                    # Connection is healthy again
+                    delay = MQTT_RECONNECT_MIN_DELAY
+                    await self.__push_uplink(payload)
+                _LOGGER.warning("MQTT connection closed")
+            except TTNConnectionError as err:
+                _LOGGER.warning("MQTT connection lost: %s", err)
+
+            _LOGGER.info("Reconnecting to MQTT in %ss", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MQTT_RECONNECT_MAX_DELAY)
+
+    async def __push_uplink(self, payload: bytes) -> None:
+        """Parse an uplink received over MQTT and forward it to push_callback."""
+
+        try:
+            uplink = self.__parse_push_payload(payload)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # A malformed message must not end push mode
+            self.__diagnostics.report(
+                _LOGGER,
+                None,
+                "invalid_message",
+                "Ignoring MQTT message which failed to parse (%r): %s",
+                err,
+                payload,
+            )
+            return
+        if uplink is None:
+            return
+        device_id, ttn_output = uplink
+
+        if self.__state_store is not None:
+            await self.__save_state({device_id: ttn_output}, self.__cursor)
+
+        ttn_values = {device_id: ttn_output}
+        if self.__changes_only:
+            ttn_values = self.__changed_values(ttn_values)
+            if not ttn_values:
+                return
+
+        assert self.__push_callback is not None
+        await self.__push_callback(ttn_values)
+
+    def __parse_push_payload(
+        self, payload: bytes
+    ) -> tuple[str, dict[str, TTNBaseValue]] | None:
+        """Return the device_id and values of an MQTT uplink, None if skipped."""
+
+        application_up = self.__mqtt_json_loads(payload)
+        if "uplink_message" not in application_up:
+            _LOGGER.debug("Ignoring MQTT message without uplink: %s", application_up)
+            return None
+
+        # Pushed uplinks only go to the duplicate history: advancing the cursor
+        # would skip the first fetch and the uplinks stored while MQTT was
+        # disconnected
+        processed: dict[tuple[str, str], int] = {}
+        if not self.__is_new_uplink(application_up, 0, processed):
+            return None
+        self.__record_processed(processed)
+
+        device_id = application_up["end_device_ids"]["device_id"]
+        with self.__diagnostics:
+            ttn_output = ttn_parse(application_up, self.__retain_uplink)
+        if not ttn_output:
+            return None
+        return device_id, ttn_output
+
+    async def __storage_api_fetch(
+        self, params: dict[str, str], accept: Callable[[dict], bool]
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Stream the uplinks of the application or of each selected device."""
+
+        if self.__field_mask is not None:
+            params = params | {"field_mask": self.__field_mask}
+        for device_id in self.__device_ids or (None,):
+            async for uplink in self.__storage_api_stream(params, accept, device_id):
+                yield uplink
+
+    async def __storage_api_stream(
+        self,
+        params: dict[str, str],
+        accept: Callable[[dict], bool],
+        device_id: str | None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Stream the uplinks of a storage integration request, retrying failures.
+
+        Only the uplinks for which accept returns True are parsed.
+        """
+
+        resume_after: str | None = None
+
+        def accept_and_track(application_up: dict) -> bool:
+            nonlocal resume_after
+            if not accept(application_up):
+                return False
+            resume_after = application_up.get("received_at", resume_after)
+            return True
+
+        attempt = 0
+        while True:
+            try:
+                async for uplink in self.__storage_api_call(
+                    params, accept_and_track, device_id
+                ):
+                    yield uplink
+                return
+            except (
+                TTNRateLimitError,
+                TTNServerError,
+                aiohttp.ClientPayloadError,
+                aiohttp.ClientConnectionError,
+                TimeoutError,
+            ) as err:
+                if (
+                    isinstance(err, TTNServerError) and err.status < 500
+                ) or attempt >= self.__max_retries:
+                    if isinstance(err, (TTNRateLimitError, TTNServerError)):
+                        raise
+                    raise TTNConnectionError(str(err)) from err
+
+                delay = min(RETRY_BACKOFF * 2**attempt, RETRY_MAX_DELAY)
+                if isinstance(err, TTNRateLimitError) and err.retry_after is not None:
+                    if err.retry_after > RETRY_MAX_DELAY:
+                        # Do not stall fetch_data and every caller sharing it
+                        raise
+                    delay = err.retry_after
+                attempt += 1
+                if self.__metrics is not None:
+                    self.__metrics.retried(
+                        self.__application_id, _retry_reason(err), delay
+                    )
+                _LOGGER.warning(
+                    "Storage request failed (%s) - retry %d in %ss", err, attempt, delay
+                )
+                await asyncio.sleep(delay)
+
+                if resume_after is not None:
+                    # Resume after the last uplink processed
+                    params = {"after": resume_after} | {
+                        key: value
+                        for key, value in params.items()
+                        if key not in ("after", "last")
+                    }
+
+    async def __storage_api_call(
+        self,
+        params: dict[str, str],
+        accept: Callable[[dict], bool],
+        device_id: str | None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        options = "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        if device_id is None:
+            url = TTN_DATA_STORAGE_URL.format(
+                app_id=self.__application_id, hostname=self.__hostname, options=options
+            )
+        else:
+            url = TTN_DEVICE_DATA_STORAGE_URL.format(
+                app_id=self.__application_id,
+                hostname=self.__hostname,
+                device_id=device_id,
+                options=options,
+            )
         _LOGGER.debug("URL: %s", url)
         headers = {
             ACCEPT: "text/event-stream",
             AUTHORIZATION: f"Bearer {self.__access_key}",
         }
 
-        async with (
-            aiohttp.ClientSession(timeout=DEFAULT_TIMEOUT) as session,
-            session.get(
+        async with self.__request_limiter():
+            start = time.perf_counter()
+            async with self.__get_session().get(
                 url, allow_redirects=False, timeout=DEFAULT_TIMEOUT, headers=headers
-            ) as response,
-        ):
-            if response.status in range(400, 500):
-                # LOGGER.error("Not authorized for Application ID: %s", self.__application_id)
-                raise TTNAuthError
-
-            if response.status not in range(200, 300):
-                raise RuntimeError(
-                    f"expected 200 got {response.status} - {response.reason}",
-                )
+            ) as response:
+                if self.__metrics is not None:
+                    self.__metrics.request(
+                        self.__application_id,
+                        response.status,
+                        time.perf_counter() - start,
+                    )
 
-            ttn_values: TTNClient.DATA_TYPE = {}
-            async for application_up_raw in response.content:
-                # Skip empty lines not containing a result
-                if len(application_up_raw) < len("result"):
-                    continue
+                if response.status == 429:
+                    raise TTNRateLimitError(
+                        _parse_retry_after(response.headers.get(RETRY_AFTER))
+                    )
 
-                _LOGGER.debug("TTN entry: %s", application_up_raw)
+                if response.status in range(400, 500):
+                    # LOGGER.error("Not authorized for Application ID: %s", self.__application_id)
+                    raise TTNAuthError
 
-                # Parse line with json dictionary
-                application_up_json = json.loads(application_up_raw)
+                if response.status not in range(200, 300):
+                    raise TTNServerError(response.status, response.reason)
 
-                if "result" not in application_up_json:
-                    _LOGGER.error("TTN entry without result: %s", application_up_json)
-                    continue
+                stats = RequestStats(start) if self.__metrics is not None else None
+                try:
+                    async for uplink in self.__stream_parser.parse(
+                        response.content, accept, stats
+                    ):
+                        yield uplink
+                finally:
+                    if stats is not None:
+                        assert self.__metrics is not None
+                        stats.report(
+                            self.__metrics,
+                            self.__application_id,
+                            time.perf_counter() - start,
+                        )
 
-                application_up = application_up_json["result"]
 
-                # Get device_id and uplink_message from measurement
-                device_id = application_up["end_device_ids"]["device_id"]
+class _SharedFetch:  # pylint: disable=too-few-public-methods
+    """A fetch_data in flight and the callers waiting for its values."""
 
-                ttn_output = ttn_parse(application_up)
+    __slots__ = ("task", "waiters", "delivered")
 
-                if ttn_output == {}:
-                    continue
+    def __init__(self, task: asyncio.Task[TTNClient.DATA_TYPE]) -> None:
+        self.task = task
+        self.waiters = 0
+        self.delivered = False
+
+
+def _window_filter(start_ns: int, end_ns: int) -> Callable[[dict], bool]:
+    """Return a filter of the uplinks received in [start_ns, end_ns) not seen yet."""
+
+    seen: set[tuple[str, str]] = set()
+
+    def accept(application_up: dict) -> bool:
+        received_at = application_up.get("received_at")
+        if received_at is None:
+            return True
+        if not start_ns <= timestamp_ns(received_at) < end_ns:
+            return False
+        identity = (application_up["end_device_ids"]["device_id"], received_at)
+        if identity in seen:
+            return False
+        seen.add(identity)
+        return True
+
+    return accept
+
+
+def _merge_values(
+    older: TTNClient.DATA_TYPE, newer: TTNClient.DATA_TYPE
+) -> TTNClient.DATA_TYPE:
+    """Update the values of each device in older with newer and return older."""
+    for device_id, device_values in newer.items():
+        if device_id in older:
+            older[device_id] |= device_values
+        else:
+            older[device_id] = device_values
+    return older
+
+
+def _received_at_ns(ttn_output: dict[str, TTNBaseValue]) -> int | None:
+    """Return the received_at shared by the values of an uplink, None if missing."""
+    # Only one of the values is built
+    metadata = ttn_output[next(iter(ttn_output))].metadata
+    try:
+        return metadata.received_at_ns
+    except KeyError:
+        return None
+
+
+def _retry_reason(err: Exception) -> str:
+    """Return the reason reported to TTNMetrics for a retried error."""
+    if isinstance(err, TTNRateLimitError):
+        return "rate_limit"
+    if isinstance(err, TTNServerError):
+        return "server_error"
+    return "connection"
 
-                _LOGGER.debug("TTN parsed values: %s", ttn_output)
 
-                if device_id in ttn_values:
-                    ttn_values[device_id] |= ttn_output
-                else:
-                    ttn_values[device_id] = ttn_output
+def _parse_retry_after(retry_after: str | None) -> float | None:
+    """Return the seconds to wait from a Retry-After header."""
 
-        return ttn_values
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0)
@@ -1,12 +1,47 @@
 """The Things Network's client constants."""
 
+from datetime import timedelta
 from typing import Final
 
 from aiohttp import ClientTimeout
 
-
+BACKFILL_WINDOW: Final[timedelta] = timedelta(hours=6)
+DEFAULT_BACKFILL_CONCURRENCY: Final[int] = 4
 DEFAULT_TIMEOUT: Final[ClientTimeout] = ClientTimeout(total=10 * 60)
+DEFAULT_CONNECTION_LIMIT: Final[int] = 10
+DEFAULT_HOST_CONCURRENCY: Final[int] = 4
+DEFAULT_POLL_INTERVAL: Final[float] = 60
+DEFAULT_POLL_JITTER: Final[float] = 0.1
+DEFAULT_MAX_RETRIES: Final[int] = 3
+DIAGNOSTICS_LOG_DEVICES: Final[int] = 10
+DIAGNOSTICS_LOG_INTERVAL: Final[float] = 5 * 60
+DUPLICATE_HISTORY_SIZE: Final[int] = 1024
+EXECUTOR_BATCH_SIZE: Final[int] = 256
+EXECUTOR_PENDING_BATCHES: Final[int] = 4
+RETRY_BACKOFF: Final[float] = 1
+RETRY_MAX_DELAY: Final[float] = 5 * 60
+SCHEDULER_GRACE: Final[float] = 15
+SCHEDULER_MAX_INTERVAL: Final[float] = 60 * 60
+SCHEDULER_MIN_INTERVAL: Final[float] = 10
+SCHEDULER_SMOOTHING: Final[float] = 0.3
 TTN_DATA_STORAGE_URL = (
     "https://{hostname}/api/v3/as/applications/"
     "{app_id}/packages/storage/uplink_message{options}"
 )
+TTN_DEVICE_DATA_STORAGE_URL = (
+    "https://{hostname}/api/v3/as/applications/"
+    "{app_id}/devices/{device_id}/packages/storage/uplink_message{options}"
+)
+# Fields of the uplinks used by the parsers - skips rx_metadata and others
+TTN_DECODED_FIELD_MASK: Final[tuple[str, ...]] = (
+    "up.uplink_message.decoded_payload",
+    "up.uplink_message.f_port",
+    "up.uplink_message.frm_payload",
+    "up.uplink_message.version_ids",
+)
+
+TTN_MQTT_PORT: Final[int] = 8883
+TTN_MQTT_TENANT: Final[str] = "ttn"
+TTN_MQTT_UPLINK_TOPIC = "v3/{username}/devices/+/up"
+MQTT_RECONNECT_MIN_DELAY: Final[float] = 1
+MQTT_RECONNECT_MAX_DELAY: Final[float] = 5 * 60
@@ -0,0 +1,179 @@
+"""Diagnostics of the parsers for The Thinks Network client."""
+
+from contextvars import ContextVar, Token
+import functools
+import logging
+import time
+
+from .const import DIAGNOSTICS_LOG_DEVICES, DIAGNOSTICS_LOG_INTERVAL
+
+_DiagnosticsKey = tuple[str | None, str]
+
+
+class TTNDiagnostics:  # pylint: disable=too-many-instance-attributes
+    """Counters of the uplinks and fields rejected while parsing.
+
+    Each reject is counted per device_id and reason in O(1). Its message is
+    logged the first time and then at most once every log_interval seconds per
+    device and reason, with the number of similar messages suppressed
+    meanwhile. At most log_devices devices are logged per reason and interval,
+    so a misconfigured fleet does not flood the logs however large it is.
+    Messages are only formatted when logged.
+
+    Every TTNClient has its own TTNDiagnostics (TTNClient.diagnostics) which is
+    active while it parses: parsers report to the active one with report().
+    """
+
+    __slots__ = (
+        "__log_interval",
+        "__log_devices",
+        "__defer_logs",
+        "__counts",
+        "__fetch_counts",
+        "__next_log",
+        "__reason_logs",
+        "__suppressed",
+        "__samples",
+        "__tokens",
+    )
+
+    def __init__(
+        self,
+        log_interval: float = DIAGNOSTICS_LOG_INTERVAL,
+        defer_logs: bool = False,
+        log_devices: int = DIAGNOSTICS_LOG_DEVICES,
+    ) -> None:
+        self.__log_interval = log_interval
+        self.__log_devices = log_devices
+        # Executor batches keep a sample of each message for the client to log
+        self.__defer_logs = defer_logs
+        self.__counts: dict[_DiagnosticsKey, int] = {}
+        self.__fetch_counts: dict[_DiagnosticsKey, int] = {}
+        self.__next_log: dict[_DiagnosticsKey, float] = {}
+        # End of the current interval and devices logged in it per reason
+        self.__reason_logs: dict[str, tuple[float, int]] = {}
+        self.__suppressed: dict[_DiagnosticsKey, int] = {}
+        self.__samples: dict[
+            _DiagnosticsKey, tuple[logging.Logger, int, str, tuple, int]
+        ] = {}
+        self.__tokens: list[Token] = []
+
+    def __enter__(self) -> "TTNDiagnostics":
+        self.__tokens.append(_active.set(self))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _active.reset(self.__tokens.pop())
+
+    @property
+    def counts(self) -> dict[tuple[str | None, str], int]:
+        """rejects counted per (device_id, reason) - device_id None if unknown."""
+        return dict(self.__counts)
+
+    def count(self, device_id: str | None = None, reason: str | None = None) -> int:
+        """Return the rejects of a device and/or reason - all if not given."""
+        return sum(
+            count
+            for (counted_device_id, counted_reason), count in self.__counts.items()
+            if (device_id is None or counted_device_id == device_id)
+            and (reason is None or counted_reason == reason)
+        )
+
+    def clear(self) -> None:
+        """Reset the counters."""
+        self.__counts.clear()
+        self.__fetch_counts.clear()
+
+    def report(  # pylint: disable=too-many-arguments
+        self,
+        logger: logging.Logger,
+        device_id: str | None,
+        reason: str,
+        msg: str,
+        *args,
+        count: int = 1,
+        level: int = logging.WARNING,
+    ) -> None:
+        """Count a reject and log msg % args with logger unless rate limited."""
+
+        key = (device_id, reason)
+        self.__counts[key] = self.__counts.get(key, 0) + count
+        self.__fetch_counts[key] = self.__fetch_counts.get(key, 0) + count
+
+        if self.__defer_logs:
+            if key not in self.__samples:
+                self.__samples[key] = (logger, level, msg, args, count)
+            else:
+                sample = self.__samples[key]
+                self.__samples[key] = (*sample[:4], sample[4] + count)
+            return
+
+        now = time.monotonic()
+        if now < self.__next_log.get(key, 0.0) or not self.__log_reason(reason, now):
+            self.__suppressed[key] = self.__suppressed.get(key, 0) + count
+            return
+        self.__next_log[key] = now + self.__log_interval
+        suppressed = self.__suppressed.pop(key, 0) + count - 1
+        if suppressed:
+            logger.log(
+                level, msg + " (%d similar messages suppressed)", *args, suppressed
+            )
+        else:
+            logger.log(level, msg, *args)
+
+    def __log_reason(self, reason: str, now: float) -> bool:
+        """Return if another device may be logged for reason in this interval."""
+
+        interval_end, logged = self.__reason_logs.get(reason, (0.0, 0))
+        if now >= interval_end:
+            interval_end, logged = now + self.__log_interval, 0
+        if logged >= self.__log_devices:
+            return False
+        self.__reason_logs[reason] = (interval_end, logged + 1)
+        return True
+
+    def merge(self, other: "TTNDiagnostics") -> None:
+        """Add the rejects of an executor batch and log their samples."""
+
+        samples = other.__samples  # pylint: disable=protected-access
+        for key, (logger, level, msg, args, count) in samples.items():
+            self.report(logger, *key, msg, *args, count=count, level=level)
+
+    def fetch_summary(self) -> dict[str, tuple[int, int]]:
+        """Return the rejects and devices of each reason since the last call."""
+
+        summary: dict[str, tuple[int, int]] = {}
+        for (_device_id, reason), count in self.__fetch_counts.items():
+            rejects, devices = summary.get(reason, (0, 0))
+            summary[reason] = (rejects + count, devices + 1)
+        self.__fetch_counts.clear()
+        return summary
+
+
+# Diagnostics of the client parsing in the current context
+_active: ContextVar[TTNDiagnostics] = ContextVar("ttn_diagnostics")
+
+
+@functools.cache
+def _default_diagnostics() -> TTNDiagnostics:
+    """Return the diagnostics of parsers used outside of a client.
+
+    They are created on first use and shared by the whole process.
+    """
+
+    return TTNDiagnostics()
+
+
+def report(
+    logger: logging.Logger, device_id: str | None, reason: str, msg: str, *args
+) -> None:
+    """Count a reject in the active TTNDiagnostics and log it unless rate limited.
+
+    For parsers: msg % args is only formatted when logged.
+    """
+
+    try:
+        diagnostics = _active.get()
+    except LookupError:
+        diagnostics = _default_diagnostics()
+    diagnostics.report(logger, device_id, reason, msg, *args)
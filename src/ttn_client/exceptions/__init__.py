@@ -1,3 +1,6 @@
 """Exports public classes."""
 
 from .auth_error import TTNAuthError  # noqa: F401
+from .connection_error import TTNConnectionError  # noqa: F401
+from .rate_limit_error import TTNRateLimitError  # noqa: F401
+from .server_error import TTNServerError  # noqa: F401
@@ -0,0 +1,5 @@
+"""Connection Error for The Thinks Network client."""
+
+
+class TTNConnectionError(Exception):
+    "Raised when the connection to TTN is lost or cannot be established."
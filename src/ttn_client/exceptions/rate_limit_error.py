@@ -0,0 +1,9 @@
+"""Rate Limit Error for The Thinks Network client."""
+
+
+class TTNRateLimitError(Exception):
+    "Raised when we get 429."
+
+    def __init__(self, retry_after: float | None = None) -> None:
+        super().__init__(f"rate limited - retry after {retry_after}s")
+        self.retry_after = retry_after
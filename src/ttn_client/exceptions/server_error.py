@@ -0,0 +1,9 @@
+"""Server Error for The Thinks Network client."""
+
+
+class TTNServerError(RuntimeError):
+    "Raised when we get 5xx or another unexpected status."
+
+    def __init__(self, status: int, reason: str | None) -> None:
+        super().__init__(f"expected 200 got {status} - {reason}")
+        self.status = status
@@ -0,0 +1,58 @@
+"""JSON decoders for The Thinks Network client."""
+
+from collections.abc import Callable
+import importlib
+import json
+from typing import Any, TypedDict
+
+JSONLoads = Callable[[bytes | str], Any]
+
+
+def default_loads() -> JSONLoads:
+    """Return the fastest available JSON decoder.
+
+    orjson or msgspec are used when installed, otherwise the json module.
+    """
+
+    try:
+        return importlib.import_module("orjson").loads
+    except ImportError:
+        pass
+    try:
+        return importlib.import_module("msgspec").json.decode
+    except ImportError:
+        return json.loads
+
+
+class _EndDeviceIds(TypedDict):
+    device_id: str
+
+
+class _UplinkMessage(TypedDict, total=False):
+    decoded_payload: dict[str, Any]
+    version_ids: dict[str, Any]
+    frm_payload: str
+    f_port: int
+
+
+class _ApplicationUp(TypedDict, total=False):
+    end_device_ids: _EndDeviceIds
+    received_at: str
+    uplink_message: _UplinkMessage
+
+
+class _StorageEntry(TypedDict, total=False):
+    result: _ApplicationUp
+
+
+def storage_entry_loads() -> JSONLoads:
+    """Return a decoder for storage entries that skips fields not used by parsers.
+
+    Only end_device_ids, received_at and the decoded_payload, version_ids,
+    frm_payload and f_port of the uplink_message are decoded so large trees such
+    as rx_metadata are never built. Raw uplinks retained by the parsed values
+    only contain these fields. Requires msgspec.
+    """
+
+    msgspec = importlib.import_module("msgspec")
+    return msgspec.json.Decoder(_StorageEntry).decode
@@ -0,0 +1,45 @@
+"""Metrics hooks for The Thinks Network client."""
+
+
+class TTNMetrics:
+    """Hooks reporting the cost of the storage integration requests.
+
+    All the hooks do nothing: subclass and override the ones needed to feed a
+    metrics backend such as Prometheus or OpenTelemetry. The hooks are called
+    once per request (or per retry) with totals, not once per uplink, and run
+    on the event loop so they must not block.
+    """
+
+    def request(self, application_id: str, status: int, latency: float) -> None:
+        """A request was answered with status after latency seconds."""
+
+    def first_byte(self, application_id: str, latency: float) -> None:
+        """The first byte of the response body arrived after latency seconds."""
+
+    def streamed(
+        self, application_id: str, size: int, lines: int, duration: float
+    ) -> None:
+        """A response of size bytes and lines entries was streamed in duration seconds."""
+
+    def decoded(self, application_id: str, lines: int, duration: float) -> None:
+        """lines entries of a response were decoded in duration seconds."""
+
+    def parsed(
+        self,
+        application_id: str,
+        parser: str,
+        uplinks: int,
+        values: int,
+        duration: float,
+    ) -> None:
+        """parser created values from uplinks of a response in duration seconds."""
+
+    def skipped(self, application_id: str, reason: str, count: int) -> None:
+        """count entries of a response were skipped.
+
+        reason is no_result (invalid entry), duplicate (already processed) or
+        no_values (nothing parsed).
+        """
+
+    def retried(self, application_id: str, reason: str, delay: float) -> None:
+        """A failed request is retried after delay seconds because of reason."""
@@ -0,0 +1,45 @@
+"""MQTT transport for The Thinks Network client."""
+
+from collections.abc import AsyncIterator, Callable
+import importlib
+
+from .exceptions import TTNAuthError, TTNConnectionError
+
+# MQTT CONNACK codes meaning bad credentials (MQTT 3.1.1 and MQTT 5)
+_MQTT_AUTH_ERROR_CODES = (4, 5, 134, 135)
+
+MQTTTransport = Callable[[str, int, str, str, str], AsyncIterator[bytes]]
+
+
+async def aiomqtt_transport(
+    hostname: str, port: int, username: str, password: str, topic: str
+) -> AsyncIterator[bytes]:
+    """Subscribe to topic and yield the payload of every received message.
+
+    Requires the optional aiomqtt package. Connection failures are raised as
+    TTNConnectionError and rejected credentials as TTNAuthError.
+    """
+    try:
+        aiomqtt = importlib.import_module("aiomqtt")
+    except ImportError as err:
+        raise ImportError(
+            "MQTT push mode requires aiomqtt - install ttn_client[mqtt]"
+        ) from err
+
+    try:
+        async with aiomqtt.Client(
+            hostname,
+            port=port,
+            username=username,
+            password=password,
+            tls_params=aiomqtt.TLSParameters(),
+        ) as client:
+            await client.subscribe(topic)
+            async for message in client.messages:
+                yield message.payload
+    except aiomqtt.MqttCodeError as err:
+        if err.rc in _MQTT_AUTH_ERROR_CODES:
+            raise TTNAuthError from err
+        raise TTNConnectionError(str(err)) from err
+    except aiomqtt.MqttError as err:
+        raise TTNConnectionError(str(err)) from err
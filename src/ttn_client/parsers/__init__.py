@@ -1,23 +1,79 @@
 """Parsers for for The Thinks Network client."""
 
+import base64
+import binascii
+import logging
+
+from ..diagnostics import report
 from ..values import TTNBaseValue
-from .default import default_parser
+from .cayenne_lpp import cayenne_lpp_decoder  # noqa: F401
+from .default import default_parser  # noqa: F401
+from .registry import (  # noqa: F401
+    TTNParser,
+    TTNPayloadDecoder,
+    register_decoder,
+    register_parser,
+    resolve_decoder,
+    resolve_parser,
+    unregister_decoder,
+    unregister_parser,
+)
 from .sensecap import sensecap_parser
 
+_LOGGER = logging.getLogger(__name__)
+
+register_parser(sensecap_parser, brand_id="sensecap")
+
+
+def ttn_parse(uplink_data: dict, retain_uplink: bool = True) -> dict[str, TTNBaseValue]:
+    """Parse the uplink with the parser registered for the device.
+
+    The parsed values keep a reference to the raw uplink only if retain_uplink is set.
+    """
 
-def ttn_parse(uplink_data: dict) -> dict[str, TTNBaseValue]:
-    """Return a parser for the device."""
+    return uplink_parser(uplink_data)(uplink_data, retain_uplink)
 
-    version_ids = uplink_data.get("uplink_message", {}).get("version_ids", {})
-    version_ids = uplink_data["uplink_message"].get("version_ids", {})
-    brand_id = version_ids.get("brand_id", {})
-    # model_id = version_ids.get("model_id", {})
-    # hardware_version = version_ids.get("hardware_version", {})
-    # firmware_version = version_ids.get("firmware_version", {})
 
-    if brand_id == "sensecap":
-        parser = sensecap_parser
+def uplink_parser(uplink_data: dict) -> TTNParser:
+    """Return the parser registered for the device of the uplink.
+
+    An uplink without decoded_payload gets one decoded from its frm_payload
+    first when a payload decoder is registered for the device.
+    """
+
+    uplink_message = uplink_data["uplink_message"]
+    version_ids = uplink_message.get("version_ids")
+    if version_ids:
+        device_version = (
+            version_ids.get("brand_id"),
+            version_ids.get("model_id"),
+            version_ids.get("firmware_version"),
+        )
     else:
-        parser = default_parser
+        device_version = (None, None, None)
+    if "decoded_payload" not in uplink_message and "frm_payload" in uplink_message:
+        decoder = resolve_decoder(*device_version)
+        if decoder is not None:
+            __decode_frm_payload(uplink_data, decoder)
+    return resolve_parser(*device_version)
+
+
+def __decode_frm_payload(uplink_data: dict, decoder: TTNPayloadDecoder) -> None:
+    """Add the decoded_payload decoded from the frm_payload to the uplink."""
 
-    return parser(uplink_data)
+    uplink_message = uplink_data["uplink_message"]
+    try:
+        uplink_message["decoded_payload"] = decoder(
+            base64.b64decode(uplink_message["frm_payload"], validate=True),
+            uplink_message.get("f_port", 0),
+        )
+    except (binascii.Error, ValueError) as err:
+        device_id = uplink_data["end_device_ids"]["device_id"]
+        report(
+            _LOGGER,
+            device_id,
+            "frm_payload_error",
+            "Cannot decode frm_payload for device %s: %s",
+            device_id,
+            err,
+        )
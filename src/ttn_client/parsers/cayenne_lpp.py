@@ -0,0 +1,116 @@
+"""Cayenne LPP decoder for for The Thinks Network client."""
+
+from collections.abc import Callable
+import struct
+from typing import Any, NamedTuple
+
+_UINT8 = struct.Struct(">B")
+_UINT16 = struct.Struct(">H")
+_INT16 = struct.Struct(">h")
+_UINT32 = struct.Struct(">I")
+
+
+class _DataType(NamedTuple):
+    """Cayenne LPP data type: name of its fields, size and decoder."""
+
+    name: str
+    size: int
+    decode: Callable[[memoryview, int], Any]
+
+
+def _scalar(packer: struct.Struct, scale: int = 1) -> Callable[[memoryview, int], Any]:
+    unpack_from = packer.unpack_from
+    if scale == 1:
+        return lambda payload, offset: unpack_from(payload, offset)[0]
+    return lambda payload, offset: unpack_from(payload, offset)[0] / scale
+
+
+def _xyz(scale: int) -> Callable[[memoryview, int], Any]:
+    unpack_from = struct.Struct(">hhh").unpack_from
+
+    def decode(payload: memoryview, offset: int) -> dict[str, float]:
+        x, y, z = unpack_from(payload, offset)
+        return {"x": x / scale, "y": y / scale, "z": z / scale}
+
+    return decode
+
+
+def _int24(payload: memoryview, offset: int) -> int:
+    return int.from_bytes(payload[offset : offset + 3], "big", signed=True)
+
+
+def _gps(payload: memoryview, offset: int) -> dict[str, float]:
+    return {
+        "latitude": _int24(payload, offset) / 10000,
+        "longitude": _int24(payload, offset + 3) / 10000,
+        "altitude": _int24(payload, offset + 6) / 100,
+    }
+
+
+def _colour(payload: memoryview, offset: int) -> dict[str, int]:
+    return {"r": payload[offset], "g": payload[offset + 1], "b": payload[offset + 2]}
+
+
+# Field names of the common Cayenne LPP payload formatters
+_DATA_TYPES: dict[int, _DataType] = {
+    0: _DataType("digital_in", 1, _scalar(_UINT8)),
+    1: _DataType("digital_out", 1, _scalar(_UINT8)),
+    2: _DataType("analog_in", 2, _scalar(_INT16, 100)),
+    3: _DataType("analog_out", 2, _scalar(_INT16, 100)),
+    100: _DataType("generic", 4, _scalar(_UINT32)),
+    101: _DataType("illuminance", 2, _scalar(_UINT16)),
+    102: _DataType("presence", 1, _scalar(_UINT8)),
+    103: _DataType("temperature", 2, _scalar(_INT16, 10)),
+    104: _DataType("humidity", 1, _scalar(_UINT8, 2)),
+    113: _DataType("accelerometer", 6, _xyz(1000)),
+    115: _DataType("barometer", 2, _scalar(_UINT16, 10)),
+    116: _DataType("voltage", 2, _scalar(_UINT16, 100)),
+    117: _DataType("current", 2, _scalar(_UINT16, 1000)),
+    118: _DataType("frequency", 4, _scalar(_UINT32)),
+    120: _DataType("percentage", 1, _scalar(_UINT8)),
+    121: _DataType("altitude", 2, _scalar(_INT16)),
+    125: _DataType("concentration", 2, _scalar(_UINT16)),
+    128: _DataType("power", 2, _scalar(_UINT16)),
+    130: _DataType("distance", 4, _scalar(_UINT32, 1000)),
+    131: _DataType("energy", 4, _scalar(_UINT32, 1000)),
+    132: _DataType("direction", 2, _scalar(_UINT16)),
+    133: _DataType("time", 4, _scalar(_UINT32)),
+    134: _DataType("gyrometer", 6, _xyz(100)),
+    135: _DataType("colour", 3, _colour),
+    136: _DataType("gps", 9, _gps),
+    142: _DataType("switch", 1, _scalar(_UINT8)),
+}
+
+
+def cayenne_lpp_decoder(payload: bytes | memoryview, _f_port: int) -> dict[str, Any]:
+    """Decode a Cayenne LPP frm_payload.
+
+    Each value is named after its data type and channel, such as
+    temperature_1, with the layout default_parser expects: accelerometer,
+    gyrometer, colour and gps values are nested objects.
+
+    Raises ValueError if the payload is truncated or has an unknown data type.
+    """
+
+    payload = memoryview(payload)
+    size = len(payload)
+    decoded_payload: dict[str, Any] = {}
+    offset = 0
+    while offset < size:
+        if offset + 2 > size:
+            raise ValueError(f"Truncated Cayenne LPP payload at byte {offset}")
+        channel = payload[offset]
+        data_type = _DATA_TYPES.get(payload[offset + 1])
+        if data_type is None:
+            raise ValueError(
+                f"Unknown Cayenne LPP data type {payload[offset + 1]}"
+                f" at byte {offset + 1}"
+            )
+        offset += 2
+        if offset + data_type.size > size:
+            raise ValueError(f"Truncated Cayenne LPP {data_type.name}_{channel}")
+        decoded_payload[f"{data_type.name}_{channel}"] = data_type.decode(
+            payload, offset
+        )
+        offset += data_type.size
+    return decoded_payload
@@ -1,23 +1,67 @@
 """Cayenne parser for for The Thinks Network client."""
 
+from collections.abc import Callable
 import logging
+import threading
+from typing import Any, NamedTuple
+
+from ..diagnostics import report
 from ..values import (
     TTNBaseValue,
     TTNBinarySensorValue,
     TTNDeviceTrackerValue,
+    TTNLazyValues,
     TTNSensorAttribute,
     TTNSensorValue,
+    TTNUplinkMetadata,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
 _SENSOR_ATTR_KEY = "_sensor_attr"
 
+# Number of (device, payload shape) combinations with a compiled schema
+SCHEMA_CACHE_SIZE = 1024
+
+_ValueFactory = Callable[[TTNUplinkMetadata, str, Any], TTNBaseValue | None]
+
+
+class _Entry(NamedTuple):
+    """Compiled field of a decoded payload.
+
+    Leaves are converted with factory. Nested objects have the entries of their
+    own fields in children instead.
+    """
+
+    key: str
+    field_id: str
+    value_types: tuple[type, ...]
+    factory: _ValueFactory | None
+    children: tuple["_Entry", ...] | None
+
+
+class _ShapeChangedError(Exception):
+    """Raised when a payload does not match its compiled schema."""
+
+
+_schemas: dict[tuple[str, tuple[str, ...]], tuple[_Entry, ...]] = {}
+_schemas_lock = threading.Lock()
+
 
-def default_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
-    """Cayenne parser for for The Thinks Network client."""
+def default_parser(
+    uplink_data: dict, retain_uplink: bool = True
+) -> dict[str, TTNBaseValue]:
+    """Cayenne parser for for The Thinks Network client.
 
-    ttn_values: dict[str, TTNBaseValue] = {}
+    The layout of the payload is compiled into a schema which is cached per
+    device and payload shape, so following uplinks with the same shape skip the
+    type checks and key flattening of the generic walk.
+
+    The values are only built when read (see TTNLazyValues) and keep a
+    reference to the decoded payload until then.
+    """
+
+    ttn_values: dict[str, Any] = {}
 
     # Get device_id and uplink_message from measurement
     device_id = uplink_data["end_device_ids"]["device_id"]
@@ -25,67 +69,173 @@ def default_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
 
     # Skip not decoded measurements
     if "decoded_payload" not in uplink_message:
-        _LOGGER.warning("No decoded_payload for device %s", device_id)
+        report(
+            _LOGGER,
+            device_id,
+            "no_decoded_payload",
+            "No decoded_payload for device %s",
+            device_id,
+        )
     else:
-        for field_id, value_item in uplink_message["decoded_payload"].items():
-            __default_parse_field(
-                ttn_values,
-                field_id,
-                uplink_data,
-                value_item,
+        decoded_payload = uplink_message["decoded_payload"]
+        metadata = TTNUplinkMetadata(uplink_data, retain_uplink)
+        schema_key = (device_id, tuple(decoded_payload))
+        # Null fields are only reported once the whole schema applies
+        null_field_ids: list[str] = []
+        schema = _schemas.get(schema_key)
+        if schema is not None:
+            try:
+                __default_apply_schema(
+                    ttn_values, null_field_ids, schema, metadata, decoded_payload
+                )
+            except (KeyError, _ShapeChangedError):
+                schema = None
+                ttn_values.clear()
+                null_field_ids.clear()
+
+        if schema is None:
+            # New or changed payload shape
+            schema = tuple(
+                __default_compile_field(field_id, field_id, value_item)
+                for field_id, value_item in decoded_payload.items()
+            )
+            __default_apply_schema(
+                ttn_values, null_field_ids, schema, metadata, decoded_payload
             )
-    return ttn_values
+            with _schemas_lock:
+                if len(_schemas) >= SCHEMA_CACHE_SIZE:
+                    del _schemas[next(iter(_schemas))]
+                _schemas[schema_key] = schema
+
+        for field_id in null_field_ids:
+            _ignore_none(metadata, field_id, None)
+    return TTNLazyValues(ttn_values)
 
 
-def __default_parse_field(
-    ttn_values: dict[str, TTNBaseValue],
-    field_id: str,
-    application_up: dict,
-    new_value,
+def __default_apply_schema(
+    ttn_values: dict[str, Any],
+    null_field_ids: list[str],
+    schema: tuple[_Entry, ...],
+    metadata: TTNUplinkMetadata,
+    node: dict,
 ) -> None:
-    """Parses a cayenne field"""
-    new_ttn_value: TTNBaseValue | None
+    """Add the pending values described by schema to ttn_values.
+
+    The ids of null fields are added to null_field_ids instead.
+
+    Raises KeyError or _ShapeChangedError if the payload does not match.
+    """
+
+    for key, field_id, value_types, factory, children in schema:
+        value = node[key]
+        if type(value) not in value_types:
+            raise _ShapeChangedError(field_id)
+        if children is not None:
+            if len(value) != len(children):
+                raise _ShapeChangedError(field_id)
+            __default_apply_schema(
+                ttn_values, null_field_ids, children, metadata, value
+            )
+        elif factory is _ignore_none:
+            null_field_ids.append(field_id)
+        elif factory is not None:
+            if factory is TTNDeviceTrackerValue and (
+                "latitude" not in value or "longitude" not in value
+            ):
+                raise _ShapeChangedError(field_id)
+            ttn_values[field_id] = (factory, metadata, value)
+
+
+def __default_compile_field(key: str, field_id: str, new_value) -> _Entry:
+    """Compiles a cayenne field"""
+    factory: _ValueFactory
     if isinstance(new_value, dict):
         if "latitude" in new_value and "longitude" in new_value:
             # GPS
-            new_ttn_value = TTNDeviceTrackerValue(application_up, field_id, new_value)
-        elif field_id == _SENSOR_ATTR_KEY:
+            return _Entry(key, field_id, (dict,), TTNDeviceTrackerValue, None)
+        if field_id == _SENSOR_ATTR_KEY:
             # _sensor_attr: { BatV: { unit: "V", device_class: "voltage" } }
-            for sensor_field, attr_dict in new_value.items():
-                if not isinstance(attr_dict, dict):
-                    continue
-                for attr_key, attr_value in attr_dict.items():
-                    flat_key = f"{_SENSOR_ATTR_KEY}_{sensor_field}_{attr_key}"
-                    ttn_values[flat_key] = TTNSensorAttribute(
-                        application_up, flat_key, str(attr_value)
-                    )
-            return
-        else:
-            # Other - such as acceleration -> split in multiple ttn_values
-            for key, value_item in new_value.items():
-                __default_parse_field(
-                    ttn_values,
-                    f"{field_id}_{key}",
-                    application_up,
-                    value_item,
-                )
-            return
-    elif isinstance(new_value, bool):
+            return _Entry(
+                key,
+                field_id,
+                (dict,),
+                None,
+                tuple(
+                    __default_compile_sensor_attr(sensor_field, attr_dict)
+                    for sensor_field, attr_dict in new_value.items()
+                ),
+            )
+        # Other - such as acceleration -> split in multiple ttn_values
+        return _Entry(
+            key,
+            field_id,
+            (dict,),
+            None,
+            tuple(
+                __default_compile_field(sub_key, f"{field_id}_{sub_key}", value_item)
+                for sub_key, value_item in new_value.items()
+            ),
+        )
+
+    value_types: tuple[type, ...]
+    if isinstance(new_value, bool):
         # BinarySensor
-        new_ttn_value = TTNBinarySensorValue(application_up, field_id, new_value)
+        value_types, factory = (bool,), TTNBinarySensorValue
     elif isinstance(new_value, list):
         # TTN_SensorValue with list as string
-        new_ttn_value = TTNSensorValue(application_up, field_id, str(new_value))
-    elif isinstance(new_value, (str, int, float)):
-        new_ttn_value = TTNSensorValue(application_up, field_id, new_value)
+        value_types, factory = (list,), _list_sensor
+    elif isinstance(new_value, str):
+        value_types, factory = (str,), TTNSensorValue
+    elif isinstance(new_value, (int, float)):
+        # Numbers often alternate between int and float
+        value_types, factory = (int, float), TTNSensorValue
     elif new_value is None:
         # Skip null values
-        _LOGGER.warning(
-            "Ignoring entry %s with value=None - check your application decoder",
-            field_id,
-        )
-        return
+        value_types, factory = (type(None),), _ignore_none
     else:
         raise TypeError(f"Unexpected type {type(new_value)} for value: {new_value}")
 
-    ttn_values[field_id] = new_ttn_value
+    return _Entry(key, field_id, value_types, factory, None)
+
+
+def __default_compile_sensor_attr(sensor_field: str, attr_dict) -> _Entry:
+    """Compiles the attributes of a sensor field in _sensor_attr"""
+    if not isinstance(attr_dict, dict):
+        # Skipped
+        return _Entry(sensor_field, sensor_field, (type(attr_dict),), None, None)
+    return _Entry(
+        sensor_field,
+        sensor_field,
+        (dict,),
+        None,
+        tuple(
+            _Entry(
+                attr_key,
+                f"{_SENSOR_ATTR_KEY}_{sensor_field}_{attr_key}",
+                (type(attr_value),),
+                _sensor_attribute,
+                None,
+            )
+            for attr_key, attr_value in attr_dict.items()
+        ),
+    )
+
+
+def _list_sensor(metadata: TTNUplinkMetadata, field_id: str, value: list):
+    return TTNSensorValue(metadata, field_id, str(value))
+
+
+def _sensor_attribute(metadata: TTNUplinkMetadata, field_id: str, value):
+    return TTNSensorAttribute(metadata, field_id, str(value))
+
+
+def _ignore_none(metadata: TTNUplinkMetadata, field_id: str, _value: None) -> None:
+    report(
+        _LOGGER,
+        metadata.device_id,
+        "null_value",
+        "Ignoring entry %s with value=None for device %s"
+        " - check your application decoder",
+        field_id,
+        metadata.device_id,
+    )
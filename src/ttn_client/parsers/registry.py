@@ -0,0 +1,129 @@
+"""Parser registry for for The Thinks Network client."""
+
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+from ..values import TTNBaseValue
+from .default import default_parser
+
+TTNParser = Callable[[dict, bool], dict[str, TTNBaseValue]]
+# Decodes the frm_payload bytes sent on f_port into a decoded_payload
+TTNPayloadDecoder = Callable[[bytes, int], dict[str, Any]]
+
+# Number of (brand, model, firmware) combinations with a memoised parser
+PARSER_CACHE_SIZE = 256
+
+
+class _Registration(NamedTuple):
+    handler: Callable  # TTNParser or TTNPayloadDecoder
+    brand_id: str | None
+    model_id: str | None
+    firmware_version: str | None
+
+    def specificity(self, brand_id, model_id, firmware_version) -> int:
+        """Return how many version ids match or -1 if any does not."""
+        matched = 0
+        for expected, actual in (
+            (self.brand_id, brand_id),
+            (self.model_id, model_id),
+            (self.firmware_version, firmware_version),
+        ):
+            if expected is None:
+                continue
+            if expected != actual:
+                return -1
+            matched += 1
+        return matched
+
+
+_registrations: list[_Registration] = []
+_decoder_registrations: list[_Registration] = []
+
+
+def register_parser(
+    parser: TTNParser,
+    brand_id: str | None = None,
+    model_id: str | None = None,
+    firmware_version: str | None = None,
+) -> None:
+    """Use parser for uplinks of devices matching the given version_ids.
+
+    Version ids left as None match any device. When several parsers match, the
+    one matching most version ids is used and, among those, the last registered.
+    Devices not matched by any parser use default_parser.
+    """
+
+    _registrations.append(_Registration(parser, brand_id, model_id, firmware_version))
+    resolve_parser.cache_clear()
+
+
+def unregister_parser(parser: TTNParser) -> None:
+    """Remove all the registrations of parser."""
+
+    _registrations[:] = [reg for reg in _registrations if reg.handler is not parser]
+    resolve_parser.cache_clear()
+
+
+def register_decoder(
+    decoder: TTNPayloadDecoder,
+    brand_id: str | None = None,
+    model_id: str | None = None,
+    firmware_version: str | None = None,
+) -> None:
+    """Decode the frm_payload of uplinks without decoded_payload with decoder.
+
+    Devices are matched like in register_parser. The returned decoded_payload
+    is parsed as if it had been decoded by a payload formatter on the server,
+    so these can be turned off. Uplinks of devices not matched by any decoder
+    are left without decoded_payload.
+    """
+
+    _decoder_registrations.append(
+        _Registration(decoder, brand_id, model_id, firmware_version)
+    )
+    resolve_decoder.cache_clear()
+
+
+def unregister_decoder(decoder: TTNPayloadDecoder) -> None:
+    """Remove all the registrations of decoder."""
+
+    _decoder_registrations[:] = [
+        reg for reg in _decoder_registrations if reg.handler is not decoder
+    ]
+    resolve_decoder.cache_clear()
+
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def resolve_parser(
+    brand_id: str | None, model_id: str | None, firmware_version: str | None
+) -> TTNParser:
+    """Return the parser for devices with the given version_ids."""
+
+    return _best_match(
+        _registrations, default_parser, brand_id, model_id, firmware_version
+    )
+
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def resolve_decoder(
+    brand_id: str | None, model_id: str | None, firmware_version: str | None
+) -> TTNPayloadDecoder | None:
+    """Return the payload decoder for devices with the given version_ids."""
+
+    return _best_match(
+        _decoder_registrations, None, brand_id, model_id, firmware_version
+    )
+
+
+def _best_match(registrations, default, brand_id, model_id, firmware_version):
+    """Return the handler of the registration matching most version ids."""
+
+    best_handler = default
+    best_specificity = -1
+    for registration in registrations:
+        specificity = registration.specificity(brand_id, model_id, firmware_version)
+        if specificity >= 0 and specificity >= best_specificity:
+            best_handler = registration.handler
+            best_specificity = specificity
+    return best_handler
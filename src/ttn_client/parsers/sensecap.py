@@ -1,13 +1,75 @@
 """Sensecap parser for for The Thinks Network client."""
 
 import logging
-from ..values import TTNBaseValue, TTNSensorValue
+from typing import NamedTuple
+
+from ..diagnostics import report
+from ..values import (
+    TTNBaseValue,
+    TTNSensorAttribute,
+    TTNSensorValue,
+    TTNUplinkMetadata,
+)
 
 # pylint: disable=duplicate-code
 _LOGGER = logging.getLogger(__name__)
 
+_SENSOR_ATTR_KEY = "_sensor_attr"
+
+
+class _Measurement(NamedTuple):
+    """Field of a SenseCAP measurement and its _sensor_attr attributes."""
+
+    field_id: str
+    attributes: tuple[tuple[str, str], ...]
+
+
+def _measurement(
+    field_id: str, unit: str | None, device_class: str | None
+) -> _Measurement:
+    return _Measurement(
+        field_id,
+        tuple(
+            (f"{_SENSOR_ATTR_KEY}_{field_id}_{attr_key}", attr_value)
+            for attr_key, attr_value in (("unit", unit), ("device_class", device_class))
+            if attr_value is not None
+        ),
+    )
+
+
+# measurementId: type sent by the SenseCAP decoders (so field ids do not
+# change), unit and device class
+_MEASUREMENTS: dict[str, _Measurement] = {
+    str(measurement_id): _measurement(
+        f"{name.replace(' ', '_')}_{measurement_id}", unit, device_class
+    )
+    for measurement_id, name, unit, device_class in (
+        (3000, "Battery", "%", "battery"),
+        (4097, "Air Temperature", "°C", "temperature"),
+        (4098, "Air Humidity", "%", "humidity"),
+        (4099, "Light Intensity", "lx", "illuminance"),
+        (4100, "CO2", "ppm", "carbon_dioxide"),
+        (4101, "Barometric Pressure", "Pa", "atmospheric_pressure"),
+        (4102, "Soil Temperature", "°C", "temperature"),
+        (4104, "Wind Direction Sensor", "°", None),
+        (4105, "Wind Speed", "m/s", "wind_speed"),
+        (4113, "Rain Gauge", "mm/h", "precipitation_intensity"),
+        (4190, "UV Index", None, None),
+        (4191, "Peak Wind Gust", "m/s", "wind_speed"),
+        (4197, "Longitude", "°", None),
+        (4198, "Latitude", "°", None),
+        (4199, "Light", "%", None),
+        (4200, "Event Status", None, None),
+        (5001, "Wi-Fi Scan", None, None),
+    )
+}
+# Battery(%) of the S2120 messages
+_BATTERY = _measurement("battery", "%", "battery")
 
-def sensecap_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
+
+def sensecap_parser(
+    uplink_data: dict, retain_uplink: bool = True
+) -> dict[str, TTNBaseValue]:
     """Sensecap parser for for The Thinks Network client."""
 
     ttn_values: dict[str, TTNBaseValue] = {}
@@ -18,12 +80,22 @@ def sensecap_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
 
     # Skip not decoded measurements
     if "decoded_payload" not in uplink_message:
-        _LOGGER.warning("No decoded_payload for device %s", device_id)
+        report(
+            _LOGGER,
+            device_id,
+            "no_decoded_payload",
+            "No decoded_payload for device %s",
+            device_id,
+        )
     else:
         decoded_payload = uplink_message["decoded_payload"]
+        metadata = TTNUplinkMetadata(uplink_data, retain_uplink)
         # Check im msg is valid
         if not decoded_payload.get("valid", False):
-            _LOGGER.warning(
+            report(
+                _LOGGER,
+                device_id,
+                "invalid_payload",
                 "Ignoring message without valid=true for device %s: %s",
                 device_id,
                 decoded_payload,
@@ -32,10 +104,16 @@ def sensecap_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
             # Create values for fixed msgs
             for field in ["err", "payload"]:
                 ttn_values[field] = TTNSensorValue(
-                    uplink_data, field, decoded_payload[field]
+                    metadata, field, decoded_payload[field]
                 )
             if "messages" not in decoded_payload:
-                _LOGGER.warning("No messages for device %s", device_id)
+                report(
+                    _LOGGER,
+                    device_id,
+                    "no_messages",
+                    "No messages for device %s",
+                    device_id,
+                )
             else:
                 # Parse messages
                 messages = decoded_payload["messages"]
@@ -46,14 +124,14 @@ def sensecap_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
                             __sensecap_parse_msg(
                                 ttn_values,
                                 device_id,
-                                uplink_data,
+                                metadata,
                                 measurement,
                             )
                     else:
                         __sensecap_parse_msg(
                             ttn_values,
                             device_id,
-                            uplink_data,
+                            metadata,
                             value_item,
                         )
     return ttn_values
@@ -62,29 +140,59 @@ def sensecap_parser(uplink_data: dict) -> dict[str, TTNBaseValue]:
 def __sensecap_parse_msg(
     ttn_values: dict[str, TTNBaseValue],
     device_id: str,
-    uplink_data: dict,
+    metadata: TTNUplinkMetadata,
     value_item,
 ) -> None:
     """Parses a Sensecap field"""
 
     if isinstance(value_item, dict):
         battery = value_item.get("Battery(%)")
-        measurement_id = value_item.get("measurementId")
+        if battery is not None:
+            __sensecap_add_measurement(ttn_values, metadata, _BATTERY, battery)
+            return
+
         measurement_value = value_item.get("measurementValue")
-        measurement_type = value_item.get("type")
+        if measurement_value is not None:
+            measurement = _MEASUREMENTS.get(str(value_item.get("measurementId")))
+            if measurement is not None:
+                __sensecap_add_measurement(
+                    ttn_values, metadata, measurement, measurement_value
+                )
+                return
 
-        if battery:
-            ttn_values["battery"] = TTNSensorValue(uplink_data, "battery", battery)
-            return
-        if measurement_id and measurement_value and measurement_type:
-            field_id = f"{measurement_type.replace(' ','_')}_{measurement_id}"
-            ttn_values[field_id] = TTNSensorValue(
-                uplink_data, field_id, measurement_value
-            )
+            # Unknown measurementId: named after its type
+            measurement_id = value_item.get("measurementId")
+            measurement_type = value_item.get("type")
+            if measurement_id and measurement_type:
+                field_id = f"{measurement_type.replace(' ','_')}_{measurement_id}"
+                ttn_values[field_id] = TTNSensorValue(
+                    metadata, field_id, measurement_value
+                )
+                return
 
-    _LOGGER.warning(
+    report(
+        _LOGGER,
+        device_id,
+        "ignored_message",
         "Message for device %s ignored (type %s): %s",
         device_id,
         type(value_item),
         value_item,
     )
+
+
+def __sensecap_add_measurement(
+    ttn_values: dict[str, TTNBaseValue],
+    metadata: TTNUplinkMetadata,
+    measurement: _Measurement,
+    value,
+) -> None:
+    """Add the value of a known measurement and its attributes"""
+
+    ttn_values[measurement.field_id] = TTNSensorValue(
+        metadata, measurement.field_id, value
+    )
+    for attr_field_id, attr_value in measurement.attributes:
+        ttn_values[attr_field_id] = TTNSensorAttribute(
+            metadata, attr_field_id, attr_value
+        )
@@ -0,0 +1,172 @@
+"""Poller for many applications of The Thinks Network."""
+
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+import logging
+import random
+
+import aiohttp
+
+from .client import TTNClient
+from .const import (
+    DEFAULT_CONNECTION_LIMIT,
+    DEFAULT_HOST_CONCURRENCY,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_POLL_JITTER,
+    DEFAULT_TIMEOUT,
+)
+from .scheduler import TTNFixedScheduler, TTNScheduler
+
+# pylint: disable=duplicate-code
+_LOGGER = logging.getLogger(__name__)
+
+PollCallback = Callable[[TTNClient, TTNClient.DATA_TYPE], Awaitable[None]]
+
+
+class TTNPoller:  # pylint: disable=too-many-instance-attributes
+    """Poll the storage integration of many applications concurrently.
+
+    All clients share one connection pool. At most max_concurrency storage
+    requests run at the same time, and at most max_host_concurrency per
+    hostname - clients waiting to retry a request do not hold a slot. Polls are
+    spread over the interval with random jitter to avoid bursts of requests.
+
+    An application failing to fetch or whose results fail in the callback is
+    logged and polled again at its next turn, without affecting the others.
+
+    Each application is scheduled by the scheduler returned by scheduler_factory -
+    by default a TTNFixedScheduler. Use TTNAdaptiveScheduler to follow the
+    cadence of the uplinks instead.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        jitter: float = DEFAULT_POLL_JITTER,
+        max_concurrency: int = DEFAULT_CONNECTION_LIMIT,
+        max_host_concurrency: int = DEFAULT_HOST_CONCURRENCY,
+        session: aiohttp.ClientSession | None = None,
+        scheduler_factory: Callable[[], TTNScheduler] | None = None,
+    ) -> None:
+        self.__interval = interval
+        self.__scheduler_factory = scheduler_factory or (
+            lambda: TTNFixedScheduler(interval, jitter)
+        )
+        self.__max_host_concurrency = max_host_concurrency
+        self.__semaphore = asyncio.Semaphore(max_concurrency)
+        self.__host_semaphores: dict[str, asyncio.Semaphore] = {}
+        self.__session = session
+        self.__owns_session = session is None
+        self.__max_concurrency = max_concurrency
+        self.__clients: list[TTNClient] = []
+
+    async def __aenter__(self) -> "TTNPoller":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the shared HTTP session if it was created by this poller."""
+        if self.__owns_session and self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    @property
+    def clients(self) -> list[TTNClient]:
+        """clients of the polled applications."""
+        return list(self.__clients)
+
+    def add_application(
+        self, hostname: str, application_id: str, access_key: str, **kwargs
+    ) -> TTNClient:
+        """Add an application to poll and return its client.
+
+        Additional keyword arguments are passed to TTNClient.
+        """
+
+        if self.__session is None:
+            self.__session = aiohttp.ClientSession(
+                timeout=DEFAULT_TIMEOUT,
+                connector=aiohttp.TCPConnector(limit=self.__max_concurrency),
+            )
+        client = TTNClient(
+            hostname,
+            application_id,
+            access_key,
+            session=self.__session,
+            request_limiter=lambda: self.__request_slot(hostname),
+            **kwargs,
+        )
+        self.__clients.append(client)
+        if hostname not in self.__host_semaphores:
+            self.__host_semaphores[hostname] = asyncio.Semaphore(
+                self.__max_host_concurrency
+            )
+        return client
+
+    async def run(self, callback: PollCallback) -> None:
+        """Poll all applications until cancelled and pass each result to callback."""
+
+        async with asyncio.TaskGroup() as task_group:
+            for client in self.__clients:
+                task_group.create_task(self.__poll_application(client, callback))
+
+    async def stream(self) -> AsyncIterator[tuple[TTNClient, TTNClient.DATA_TYPE]]:
+        """Poll all applications and yield the merged (client, data) results."""
+
+        queue: asyncio.Queue[tuple[TTNClient, TTNClient.DATA_TYPE]] = asyncio.Queue(
+            maxsize=len(self.__clients)
+        )
+
+        async def put(client: TTNClient, data: TTNClient.DATA_TYPE) -> None:
+            await queue.put((client, data))
+
+        task = asyncio.create_task(self.run(put))
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @asynccontextmanager
+    async def __request_slot(self, hostname: str) -> AsyncIterator[None]:
+        """Wait for a global and a per host slot to make a storage request."""
+        async with self.__semaphore, self.__host_semaphores[hostname]:
+            yield
+
+    async def __poll_application(
+        self, client: TTNClient, callback: PollCallback
+    ) -> None:
+        """Poll one application forever."""
+
+        scheduler = self.__scheduler_factory()
+        # Spread the first polls over the interval
+        await asyncio.sleep(random.uniform(0, self.__interval))
+        while True:
+            try:
+                data = await client.fetch_data()
+            except Exception:  # pylint: disable=broad-exception-caught
+                _LOGGER.exception(
+                    "Polling application %s failed", client.application_id
+                )
+                data = {}
+            if data:
+                try:
+                    await callback(client, data)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    _LOGGER.exception(
+                        "Callback of application %s failed", client.application_id
+                    )
+            try:
+                scheduler.record(data)
+                delay = scheduler.next_delay()
+            except Exception:  # pylint: disable=broad-exception-caught
+                _LOGGER.exception(
+                    "Scheduler of application %s failed", client.application_id
+                )
+                delay = self.__interval
+            await asyncio.sleep(delay)
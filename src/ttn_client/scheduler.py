@@ -0,0 +1,151 @@
+"""Poll schedulers for The Thinks Network client."""
+
+import random
+import time
+from typing import Protocol
+
+from .client import TTNClient
+from .const import (
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_POLL_JITTER,
+    SCHEDULER_GRACE,
+    SCHEDULER_MAX_INTERVAL,
+    SCHEDULER_MIN_INTERVAL,
+    SCHEDULER_SMOOTHING,
+)
+from .values import TTNBaseValue, TTNLazyValues
+
+_NS_PER_S = 1_000_000_000
+
+
+def _latest_received_at_ns(ttn_values: dict[str, TTNBaseValue]) -> int | None:
+    """Return the newest received_at of the values of a device, None if unknown.
+
+    Lazy values are not built to read their metadata.
+    """
+
+    if isinstance(ttn_values, TTNLazyValues):
+        metadata = ttn_values.iter_metadata()
+    else:
+        metadata = (ttn_value.metadata for ttn_value in ttn_values.values())
+    latest_ns = None
+    for value_metadata in metadata:
+        try:
+            received_at_ns = value_metadata.received_at_ns
+        except KeyError:
+            # Uplink without received_at
+            continue
+        if latest_ns is None or received_at_ns > latest_ns:
+            latest_ns = received_at_ns
+    return latest_ns
+
+
+class TTNScheduler(Protocol):
+    """Decides when an application is polled next."""
+
+    def record(self, data: TTNClient.DATA_TYPE) -> None:
+        """Record the result of a poll."""
+
+    def next_delay(self) -> float:
+        """Return the seconds to wait until the next poll."""
+
+
+class TTNFixedScheduler:
+    """Poll at a fixed interval with random jitter."""
+
+    def __init__(
+        self,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        jitter: float = DEFAULT_POLL_JITTER,
+    ) -> None:
+        self.__interval = interval
+        self.__jitter = jitter
+
+    def record(self, data: TTNClient.DATA_TYPE) -> None:
+        """Record the result of a poll."""
+
+    def next_delay(self) -> float:
+        """Return the seconds to wait until the next poll."""
+        return self.__interval * random.uniform(1 - self.__jitter, 1 + self.__jitter)
+
+
+class TTNAdaptiveScheduler:  # pylint: disable=too-many-instance-attributes
+    """Poll shortly after the next uplink of the application is expected.
+
+    The interval between uplinks of each device is estimated from received_at
+    (exponentially smoothed). The next poll is planned grace seconds after the
+    earliest expected uplink. When no uplink is expected anymore, the
+    application is considered quiet and the delay doubles after each empty poll.
+    All delays are kept between min_interval and max_interval.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        initial_interval: float = DEFAULT_POLL_INTERVAL,
+        min_interval: float = SCHEDULER_MIN_INTERVAL,
+        max_interval: float = SCHEDULER_MAX_INTERVAL,
+        grace: float = SCHEDULER_GRACE,
+        smoothing: float = SCHEDULER_SMOOTHING,
+    ) -> None:
+        self.__initial_interval = initial_interval
+        self.__min_interval = min_interval
+        self.__max_interval = max_interval
+        self.__grace = grace
+        self.__smoothing = smoothing
+        # device_id -> (last received_at in ns, smoothed interval in s)
+        self.__devices: dict[str, tuple[int, float | None]] = {}
+        self.__empty_polls = 0
+
+    def record(self, data: TTNClient.DATA_TYPE) -> None:
+        """Record the uplinks returned by a poll."""
+
+        if not data:
+            self.__empty_polls += 1
+            return
+        self.__empty_polls = 0
+
+        for device_id, ttn_values in data.items():
+            received_at_ns = _latest_received_at_ns(ttn_values)
+            if received_at_ns is None:
+                continue
+            last_ns, interval = self.__devices.get(device_id, (None, None))
+            if last_ns is not None and received_at_ns > last_ns:
+                gap = (received_at_ns - last_ns) / _NS_PER_S
+                if interval is not None:
+                    gap = interval + self.__smoothing * (gap - interval)
+                interval = gap
+            elif last_ns is not None:
+                received_at_ns = last_ns
+            self.__devices[device_id] = (received_at_ns, interval)
+
+    def expected_uplink_ns(self, now_ns: int | None = None) -> int | None:
+        """Return when the next uplink is expected, None if none is expected."""
+
+        if now_ns is None:
+            now_ns = time.time_ns()
+        grace_ns = self.__grace * _NS_PER_S
+        expected = [
+            last_ns + int(interval * _NS_PER_S)
+            for last_ns, interval in self.__devices.values()
+            if interval is not None
+        ]
+        upcoming = [
+            expected_ns for expected_ns in expected if expected_ns + grace_ns > now_ns
+        ]
+        return min(upcoming) if upcoming else None
+
+    def next_delay(self, now_ns: int | None = None) -> float:
+        """Return the seconds to wait until the next poll."""
+
+        if now_ns is None:
+            now_ns = time.time_ns()
+        if not any(interval for _, interval in self.__devices.values()):
+            # Cadence still unknown
+            delay = self.__initial_interval
+        elif (expected_ns := self.expected_uplink_ns(now_ns)) is not None:
+            delay = (expected_ns - now_ns) / _NS_PER_S + self.__grace
+        else:
+            # Quiet application
+            delay = self.__min_interval * 2**self.__empty_polls
+        return min(max(delay, self.__min_interval), self.__max_interval)
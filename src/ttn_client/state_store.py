@@ -0,0 +1,161 @@
+"""Persistent state for The Thinks Network client."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from .values import (
+    TTNBaseValue,
+    TTNBinarySensorValue,
+    TTNDeviceTrackerValue,
+    TTNSensorAttribute,
+    TTNSensorValue,
+    TTNUplinkMetadata,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+_VALUE_TYPES: dict[str, type[TTNBaseValue]] = {
+    value_type.__name__: value_type
+    for value_type in (
+        TTNBinarySensorValue,
+        TTNDeviceTrackerValue,
+        TTNSensorAttribute,
+        TTNSensorValue,
+    )
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursor (
+    hostname TEXT NOT NULL,
+    application_id TEXT NOT NULL,
+    received_at TEXT NOT NULL,
+    PRIMARY KEY (hostname, application_id)
+);
+CREATE TABLE IF NOT EXISTS value (
+    hostname TEXT NOT NULL,
+    application_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    field_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value TEXT NOT NULL,
+    received_at TEXT NOT NULL,
+    received_at_ns INTEGER NOT NULL,
+    PRIMARY KEY (hostname, application_id, device_id, field_id)
+);
+"""
+
+
+class TTNStateStore:
+    """SQLite store of the cursor and latest values of each application.
+
+    Given to TTNClient(state_store=...), it lets a restarted client resume with
+    an incremental fetch instead of downloading first_fetch_h hours again. One
+    store can be shared by the clients of many applications.
+
+    Restored values only keep the device_id and received_at of their uplink.
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self.__lock = threading.Lock()
+        # Used from the executor threads of asyncio.to_thread
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__connection:
+            self.__connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self.__lock:
+            self.__connection.close()
+
+    def load(
+        self, hostname: str, application_id: str
+    ) -> tuple[str | None, dict[str, dict[str, TTNBaseValue]]]:
+        """Return the cursor and latest values stored for an application."""
+
+        with self.__lock:
+            cursor_row = self.__connection.execute(
+                "SELECT received_at FROM cursor"
+                " WHERE hostname = ? AND application_id = ?",
+                (hostname, application_id),
+            ).fetchone()
+            value_rows = self.__connection.execute(
+                "SELECT device_id, field_id, type, value, received_at FROM value"
+                " WHERE hostname = ? AND application_id = ?"
+                " ORDER BY device_id, received_at_ns",
+                (hostname, application_id),
+            ).fetchall()
+
+        ttn_values: dict[str, dict[str, TTNBaseValue]] = {}
+        metadata: dict[tuple[str, str], TTNUplinkMetadata] = {}
+        for device_id, field_id, type_name, value, received_at in value_rows:
+            value_type = _VALUE_TYPES.get(type_name)
+            if value_type is None:
+                _LOGGER.debug(
+                    "Not restoring %s of unknown type %s", field_id, type_name
+                )
+                continue
+            # Share the metadata of the values of the same uplink
+            uplink_key = (device_id, received_at)
+            if uplink_key not in metadata:
+                metadata[uplink_key] = TTNUplinkMetadata(
+                    {
+                        "end_device_ids": {"device_id": device_id},
+                        "received_at": received_at,
+                    },
+                    retain_uplink=False,
+                )
+            ttn_values.setdefault(device_id, {})[field_id] = value_type(
+                metadata[uplink_key], field_id, json.loads(value)
+            )
+        return (cursor_row[0] if cursor_row else None), ttn_values
+
+    def save(
+        self,
+        hostname: str,
+        application_id: str,
+        cursor: str | None,
+        ttn_values: dict[str, dict[str, TTNBaseValue]],
+    ) -> None:
+        """Store the cursor and update the latest values of an application.
+
+        Values which cannot be stored (without received_at or not JSON
+        serializable) are skipped.
+        """
+
+        rows = []
+        for device_id, device_values in ttn_values.items():
+            for field_id, ttn_value in device_values.items():
+                try:
+                    rows.append(
+                        (
+                            hostname,
+                            application_id,
+                            device_id,
+                            field_id,
+                            type(ttn_value).__name__,
+                            json.dumps(ttn_value.value),
+                            ttn_value.metadata.raw_received_at,
+                            ttn_value.metadata.received_at_ns,
+                        )
+                    )
+                except (KeyError, TypeError, ValueError) as err:
+                    _LOGGER.debug("Not storing %s of %s: %r", field_id, device_id, err)
+        with self.__lock, self.__connection:
+            if cursor is not None:
+                self.__connection.execute(
+                    "INSERT OR REPLACE INTO cursor VALUES (?, ?, ?)",
+                    (hostname, application_id, cursor),
+                )
+            # Never replace a value by an older one
+            self.__connection.executemany(
+                "INSERT INTO value VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (hostname, application_id, device_id, field_id)"
+                " DO UPDATE SET type = excluded.type, value = excluded.value,"
+                " received_at = excluded.received_at,"
+                " received_at_ns = excluded.received_at_ns"
+                " WHERE excluded.received_at_ns >= value.received_at_ns",
+                rows,
+            )
@@ -0,0 +1,342 @@
+"""Decoding and parsing of the storage integration streams."""
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from concurrent.futures import Executor
+import logging
+import time
+
+from .const import EXECUTOR_BATCH_SIZE, EXECUTOR_PENDING_BATCHES
+from .diagnostics import TTNDiagnostics
+from .json_decoder import JSONLoads
+from .metrics import TTNMetrics
+from .parsers import ttn_parse, uplink_parser
+from .values import TTNBaseValue
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """Statistics of a storage integration request reported to TTNMetrics.
+
+    Only collected for clients with metrics: the hot path does not time or count
+    anything otherwise.
+    """
+
+    __slots__ = (
+        "size",
+        "lines",
+        "decode_duration",
+        "parsers",
+        "skipped",
+        "start",
+        "first_byte",
+    )
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.size = 0
+        self.lines = 0
+        self.decode_duration = 0.0
+        # uplinks, values and duration of each parser
+        self.parsers: dict[str, list] = {}
+        self.skipped: dict[str, int] = {}
+        # perf_counter when the request was sent
+        self.start = start
+        self.first_byte = False
+
+    def receive(
+        self, line: bytes, metrics: TTNMetrics | None, application_id: str
+    ) -> None:
+        """Count a line of the response."""
+        if not self.first_byte:
+            self.first_byte = True
+            if metrics is not None:
+                metrics.first_byte(application_id, time.perf_counter() - self.start)
+        self.size += len(line)
+
+    def decoded(self, duration: float) -> None:
+        """Count a decoded line."""
+        self.lines += 1
+        self.decode_duration += duration
+
+    def parse(
+        self, application_up: dict, retain_uplink: bool, diagnostics: TTNDiagnostics
+    ) -> dict[str, TTNBaseValue]:
+        """Parse an uplink with its parser and count the values and rejects."""
+        with diagnostics:
+            parser = uplink_parser(application_up)
+            parse_start = time.perf_counter()
+            ttn_output = parser(application_up, retain_uplink)
+            duration = time.perf_counter() - parse_start
+
+        name = getattr(parser, "__name__", repr(parser))
+        if name not in self.parsers:
+            self.parsers[name] = [0, 0, 0.0]
+        parser_stats = self.parsers[name]
+        parser_stats[0] += 1
+        parser_stats[1] += len(ttn_output)
+        parser_stats[2] += duration
+        return ttn_output
+
+    def skip(self, reason: str, count: int = 1) -> None:
+        """Count skipped entries."""
+        self.skipped[reason] = self.skipped.get(reason, 0) + count
+
+    def merge(self, other: "RequestStats") -> None:
+        """Add the decode and parse statistics of a batch."""
+        self.lines += other.lines
+        self.decode_duration += other.decode_duration
+        for name, (uplinks, values, duration) in other.parsers.items():
+            if name not in self.parsers:
+                self.parsers[name] = [0, 0, 0.0]
+            parser_stats = self.parsers[name]
+            parser_stats[0] += uplinks
+            parser_stats[1] += values
+            parser_stats[2] += duration
+        for reason, count in other.skipped.items():
+            self.skip(reason, count)
+
+    def report(self, metrics: TTNMetrics, application_id: str, duration: float) -> None:
+        """Report the statistics of the request."""
+        metrics.streamed(application_id, self.size, self.lines, duration)
+        metrics.decoded(application_id, self.lines, self.decode_duration)
+        for name, (uplinks, values, parse_duration) in self.parsers.items():
+            metrics.parsed(application_id, name, uplinks, values, parse_duration)
+        for reason, count in self.skipped.items():
+            metrics.skipped(application_id, reason, count)
+
+
+class StreamParser:  # pylint: disable=too-few-public-methods
+    """Decode and parse the lines of storage integration responses.
+
+    Lines are handled on the event loop unless an executor is given: they are
+    then handed to it in batches and the uplinks are yielded in order.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        application_id: str,
+        json_loads: JSONLoads,
+        *,
+        retain_uplink: bool,
+        executor: Executor | None,
+        diagnostics: TTNDiagnostics,
+        metrics: TTNMetrics | None,
+    ) -> None:
+        self.__application_id = application_id
+        self.__json_loads = json_loads
+        self.__retain_uplink = retain_uplink
+        self.__executor = executor
+        self.__diagnostics = diagnostics
+        self.__metrics = metrics
+
+    def parse(
+        self,
+        content: AsyncIterable[bytes],
+        accept: Callable[[dict], bool],
+        stats: RequestStats | None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Yield the device_id and values of the uplinks of a response.
+
+        Only the uplinks for which accept returns True are yielded. Decode and
+        parse statistics are added to stats if given.
+        """
+
+        if self.__executor is not None:
+            return self.__parse_in_executor(content, accept, stats)
+        return self.__parse_stream(content, accept, stats)
+
+    async def __parse_stream(  # pylint: disable=too-many-branches
+        self,
+        content: AsyncIterable[bytes],
+        accept: Callable[[dict], bool],
+        stats: RequestStats | None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Decode and parse the lines of a response on the event loop."""
+
+        debug = _LOGGER.isEnabledFor(logging.DEBUG)
+        async for application_up_raw in content:
+            if stats is not None:
+                stats.receive(application_up_raw, self.__metrics, self.__application_id)
+
+            # Skip empty lines not containing a result
+            if len(application_up_raw) < len("result"):
+                continue
+
+            if debug:
+                _LOGGER.debug("TTN entry: %s", application_up_raw)
+
+            # Parse line with json dictionary
+            if stats is None:
+                application_up_json = self.__json_loads(application_up_raw)
+            else:
+                decode_start = time.perf_counter()
+                application_up_json = self.__json_loads(application_up_raw)
+                stats.decoded(time.perf_counter() - decode_start)
+
+            if "result" not in application_up_json:
+                self.__diagnostics.report(
+                    _LOGGER,
+                    None,
+                    "no_result",
+                    "TTN entry without result: %s",
+                    application_up_json,
+                    level=logging.ERROR,
+                )
+                if stats is not None:
+                    stats.skip("no_result")
+                continue
+
+            application_up = application_up_json["result"]
+
+            if not accept(application_up):
+                if stats is not None:
+                    stats.skip("duplicate")
+                continue
+
+            # Get device_id and uplink_message from measurement
+            device_id = application_up["end_device_ids"]["device_id"]
+
+            if stats is None:
+                with self.__diagnostics:
+                    ttn_output = ttn_parse(application_up, self.__retain_uplink)
+            else:
+                ttn_output = stats.parse(
+                    application_up, self.__retain_uplink, self.__diagnostics
+                )
+
+            if not ttn_output:
+                if stats is not None:
+                    stats.skip("no_values")
+                continue
+
+            if debug:
+                _LOGGER.debug("TTN parsed values: %s", ttn_output)
+
+            yield device_id, ttn_output
+
+    async def __parse_in_executor(
+        self,
+        content: AsyncIterable[bytes],
+        accept: Callable[[dict], bool],
+        stats: RequestStats | None,
+    ) -> AsyncIterator[tuple[str, dict[str, TTNBaseValue]]]:
+        """Decode and parse batches of lines in the executor, yielding in order."""
+
+        assert self.__executor is not None
+        loop = asyncio.get_running_loop()
+        pending: deque[asyncio.Future[_ParsedBatch]] = deque()
+
+        def submit(batch: list[bytes]) -> None:
+            pending.append(
+                loop.run_in_executor(
+                    self.__executor,
+                    _parse_lines,
+                    batch,
+                    self.__json_loads,
+                    self.__retain_uplink,
+                    stats is not None,
+                )
+            )
+
+        def accepted(
+            batch_result: _ParsedBatch,
+        ) -> list[tuple[str, dict[str, TTNBaseValue]]]:
+            parsed, batch_stats, batch_diagnostics = batch_result
+            self.__diagnostics.merge(batch_diagnostics)
+            uplinks = []
+            for identity, device_id, ttn_output in parsed:
+                # Duplicates are dropped here as the history lives on the event loop
+                if not accept(identity):
+                    if batch_stats is not None:
+                        batch_stats.skip("duplicate")
+                elif not ttn_output:
+                    if batch_stats is not None:
+                        batch_stats.skip("no_values")
+                else:
+                    uplinks.append((device_id, ttn_output))
+            if stats is not None and batch_stats is not None:
+                stats.merge(batch_stats)
+            return uplinks
+
+        try:
+            batch: list[bytes] = []
+            async for application_up_raw in content:
+                if stats is not None:
+                    stats.receive(
+                        application_up_raw, self.__metrics, self.__application_id
+                    )
+                batch.append(application_up_raw)
+                if len(batch) >= EXECUTOR_BATCH_SIZE:
+                    submit(batch)
+                    batch = []
+                while pending and (
+                    pending[0].done() or len(pending) >= EXECUTOR_PENDING_BATCHES
+                ):
+                    for uplink in accepted(await pending.popleft()):
+                        yield uplink
+            if batch:
+                submit(batch)
+            while pending:
+                for uplink in accepted(await pending.popleft()):
+                    yield uplink
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# Identity, device_id and values of the uplinks, statistics and rejects
+_ParsedBatch = tuple[list[tuple[dict, str, dict]], RequestStats | None, TTNDiagnostics]
+
+
+def _parse_lines(
+    lines: list[bytes], json_loads: JSONLoads, retain_uplink: bool, with_stats: bool
+) -> _ParsedBatch:
+    """Decode and parse storage integration lines in an executor.
+
+    Returns the identity (device and received_at), device_id and values of each
+    uplink, the decode and parse statistics (if with_stats) and the rejects of
+    the batch.
+    """
+
+    parsed = []
+    stats = RequestStats() if with_stats else None
+    # Logged by the client once merged
+    diagnostics = TTNDiagnostics(defer_logs=True)
+    for application_up_raw in lines:
+        # Skip empty lines not containing a result
+        if len(application_up_raw) < len("result"):
+            continue
+
+        if stats is None:
+            application_up_json = json_loads(application_up_raw)
+        else:
+            decode_start = time.perf_counter()
+            application_up_json = json_loads(application_up_raw)
+            stats.decoded(time.perf_counter() - decode_start)
+        if "result" not in application_up_json:
+            diagnostics.report(
+                _LOGGER,
+                None,
+                "no_result",
+                "TTN entry without result: %s",
+                application_up_json,
+                level=logging.ERROR,
+            )
+            if stats is not None:
+                stats.skip("no_result")
+            continue
+
+        application_up = application_up_json["result"]
+        end_device_ids = application_up["end_device_ids"]
+        identity = {"end_device_ids": end_device_ids}
+        if "received_at" in application_up:
+            identity["received_at"] = application_up["received_at"]
+        if stats is None:
+            with diagnostics:
+                ttn_output = ttn_parse(application_up, retain_uplink)
+        else:
+            ttn_output = stats.parse(application_up, retain_uplink, diagnostics)
+        parsed.append((identity, end_device_ids["device_id"], ttn_output))
+    return parsed, stats, diagnostics
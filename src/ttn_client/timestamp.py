@@ -0,0 +1,43 @@
+"""Timestamp helpers for The Thinks Network client."""
+
+from datetime import datetime, timedelta, timezone
+
+_NS_PER_S = 1_000_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def timestamp_ns(value: str) -> int:
+    """Return the epoch nanoseconds of a TTN RFC 3339 timestamp.
+
+    TTN timestamps have nanosecond precision (2024-03-11T08:49:11.153738893Z),
+    which does not fit in a datetime, so the fraction is handled separately.
+    """
+
+    fraction_ns = 0
+    dot = value.find(".")
+    if dot != -1:
+        end = dot + 1
+        while end < len(value) and value[end].isdigit():
+            end += 1
+        fraction_ns = int(value[dot + 1 : end][:9].ljust(9, "0"))
+        value = value[:dot] + value[end:]
+
+    seconds = datetime.fromisoformat(value)
+    if seconds.tzinfo is None:
+        seconds = seconds.replace(tzinfo=timezone.utc)
+    return int(seconds.timestamp()) * _NS_PER_S + fraction_ns
+
+
+def ns_to_datetime(value_ns: int) -> datetime:
+    """Return the UTC datetime of epoch nanoseconds truncated to microseconds."""
+
+    return _EPOCH + timedelta(microseconds=value_ns // 1000)
+
+
+def format_timestamp(value: datetime) -> str:
+    """Return a datetime as a TTN RFC 3339 timestamp in UTC.
+
+    Naive datetimes are in local time, like datetime.now().
+    """
+
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
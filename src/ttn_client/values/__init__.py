@@ -4,4 +4,7 @@ from .attribute import TTNSensorAttribute  # noqa: F401
 from .base import TTNBaseValue  # noqa: F401
 from .binary_sensor import TTNBinarySensorValue  # noqa: F401
 from .device_tracker import TTNDeviceTrackerValue  # noqa: F401
+from .lazy import TTNLazyValues  # noqa: F401
+from .metadata import TTNUplinkMetadata  # noqa: F401
 from .sensor import TTNSensorValue  # noqa: F401
+from .series import TTNValueSeries  # noqa: F401
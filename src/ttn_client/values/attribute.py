@@ -16,6 +16,8 @@ class TTNSensorAttribute(TTNBaseValue):
     to their platform-specific concepts.
     """
 
+    __slots__ = ()
+
     @property
     def value(self) -> str:
         """Return the attribute value."""
@@ -2,19 +2,30 @@
 
 from datetime import datetime
 
+from .metadata import TTNUplinkMetadata
+
 
 class TTNBaseValue:
     """Represents a TTN sensor value and includes metadata from the uplink message."""
 
-    def __init__(self, uplink: dict, field_id: str, value) -> None:
-        self.__uplink = uplink
+    __slots__ = ("__metadata", "__field_id", "_value")
+
+    def __init__(self, uplink: dict | TTNUplinkMetadata, field_id: str, value) -> None:
+        if not isinstance(uplink, TTNUplinkMetadata):
+            uplink = TTNUplinkMetadata(uplink)
+        self.__metadata = uplink
         self.__field_id = field_id
         self._value = value
 
     @property
-    def uplink(self) -> dict:
-        """raw uplink message."""
-        return self.__uplink
+    def metadata(self) -> TTNUplinkMetadata:
+        """metadata of the uplink message shared with the other values."""
+        return self.__metadata
+
+    @property
+    def uplink(self) -> dict | None:
+        """raw uplink message - None if it was not retained."""
+        return self.__metadata.uplink
 
     @property
     def field_id(self) -> str:
@@ -29,13 +40,12 @@ class TTNBaseValue:
     @property
     def received_at(self) -> datetime:
         """the datetime the value was received."""
-        # Example: 2024-03-11T08:49:11.153738893Z
-        return datetime.fromisoformat(self.uplink["received_at"])
+        return self.__metadata.received_at
 
     @property
     def device_id(self) -> str:
         """device_id for this value."""
-        return self.uplink["end_device_ids"]["device_id"]
+        return self.__metadata.device_id
 
     def __repr__(self) -> str:
         return f"TTN_Value({self.value})"
@@ -6,6 +6,8 @@ from .base import TTNBaseValue
 class TTNBinarySensorValue(TTNBaseValue):
     """Sensor of type bool."""
 
+    __slots__ = ()
+
     @property
     def value(self) -> bool:
         """the value itself."""
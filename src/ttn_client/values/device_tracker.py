@@ -1,12 +1,15 @@
 """Device Tracker value for The Thinks Network client."""
 
 from .base import TTNBaseValue
+from .metadata import TTNUplinkMetadata
 
 
 class TTNDeviceTrackerValue(TTNBaseValue):
     """Sensor of type gps."""
 
-    def __init__(self, uplink: dict, field_id: str, value) -> None:
+    __slots__ = ()
+
+    def __init__(self, uplink: dict | TTNUplinkMetadata, field_id: str, value) -> None:
         super().__init__(uplink, field_id, value)
         assert "latitude" in self.value
         assert "longitude" in self.value
@@ -0,0 +1,121 @@
+"""Lazily built values for The Thinks Network client."""
+
+from collections.abc import Iterator
+from typing import Any, cast
+
+from .base import TTNBaseValue
+from .metadata import TTNUplinkMetadata
+
+
+class TTNLazyValues(dict[str, TTNBaseValue]):
+    """Values of an uplink which are only built when accessed.
+
+    Behaves like dict[str, TTNBaseValue] but it can be created with pending
+    (factory, metadata, value) tuples instead of values: they keep a reference
+    to the decoded payload and factory(metadata, field_id, value) is only
+    called when the field is read, so consumers reading few fields of wide
+    payloads do not pay for the others. Checking keys, len, iter_metadata and
+    merging into other TTNLazyValues do not build any value; reading, values(), items() and
+    comparisons do. Copies and merges made before a field is read build their
+    own value for it.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> TTNBaseValue:
+        ttn_value: Any = dict.__getitem__(self, key)
+        if type(ttn_value) is tuple:  # pylint: disable=unidiomatic-typecheck
+            factory, metadata, value = ttn_value
+            ttn_value = factory(metadata, key, value)
+            dict.__setitem__(self, key, ttn_value)
+        return ttn_value
+
+    def __iter__(self):
+        # Also makes dict() and dict.update() use __getitem__
+        return dict.__iter__(self)
+
+    def __build_all(self) -> None:
+        dict.update(
+            self,
+            {
+                key: ttn_value[0](ttn_value[1], key, ttn_value[2])
+                for key, ttn_value in cast(Any, dict.items(self))
+                if type(ttn_value) is tuple  # pylint: disable=unidiomatic-typecheck
+            },
+        )
+
+    def iter_metadata(self) -> Iterator[TTNUplinkMetadata]:
+        """Yield the uplink metadata of each value without building it."""
+        for ttn_value in dict.values(self):
+            if type(ttn_value) is tuple:  # pylint: disable=unidiomatic-typecheck
+                yield ttn_value[1]
+            else:
+                yield ttn_value.metadata
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        self.__build_all()
+        return dict.values(self)
+
+    def items(self):
+        self.__build_all()
+        return dict.items(self)
+
+    def pop(self, key, *default):
+        if key in self:
+            ttn_value = self[key]
+            dict.pop(self, key)
+            return ttn_value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self.__build_all()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs) -> None:
+        for other in args:
+            if isinstance(other, TTNLazyValues):
+                # Keep the pending values of other pending
+                dict.update(self, dict.items(other))
+            else:
+                dict.update(self, other)
+        dict.update(self, **kwargs)
+
+    def copy(self) -> "TTNLazyValues":
+        return TTNLazyValues(dict.items(self))
+
+    def __ior__(self, other):  # type: ignore[override,misc]
+        self.update(other)
+        return self
+
+    def __or__(self, other):  # type: ignore[override]
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def __eq__(self, other) -> bool:
+        self.__build_all()
+        if isinstance(other, TTNLazyValues):
+            other.values()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        self.__build_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        return (TTNLazyValues, (dict(self.items()),))
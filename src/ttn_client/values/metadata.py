@@ -0,0 +1,62 @@
+"""Uplink metadata for The Thinks Network client."""
+
+from datetime import datetime
+
+from ..timestamp import ns_to_datetime, timestamp_ns
+
+
+class TTNUplinkMetadata:
+    """Metadata of an uplink message shared by all the values parsed from it.
+
+    The raw uplink is only kept when retain_uplink is set so that long-lived
+    values do not keep the whole message (rx_metadata, gateways...) alive.
+
+    received_at is parsed on first access and cached for all the values. Like
+    the raw uplink, its properties raise KeyError if the uplink has none.
+    """
+
+    __slots__ = (
+        "__device_id",
+        "__raw_received_at",
+        "__received_at_ns",
+        "__received_at",
+        "__uplink",
+    )
+
+    def __init__(self, uplink: dict, retain_uplink: bool = True) -> None:
+        self.__device_id: str = uplink["end_device_ids"]["device_id"]
+        self.__raw_received_at: str | None = uplink.get("received_at")
+        self.__received_at_ns: int | None = None
+        self.__received_at: datetime | None = None
+        self.__uplink = uplink if retain_uplink else None
+
+    @property
+    def device_id(self) -> str:
+        """device_id of the uplink."""
+        return self.__device_id
+
+    @property
+    def raw_received_at(self) -> str:
+        """received_at of the uplink as sent by TTN."""
+        if self.__raw_received_at is None:
+            raise KeyError("received_at")
+        return self.__raw_received_at
+
+    @property
+    def received_at_ns(self) -> int:
+        """received_at of the uplink in epoch nanoseconds."""
+        if self.__received_at_ns is None:
+            self.__received_at_ns = timestamp_ns(self.raw_received_at)
+        return self.__received_at_ns
+
+    @property
+    def received_at(self) -> datetime:
+        """received_at of the uplink as UTC datetime (microsecond precision)."""
+        if self.__received_at is None:
+            self.__received_at = ns_to_datetime(self.received_at_ns)
+        return self.__received_at
+
+    @property
+    def uplink(self) -> dict | None:
+        """raw uplink message if retained."""
+        return self.__uplink
@@ -6,6 +6,8 @@ from .base import TTNBaseValue
 class TTNSensorValue(TTNBaseValue):
     """Sensor of type str, int or float."""
 
+    __slots__ = ()
+
     @property
     def value(self) -> str | int | float:
         """the value itself."""
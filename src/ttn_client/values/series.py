@@ -0,0 +1,59 @@
+"""Value series for The Thinks Network client."""
+
+from array import array
+from collections.abc import Iterator
+
+
+class TTNValueSeries:
+    """All samples of a field of a device, stored column-wise.
+
+    Timestamps are epoch nanoseconds in an array("q"). Numeric values are stored
+    in an array("d") so both columns can be handed to numpy (np.frombuffer)
+    without copying. Series with non-numeric values fall back to a list.
+    """
+
+    __slots__ = ("__device_id", "__field_id", "__timestamps", "__values")
+
+    def __init__(self, device_id: str, field_id: str) -> None:
+        self.__device_id = device_id
+        self.__field_id = field_id
+        self.__timestamps = array("q")
+        self.__values: array | list = array("d")
+
+    @property
+    def device_id(self) -> str:
+        """device_id for this series."""
+        return self.__device_id
+
+    @property
+    def field_id(self) -> str:
+        """field_id represented by this series."""
+        return self.__field_id
+
+    @property
+    def timestamps(self) -> array:
+        """received_at of each sample in epoch nanoseconds."""
+        return self.__timestamps
+
+    @property
+    def values(self) -> array | list:
+        """the value of each sample."""
+        return self.__values
+
+    def append(self, received_at_ns: int, value) -> None:
+        """Add a sample at the end of the series."""
+        if isinstance(self.__values, array) and (
+            isinstance(value, bool) or not isinstance(value, (int, float))
+        ):
+            self.__values = self.__values.tolist()
+        self.__timestamps.append(received_at_ns)
+        self.__values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.__timestamps)
+
+    def __iter__(self) -> Iterator[tuple[int, object]]:
+        return zip(self.__timestamps, self.__values)
+
+    def __repr__(self) -> str:
+        return f"TTN_Series({self.__field_id}, {len(self)} samples)"
@@ -1,50 +1,74 @@
 """Fixtures."""
 
+import asyncio
 import json
 from unittest.mock import patch
+from urllib.parse import parse_qsl, urlsplit
 
 import pytest
+import pytest_asyncio
 
 import ttn_client
+from ttn_client import TTNConnectionError, TTNDiagnostics
+from ttn_client.diagnostics import _active
+from ttn_client.timestamp import timestamp_ns
+
+
+def build_uplink(device_id, received_at, **decoded_payload):
+    """Build a storage integration entry."""
+    return {
+        "result": {
+            "end_device_ids": {"device_id": device_id},
+            "received_at": received_at,
+            "uplink_message": {"decoded_payload": decoded_payload},
+        }
+    }
 
 
 @pytest.fixture
-def dummy_client():
+def uplink():
+    """Return a builder of storage integration entries."""
+    return build_uplink
+
+
+@pytest_asyncio.fixture
+async def dummy_client():
     """Test a basic connection to TTN."""
-    client = ttn_client.TTNClient(
+    async with ttn_client.TTNClient(
         hostname="eu1.cloud.thethings.network",
         application_id="home-assistant-casa",
         access_key="NNSXS.dummy",
-    )
-    assert client is not None
-    return client
+    ) as client:
+        assert client is not None
+        yield client
 
 
 class MockContent:
     """Mock ahttp response content."""
 
-    def __init__(self, data):
-        self._content = data
+    def __init__(self, lines):
+        self._lines = list(lines)
 
     def __aiter__(self):
         return self
 
     async def __anext__(self):
-        if self._content:
-            content = self._content
-            self._content = None
-            return content
-        else:
-            raise StopAsyncIteration
+        if self._lines:
+            line = self._lines.pop(0)
+            if isinstance(line, Exception):
+                raise line
+            return line
+        raise StopAsyncIteration
 
 
 class MockResponse:
     """Mock ahttp response."""
 
-    def __init__(self, data, status, reason):
+    def __init__(self, data, status, reason, headers=None):
         self.content = MockContent(data)
         self.status = status
         self.reason = reason
+        self.headers = headers or {}
 
     async def __aexit__(self, exc_type, exc, tb):
         pass
@@ -55,10 +79,158 @@ class MockResponse:
 
 @pytest.fixture
 def mock_aiohttp_client_session_get():
-    """Patch ahttp to respond with given content and status."""
+    """Patch ahttp to respond with given content and status.
+
+    A list of entries is streamed as one line per entry.
+    """
 
     def mock_get(data, status):
-        resp = MockResponse(json.dumps(data), status, reason=None)
-        return patch("ttn_client.client.aiohttp.ClientSession.get", return_value=resp)
+        entries = data if isinstance(data, list) else [data]
+        lines = [json.dumps(entry).encode() + b"\n" for entry in entries]
+        return patch(
+            "ttn_client.client.aiohttp.ClientSession.get",
+            autospec=True,
+            side_effect=lambda *args, **kwargs: MockResponse(
+                lines, status, reason=None
+            ),
+        )
+
+    return mock_get
+
+
+@pytest.fixture
+def mock_aiohttp_responses():
+    """Patch ahttp to answer each request with the next of the given responses.
+
+    Each response is a (data, status, headers) tuple. Entries of data are streamed
+    as one line each, except exceptions which are raised mid-stream.
+    """
+
+    def mock_get(*responses):
+        pending = [
+            MockResponse(
+                [
+                    (
+                        entry
+                        if isinstance(entry, Exception)
+                        else json.dumps(entry).encode()
+                    )
+                    for entry in data
+                ],
+                status,
+                reason=None,
+                headers=headers,
+            )
+            for data, status, headers in responses
+        ]
+        return patch(
+            "ttn_client.client.aiohttp.ClientSession.get",
+            autospec=True,
+            side_effect=lambda *args, **kwargs: pending.pop(0),
+        )
 
     return mock_get
+
+
+@pytest.fixture
+def mock_storage():
+    """Patch ahttp to serve the given storage integration entries.
+
+    Entries are filtered by the device of per-device requests and by the after
+    and before query parameters, both inclusive, and cut to the limit parameter.
+    Entries without received_at are served to every request.
+    """
+
+    def mock_get(entries):
+        def respond(_session, url, **_kwargs):
+            path = urlsplit(url).path.split("/")
+            if "devices" in path:
+                device_id = path[path.index("devices") + 1]
+                served = [
+                    entry
+                    for entry in entries
+                    if entry["result"]["end_device_ids"]["device_id"] == device_id
+                ]
+            else:
+                served = entries
+            params = dict(parse_qsl(urlsplit(url).query))
+            after_ns = timestamp_ns(params["after"]) if "after" in params else 0
+            before_ns = timestamp_ns(params.get("before", "9999-01-01T00:00:00Z"))
+            lines = [
+                json.dumps(entry).encode()
+                for entry in served
+                if "received_at" not in entry["result"]
+                or after_ns <= timestamp_ns(entry["result"]["received_at"]) <= before_ns
+            ]
+            if "limit" in params:
+                lines = lines[: int(params["limit"])]
+            return MockResponse(lines, 200, reason=None)
+
+        return patch(
+            "ttn_client.client.aiohttp.ClientSession.get",
+            autospec=True,
+            side_effect=respond,
+        )
+
+    return mock_get
+
+
+@pytest.fixture(autouse=True)
+def no_retry_backoff(monkeypatch):
+    """Retry failed storage requests without waiting."""
+    monkeypatch.setattr("ttn_client.client.RETRY_BACKOFF", 0)
+
+
+@pytest.fixture(autouse=True)
+def diagnostics():
+    """Count and rate limit the rejects of parsers used outside of a client per test."""
+    diagnostics = TTNDiagnostics()
+    token = _active.set(diagnostics)
+    yield diagnostics
+    _active.reset(token)
+
+
+class MockMQTTBroker:
+    """In-process stand-in for the TTN MQTT broker."""
+
+    def __init__(self):
+        self.connections = []
+        self._subscribers = []
+
+    async def transport(self, hostname, port, username, password, topic):
+        """Implement the MQTTTransport interface on top of the broker."""
+        queue = asyncio.Queue()
+        self.connections.append((hostname, port, username, password, topic))
+        self._subscribers.append(queue)
+        try:
+            while True:
+                payload = await queue.get()
+                if payload is None:
+                    raise TTNConnectionError("connection dropped")
+                yield payload
+        finally:
+            self._subscribers.remove(queue)
+
+    async def wait_connections(self, count):
+        """Wait until the broker has seen count connections."""
+        while len(self.connections) < count or not self._subscribers:
+            await asyncio.sleep(0)
+
+    def publish(self, message):
+        """Deliver a message to all connected subscribers."""
+        payload = (
+            message if isinstance(message, bytes) else json.dumps(message).encode()
+        )
+        for queue in self._subscribers:
+            queue.put_nowait(payload)
+
+    def disconnect(self):
+        """Drop all connected subscribers."""
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+
+@pytest.fixture
+def mqtt_broker():
+    """In-process MQTT broker stand-in."""
+    return MockMQTTBroker()
@@ -0,0 +1,111 @@
+"""Test Cayenne LPP decoder."""
+
+import base64
+
+import pytest
+
+from ttn_client.parsers import cayenne_lpp_decoder, default_parser
+
+
+def test_cayenne_lpp_matches_decoded_payload(default_valid):
+    """Test the frm_payload decodes to the fields of the server-side formatter."""
+    uplink_message = default_valid["data"]["uplink_message"]
+    decoded_payload = cayenne_lpp_decoder(
+        base64.b64decode(uplink_message["frm_payload"]), uplink_message["f_port"]
+    )
+    assert decoded_payload == {
+        field_id: uplink_message["decoded_payload"][field_id]
+        for field_id in (
+            "digital_in_1",
+            "analog_in_3",
+            "temperature_41",
+            "analog_in_42",
+            "analog_in_43",
+            "illuminance_44",
+        )
+    }
+
+
+def test_cayenne_lpp_data_types():
+    """Test every data type is decoded."""
+    payload = bytes.fromhex(
+        "0100ff"  # digital_in
+        "0201ff"  # digital_out
+        "0302fc18"  # analog_in
+        "040301f4"  # analog_out
+        "056400010000"  # generic
+        "066503e8"  # illuminance
+        "076601"  # presence
+        "0867ff9c"  # temperature
+        "096865"  # humidity
+        "0a7104d2fb2e0000"  # accelerometer
+        "0b732774"  # barometer
+        "0c74014a"  # voltage
+        "0d7503e8"  # current
+        "0e76000f4240"  # frequency
+        "0f7864"  # percentage
+        "1079ffec"  # altitude
+        "117d0190"  # concentration
+        "128003e8"  # power
+        "1382000003e8"  # distance
+        "1483000007d0"  # energy
+        "15840168"  # direction
+        "16856689e4c0"  # time
+        "178600640000ff38"  # gyrometer
+        "1887ff8000"  # colour
+        "19880772c7018ed4007918"  # gps
+        "1a8e01"  # switch
+    )
+    assert cayenne_lpp_decoder(memoryview(payload), 1) == {
+        "digital_in_1": 255,
+        "digital_out_2": 255,
+        "analog_in_3": -10.0,
+        "analog_out_4": 5.0,
+        "generic_5": 65536,
+        "illuminance_6": 1000,
+        "presence_7": 1,
+        "temperature_8": -10.0,
+        "humidity_9": 50.5,
+        "accelerometer_10": {"x": 1.234, "y": -1.234, "z": 0.0},
+        "barometer_11": 1010.0,
+        "voltage_12": 3.3,
+        "current_13": 1.0,
+        "frequency_14": 1000000,
+        "percentage_15": 100,
+        "altitude_16": -20,
+        "concentration_17": 400,
+        "power_18": 1000,
+        "distance_19": 1.0,
+        "energy_20": 2.0,
+        "direction_21": 360,
+        "time_22": 1720313024,
+        "gyrometer_23": {"x": 1.0, "y": 0.0, "z": -2.0},
+        "colour_24": {"r": 255, "g": 128, "b": 0},
+        "gps_25": {"latitude": 48.8135, "longitude": 10.2100, "altitude": 310.0},
+        "switch_26": 1,
+    }
+
+
+def test_cayenne_lpp_parsed_by_default_parser(default_valid):
+    """Test nested values get the layout of default_parser."""
+    uplink_data = default_valid["data"]
+    uplink_data["uplink_message"]["decoded_payload"] = cayenne_lpp_decoder(
+        bytes.fromhex("0a7104d2fb2e0000" "19880772c7018ed4007918"), 1
+    )
+    ttn_values = default_parser(uplink_data)
+    assert ttn_values["accelerometer_10_x"].value == 1.234
+    assert ttn_values["gps_25"].value["latitude"] == 48.8135
+
+
+@pytest.mark.parametrize(
+    ("payload", "error"),
+    [
+        ("01", "Truncated Cayenne LPP payload at byte 0"),
+        ("016700", "Truncated Cayenne LPP temperature_1"),
+        ("01ff00", "Unknown Cayenne LPP data type 255 at byte 1"),
+    ],
+)
+def test_cayenne_lpp_invalid(payload, error):
+    """Test invalid payloads are rejected."""
+    with pytest.raises(ValueError, match=error):
+        cayenne_lpp_decoder(bytes.fromhex(payload), 1)
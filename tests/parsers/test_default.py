@@ -1,16 +1,19 @@
 """Test default parser."""
 
+import copy
 import datetime
+import pickle
 import pytest
 
 from ttn_client import (
     TTNBaseValue,
     TTNBinarySensorValue,
     TTNDeviceTrackerValue,
+    TTNLazyValues,
     TTNSensorAttribute,
     TTNSensorValue,
 )
-from ttn_client.parsers import ttn_parse
+from ttn_client.parsers import default, ttn_parse
 
 
 def test_default_valid(default_valid):
@@ -110,6 +113,22 @@ def test_default_none_value(default_valid):
     assert len(ttn_values_with_none) == len(ttn_values) - 1
 
 
+def test_default_none_value_reported_once(default_valid, diagnostics, monkeypatch):
+    """Test null fields are reported once per uplink when the shape changes."""
+    monkeypatch.setattr(default, "_schemas", {})
+    uplink_data = default_valid["data"]
+    decoded_payload = uplink_data["uplink_message"]["decoded_payload"]
+    decoded_payload["digital_in_1"] = None
+    device_id = uplink_data["end_device_ids"]["device_id"]
+    ttn_parse(uplink_data)
+    assert diagnostics.counts == {(device_id, "null_value"): 1}
+
+    # The cached schema fails after the null field and the payload is parsed again
+    decoded_payload["raw"] = 1
+    ttn_parse(uplink_data)
+    assert diagnostics.counts == {(device_id, "null_value"): 2}
+
+
 def test_sensor_attr_parsed_as_attribute(default_sensor_attr):
     """Test _sensor_attr fields are parsed as TTNSensorAttribute."""
     ttn_values = ttn_parse(default_sensor_attr["data"])
@@ -185,3 +204,168 @@ def test_default_unexpected_value(default_valid):
         str(e_info.value)
         == "Unexpected type <class 'type'> for value: <class 'object'>"
     )
+
+
+def test_default_shared_metadata(default_valid):
+    """Test all values of an uplink share one slotted metadata object."""
+    uplink_data = default_valid["data"]
+    ttn_values = ttn_parse(uplink_data)
+
+    metadata = ttn_values["analog_in_3"].metadata
+    assert all(value.metadata is metadata for value in ttn_values.values())
+    assert metadata.device_id == "distance-03"
+    assert metadata.raw_received_at == "2024-07-06T09:19:21.381960868Z"
+    assert metadata.uplink is uplink_data
+    assert not hasattr(ttn_values["analog_in_3"], "__dict__")
+    assert not hasattr(metadata, "__dict__")
+
+
+def test_default_without_uplink_retention(default_valid):
+    """Test values can be parsed without keeping the raw uplink."""
+    ttn_values = ttn_parse(default_valid["data"], retain_uplink=False)
+
+    sensor_value = ttn_values["analog_in_3"]
+    assert sensor_value.uplink is None
+    assert sensor_value.device_id == "distance-03"
+    assert sensor_value.received_at == datetime.datetime(
+        2024, 7, 6, 9, 19, 21, 381960, tzinfo=datetime.timezone.utc
+    )
+
+
+def test_default_received_at_cached(default_valid):
+    """Test received_at is parsed once per uplink with nanosecond precision."""
+    ttn_values = ttn_parse(default_valid["data"])
+
+    metadata = ttn_values["analog_in_3"].metadata
+    assert metadata.received_at_ns == 1720257561381960868
+    received_at = ttn_values["analog_in_3"].received_at
+    assert received_at.tzinfo == datetime.timezone.utc
+    assert ttn_values["digital_in_1"].received_at is received_at
+
+
+def test_default_schema_cache(default_valid, monkeypatch):
+    """Test the compiled schema is reused while the payload shape is unchanged."""
+    monkeypatch.setattr(default, "_schemas", {})
+    uplink_data = default_valid["data"]
+    decoded_payload = uplink_data["uplink_message"]["decoded_payload"]
+    ttn_values = ttn_parse(uplink_data)
+    assert len(default._schemas) == 1
+    schema = next(iter(default._schemas.values()))
+
+    # Numbers switching between int and float keep the schema
+    decoded_payload["analog_in_3"] = 3
+    decoded_payload["accelerometer_77"]["y"] = 1
+    cached_values = ttn_parse(uplink_data)
+    assert next(iter(default._schemas.values())) is schema
+    assert list(cached_values) == list(ttn_values)
+    assert cached_values["analog_in_3"].value == 3
+    assert cached_values["accelerometer_77_y"].value == 1
+    assert isinstance(cached_values["gps_34"], TTNDeviceTrackerValue)
+    assert isinstance(cached_values["boolean_1"], TTNBinarySensorValue)
+    assert cached_values["raw"].value == ttn_values["raw"].value
+
+    # Changed types or nested keys are parsed again
+    decoded_payload["boolean_1"] = "on"
+    assert ttn_parse(uplink_data)["boolean_1"].value == "on"
+    decoded_payload["accelerometer_77"]["w"] = 2
+    assert ttn_parse(uplink_data)["accelerometer_77_w"].value == 2
+    decoded_payload["accelerometer_77"] = 5
+    assert ttn_parse(uplink_data)["accelerometer_77"].value == 5
+    decoded_payload["gps_34"] = {"lat": 48.7, "longitude": 9.1, "altitude": 500}
+    assert ttn_parse(uplink_data)["gps_34_lat"].value == 48.7
+    assert next(iter(default._schemas.values())) is not schema
+    assert len(default._schemas) == 1
+
+
+def test_default_schema_cache_sensor_attr(default_sensor_attr, monkeypatch):
+    """Test _sensor_attr entries are checked by the cached schema."""
+    monkeypatch.setattr(default, "_schemas", {})
+    uplink_data = default_sensor_attr["data"]
+    ttn_values = ttn_parse(uplink_data)
+    assert ttn_parse(uplink_data).keys() == ttn_values.keys()
+
+    sensor_attr = uplink_data["uplink_message"]["decoded_payload"]["_sensor_attr"]
+    sensor_attr["invalid_entry"] = {"unit": "%"}
+    assert ttn_parse(uplink_data)["_sensor_attr_invalid_entry_unit"].value == "%"
+
+
+def test_default_schema_cache_bounded(default_valid, monkeypatch):
+    """Test the number of compiled schemas is bounded."""
+    monkeypatch.setattr(default, "_schemas", {})
+    monkeypatch.setattr(default, "SCHEMA_CACHE_SIZE", 2)
+    uplink_data = default_valid["data"]
+    for device_id in ("dev1", "dev2", "dev3"):
+        uplink_data["end_device_ids"]["device_id"] = device_id
+        ttn_parse(uplink_data)
+    assert [key[0] for key in default._schemas] == ["dev2", "dev3"]
+
+
+def test_default_lazy_values(default_valid):
+    """Test values are only built when read."""
+    ttn_values = ttn_parse(default_valid["data"])
+    assert isinstance(ttn_values, TTNLazyValues)
+    assert "analog_in_3" in ttn_values
+    assert isinstance(dict.__getitem__(ttn_values, "analog_in_3"), tuple)
+
+    sensor_value = ttn_values["analog_in_3"]
+    assert ttn_values["analog_in_3"] is sensor_value
+    assert dict.__getitem__(ttn_values, "analog_in_3") is sensor_value
+    assert isinstance(dict.__getitem__(ttn_values, "digital_in_1"), tuple)
+    assert ttn_values.get("digital_in_1").value == 8
+    assert ttn_values.get("missing") is None
+
+    # Copies into plain dicts get the values
+    assert all(isinstance(value, TTNBaseValue) for value in dict(ttn_values).values())
+    assert {**ttn_values}.keys() == ttn_values.keys()
+
+
+def test_default_lazy_values_merge(default_valid):
+    """Test merging uplinks keeps the values pending with their own metadata."""
+    uplink_data = default_valid["data"]
+    first_values = ttn_parse(uplink_data)
+    uplink_data = copy.deepcopy(uplink_data)
+    uplink_data["received_at"] = "2024-07-06T09:20:21.381960868Z"
+    uplink_data["uplink_message"]["decoded_payload"] = {"analog_in_3": 4.2}
+    second_values = ttn_parse(uplink_data)
+
+    merged = first_values | second_values
+    assert isinstance(merged, TTNLazyValues)
+    assert isinstance(dict.__getitem__(merged, "analog_in_3"), tuple)
+    assert merged["analog_in_3"].value == 4.2
+    assert merged["analog_in_3"].received_at.minute == 20
+    assert merged["digital_in_1"].received_at.minute == 19
+    assert first_values["analog_in_3"].value == 3.1
+
+    first_values |= second_values
+    assert isinstance(dict.__getitem__(first_values, "digital_in_1"), tuple)
+    assert first_values.keys() == merged.keys()
+    # Copies made before reading build their own values
+    assert first_values["digital_in_1"] is not merged["digital_in_1"]
+
+    sensor_value = merged.pop("analog_in_3")
+    assert sensor_value.value == 4.2
+    assert merged.pop("analog_in_3", None) is None
+    assert merged.setdefault("digital_in_1").value == 8
+    merged.update({"analog_in_3": sensor_value}, raw=merged["raw"])
+    assert merged.setdefault("analog_in_3") is sensor_value
+    assert merged.setdefault("other", sensor_value) is sensor_value
+    assert isinstance(merged.popitem()[1], TTNBaseValue)
+
+
+def test_default_lazy_values_builtins(default_valid):
+    """Test comparisons, repr and pickling build the values."""
+    ttn_values = ttn_parse(default_valid["data"])
+    assert ttn_values != ttn_values.copy()
+    ttn_values.values()
+    other_values = ttn_values.copy()
+    assert isinstance(other_values, TTNLazyValues)
+    assert ttn_values == other_values
+    assert not ttn_values != other_values  # pylint: disable=unneeded-not
+    assert "TTN_Value(3.1)" in repr(ttn_values)
+
+    restored = pickle.loads(pickle.dumps(ttn_values))
+    assert isinstance(restored, TTNLazyValues)
+    assert restored.keys() == ttn_values.keys()
+    assert restored["analog_in_3"].value == 3.1
+    with pytest.raises(TypeError):
+        hash(ttn_values)
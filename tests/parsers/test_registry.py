@@ -0,0 +1,131 @@
+"""Test parser registry."""
+
+import pytest
+
+from ttn_client import TTNSensorValue
+from ttn_client.parsers import (
+    cayenne_lpp_decoder,
+    default_parser,
+    register_decoder,
+    register_parser,
+    resolve_decoder,
+    resolve_parser,
+    ttn_parse,
+    unregister_decoder,
+    unregister_parser,
+)
+from ttn_client.parsers.sensecap import sensecap_parser
+
+
+def brand_parser(uplink_data, retain_uplink=True):
+    """Parser registered for a brand."""
+    return {"parser": TTNSensorValue(uplink_data, "parser", "brand")}
+
+
+def model_parser(uplink_data, retain_uplink=True):
+    """Parser registered for a model."""
+    return {"parser": TTNSensorValue(uplink_data, "parser", "model")}
+
+
+@pytest.fixture
+def registered_parsers():
+    """Register custom parsers for the test."""
+    register_parser(brand_parser, brand_id="acme")
+    register_parser(model_parser, brand_id="acme", model_id="probe")
+    yield
+    unregister_parser(brand_parser)
+    unregister_parser(model_parser)
+
+
+def test_builtin_parsers():
+    """Test the builtin parsers are registered."""
+    assert resolve_parser(None, None, None) is default_parser
+    assert resolve_parser("sensecap", "s2120", "1.0") is sensecap_parser
+    assert resolve_parser("other", None, None) is default_parser
+
+
+def test_most_specific_parser(registered_parsers):
+    """Test the parser matching most version ids is used."""
+    assert resolve_parser("acme", "probe", "1.0") is model_parser
+    assert resolve_parser("acme", "other", "1.0") is brand_parser
+    assert resolve_parser("sensecap", "probe", "1.0") is sensecap_parser
+
+
+def test_unregister_parser(registered_parsers):
+    """Test cached resolutions are dropped when parsers change."""
+    assert resolve_parser("acme", "probe", None) is model_parser
+    unregister_parser(model_parser)
+    assert resolve_parser("acme", "probe", None) is brand_parser
+
+
+def test_ttn_parse_dispatch(default_valid, registered_parsers):
+    """Test ttn_parse uses the parser registered for the device."""
+    uplink_data = default_valid["data"]
+    assert "analog_in_3" in ttn_parse(uplink_data)
+
+    uplink_data["uplink_message"]["version_ids"] = {
+        "brand_id": "acme",
+        "model_id": "probe",
+    }
+    assert ttn_parse(uplink_data)["parser"].value == "model"
+
+    uplink_data["uplink_message"]["version_ids"]["model_id"] = "other"
+    assert ttn_parse(uplink_data)["parser"].value == "brand"
+
+
+def brand_decoder(payload, f_port):
+    """Payload decoder registered for a brand."""
+    return {"f_port": f_port, "size": len(payload)}
+
+
+@pytest.fixture
+def registered_decoders():
+    """Register payload decoders for the test."""
+    register_decoder(cayenne_lpp_decoder)
+    register_decoder(brand_decoder, brand_id="acme")
+    yield
+    unregister_decoder(cayenne_lpp_decoder)
+    unregister_decoder(brand_decoder)
+
+
+def test_no_builtin_decoders():
+    """Test payloads are only decoded locally when a decoder is registered."""
+    assert resolve_decoder(None, None, None) is None
+
+
+def test_most_specific_decoder(registered_decoders):
+    """Test the decoder matching most version ids is used."""
+    assert resolve_decoder(None, None, None) is cayenne_lpp_decoder
+    assert resolve_decoder("acme", "probe", "1.0") is brand_decoder
+    unregister_decoder(brand_decoder)
+    assert resolve_decoder("acme", "probe", "1.0") is cayenne_lpp_decoder
+
+
+def test_ttn_parse_frm_payload(default_valid, registered_decoders, caplog):
+    """Test uplinks without decoded_payload are decoded from frm_payload."""
+    uplink_data = default_valid["data"]
+    uplink_message = uplink_data["uplink_message"]
+    decoded_payload = uplink_message.pop("decoded_payload")
+    ttn_values = ttn_parse(uplink_data)
+    assert ttn_values["analog_in_3"].value == decoded_payload["analog_in_3"]
+    assert ttn_values["illuminance_44"].value == decoded_payload["illuminance_44"]
+    assert ttn_values["analog_in_3"].uplink["uplink_message"]["decoded_payload"]
+
+    # The decoder registered for the device is used
+    del uplink_message["decoded_payload"]
+    uplink_message["version_ids"] = {"brand_id": "acme"}
+    ttn_values = ttn_parse(uplink_data)
+    assert ttn_values["f_port"].value == 1
+    assert ttn_values["size"].value == 26
+
+    # Server-side decoded payloads are kept
+    uplink_message["decoded_payload"] = decoded_payload
+    assert "analog_in_3" in ttn_parse(uplink_data)
+
+    # Invalid payloads are reported and skipped
+    del uplink_message["decoded_payload"]
+    del uplink_message["version_ids"]
+    for frm_payload in ("AQ==", "not base64"):
+        uplink_message["frm_payload"] = frm_payload
+        assert not ttn_parse(uplink_data)
+    assert "Cannot decode frm_payload for device distance-03" in caplog.text
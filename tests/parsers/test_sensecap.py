@@ -1,8 +1,9 @@
 """Test sensecap parser."""
 
 import datetime
+import logging
 
-from ttn_client import TTNSensorValue, TTNBaseValue
+from ttn_client import TTNSensorAttribute, TTNSensorValue, TTNBaseValue
 from ttn_client.parsers import ttn_parse
 
 
@@ -151,7 +152,7 @@ def test_sensecap_t1000_mixed_format(sensecap_t1000_nested):
     flat_item = {
         "measurementId": "4097",
         "measurementValue": 25.5,
-        "type": "Air Temperature"
+        "type": "Air Temperature",
     }
     decoded_payload["messages"].append(flat_item)
 
@@ -164,3 +165,54 @@ def test_sensecap_t1000_mixed_format(sensecap_t1000_nested):
     # Verify flat item is also parsed
     assert "Air_Temperature_4097" in ttn_values
     assert ttn_values["Air_Temperature_4097"].value == 25.5
+
+
+def test_sensecap_measurement_attributes(sensecap_valid):
+    """Test known measurementIds get their unit and device class."""
+    ttn_values = ttn_parse(sensecap_valid["data"])
+
+    unit = ttn_values["_sensor_attr_Air_Temperature_4097_unit"]
+    assert isinstance(unit, TTNSensorAttribute)
+    assert unit.value == "°C"
+    assert ttn_values["_sensor_attr_Air_Temperature_4097_device_class"].value == (
+        "temperature"
+    )
+    assert ttn_values["_sensor_attr_battery_unit"].value == "%"
+    assert ttn_values["_sensor_attr_Wind_Direction_Sensor_4104_unit"].value == "°"
+    assert "_sensor_attr_Wind_Direction_Sensor_4104_device_class" not in ttn_values
+    assert not any("UV_Index_4190_" in field_id for field_id in ttn_values)
+
+
+def test_sensecap_zero_values(sensecap_valid, caplog):
+    """Test zero measurements are parsed and valid messages are not logged."""
+    with caplog.at_level(logging.WARNING):
+        ttn_values = ttn_parse(sensecap_valid["data"])
+    assert ttn_values["UV_Index_4190"].value == 0
+    assert ttn_values["Rain_Gauge_4113"].value == 0
+    assert not caplog.records
+
+    messages = sensecap_valid["data"]["uplink_message"]["decoded_payload"]["messages"]
+    messages[-1]["Battery(%)"] = 0
+    assert ttn_parse(sensecap_valid["data"])["battery"].value == 0
+
+
+def test_sensecap_measurement_lookup(sensecap_valid, caplog, diagnostics):
+    """Test measurements are named by id and invalid ones are logged."""
+    uplink_data = sensecap_valid["data"]
+    uplink_data["uplink_message"]["decoded_payload"]["messages"] = [
+        # Known ids keep their field id whatever the type
+        {"measurementId": 4097, "measurementValue": 21.5, "type": "Temperature"},
+        # Unknown ids are named after their type
+        {"measurementId": "4999", "measurementValue": 1, "type": "New Sensor"},
+        {"measurementId": "4999", "measurementValue": 1},
+        {"measurementId": "4097"},
+        "invalid",
+    ]
+    with caplog.at_level(logging.WARNING):
+        ttn_values = ttn_parse(uplink_data)
+    assert ttn_values["Air_Temperature_4097"].value == 21.5
+    assert ttn_values["New_Sensor_4999"].value == 1
+    # Rejects of the same device and reason are logged once
+    assert len(caplog.records) == 1
+    assert "ignored" in caplog.records[0].message
+    assert diagnostics.count("eui-2cf7f1c044300279", "ignored_message") == 3
@@ -1,8 +1,19 @@
 """Test TTN client."""
 
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import json
+import logging
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import aiohttp
 import pytest
 
 import ttn_client
+from ttn_client.timestamp import format_timestamp
 
 pytest_plugins = "pytest_asyncio"
 
@@ -42,3 +53,1107 @@ async def test_missing_result(dummy_client, mock_aiohttp_client_session_get):
 
     with mock_aiohttp_client_session_get({"missing_result": {}}, 200):
         await dummy_client.fetch_data()
+
+
+@pytest.mark.asyncio
+async def test_session_reused(dummy_client, mock_aiohttp_client_session_get):
+    """Test that consecutive fetches share one pooled session."""
+    with mock_aiohttp_client_session_get({}, 200) as mock_get:
+        await dummy_client.fetch_data()
+        await dummy_client.fetch_data()
+
+    assert mock_get.call_count == 2
+    session = mock_get.call_args_list[0].args[0]
+    assert mock_get.call_args_list[1].args[0] is session
+    assert not session.closed
+
+    await dummy_client.close()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_injected_session(mock_aiohttp_client_session_get):
+    """Test that an injected session is used but not closed by the client."""
+    async with aiohttp.ClientSession() as session:
+        async with ttn_client.TTNClient(
+            hostname="eu1.cloud.thethings.network",
+            application_id="home-assistant-casa",
+            access_key="NNSXS.dummy",
+            session=session,
+        ) as client:
+            with mock_aiohttp_client_session_get({}, 200) as mock_get:
+                await client.fetch_data()
+            assert mock_get.call_args.args[0] is session
+
+        assert not session.closed
+
+
+@pytest.mark.asyncio
+async def test_push(mqtt_broker, monkeypatch):
+    """Test uplinks received over MQTT are parsed and pushed."""
+    monkeypatch.setattr(ttn_client.client, "MQTT_RECONNECT_MIN_DELAY", 0)
+    pushed = asyncio.Queue()
+
+    async def push_callback(data):
+        await pushed.put(data)
+
+    client = ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="home-assistant-casa",
+        access_key="NNSXS.dummy",
+        push_callback=push_callback,
+        mqtt_transport=mqtt_broker.transport,
+    )
+    task = asyncio.create_task(client.run_push())
+    try:
+        await mqtt_broker.wait_connections(1)
+        assert mqtt_broker.connections[0] == (
+            "eu1.cloud.thethings.network",
+            8883,
+            "home-assistant-casa@ttn",
+            "NNSXS.dummy",
+            "v3/home-assistant-casa@ttn/devices/+/up",
+        )
+
+        # Messages without values or without uplink are not pushed
+        mqtt_broker.publish({"end_device_ids": {"device_id": "dummy"}})
+        # Malformed messages are skipped without ending push mode
+        mqtt_broker.publish(b"not json")
+        mqtt_broker.publish(
+            {"received_at": "2024-07-06T09:19:20Z", "uplink_message": {}}
+        )
+        mqtt_broker.publish(
+            {"end_device_ids": {"device_id": "dummy"}, "uplink_message": {}}
+        )
+        mqtt_broker.publish(
+            {
+                "end_device_ids": {"device_id": "dummy"},
+                "received_at": "2024-07-06T09:19:21.381960868Z",
+                "uplink_message": {"decoded_payload": {"voltage": 3.1}},
+            }
+        )
+        data = await pushed.get()
+        assert data["dummy"]["voltage"].value == 3.1
+        assert client.diagnostics.count(reason="invalid_message") == 2
+
+        # Redelivered uplinks are not pushed again
+        mqtt_broker.publish(
+            {
+                "end_device_ids": {"device_id": "dummy"},
+                "received_at": "2024-07-06T09:19:21.381960868Z",
+                "uplink_message": {"decoded_payload": {"voltage": 3.1}},
+            }
+        )
+
+        # Reconnect after the connection is lost
+        mqtt_broker.disconnect()
+        await mqtt_broker.wait_connections(2)
+        mqtt_broker.publish(
+            {
+                "end_device_ids": {"device_id": "dummy"},
+                "received_at": "2024-07-06T09:20:21.381960868Z",
+                "uplink_message": {"decoded_payload": {"voltage": 3.0}},
+            }
+        )
+        data = await pushed.get()
+        assert data["dummy"]["voltage"].value == 3.0
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_push_keeps_fetch_cursor(
+    mqtt_broker, mock_aiohttp_client_session_get, uplink
+):
+    """Test pushed uplinks do not skip the uplinks only stored by the server."""
+    pushed = asyncio.Queue()
+
+    async def push_callback(data):
+        await pushed.put(data)
+
+    client = ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="app",
+        access_key="NNSXS.dummy",
+        push_callback=push_callback,
+        mqtt_transport=mqtt_broker.transport,
+    )
+    task = asyncio.create_task(client.run_push())
+    try:
+        await mqtt_broker.wait_connections(1)
+        pushed_uplink = uplink("dev1", "2024-07-06T09:20:00Z", voltage=3.1)
+        mqtt_broker.publish(pushed_uplink["result"])
+        await pushed.get()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    # The first fetch still covers first_fetch_h and skips the pushed uplink
+    with mock_aiohttp_client_session_get(
+        [uplink("dev2", "2024-07-06T09:19:00Z", voltage=3.2), pushed_uplink], 200
+    ) as mock_get:
+        ttn_values = await client.fetch_data()
+    assert mock_get.call_args.args[1].endswith("?last=24h&order=received_at")
+    assert list(ttn_values) == ["dev2"]
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_push_closed_connection(monkeypatch):
+    """Test the client reconnects when the broker closes the connection."""
+    monkeypatch.setattr(ttn_client.client, "MQTT_RECONNECT_MIN_DELAY", 0)
+    connections = 0
+
+    async def transport(*_args):
+        nonlocal connections
+        connections += 1
+        if connections > 2:
+            raise asyncio.CancelledError
+        return
+        yield  # pylint: disable=unreachable
+
+    client = ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="home-assistant-casa",
+        access_key="NNSXS.dummy",
+        push_callback=AsyncMock(),
+        mqtt_transport=transport,
+    )
+    with pytest.raises(asyncio.CancelledError):
+        await client.run_push()
+    assert connections == 3
+
+
+@pytest.mark.asyncio
+async def test_push_without_callback(dummy_client):
+    """Test push mode requires a callback."""
+    with pytest.raises(ValueError):
+        await dummy_client.run_push()
+
+
+@pytest.mark.asyncio
+async def test_cursor(dummy_client, mock_aiohttp_client_session_get, uplink):
+    """Test incremental fetches continue after the newest uplink processed."""
+    with mock_aiohttp_client_session_get(
+        [
+            uplink("dev1", "2024-07-06T09:19:21.381960868Z", voltage=3.1),
+            uplink("dev2", "2024-07-06T09:19:22.100000000Z", voltage=3.2),
+        ],
+        200,
+    ) as mock_get:
+        ttn_values = await dummy_client.fetch_data()
+    assert mock_get.call_args.args[1].endswith("?last=24h&order=received_at")
+    assert set(ttn_values) == {"dev1", "dev2"}
+
+    # Uplinks at or before the cursor are not processed again
+    with mock_aiohttp_client_session_get(
+        [
+            uplink("dev1", "2024-07-06T09:19:21.381960868Z", voltage=3.1),
+            uplink("dev2", "2024-07-06T09:19:22.100000000Z", voltage=3.2),
+            uplink("dev1", "2024-07-06T09:19:22.100000000Z", voltage=3.0),
+            uplink("dev1", "2024-07-06T09:19:22.100000000Z", voltage=3.0),
+        ],
+        200,
+    ) as mock_get:
+        ttn_values = await dummy_client.fetch_data()
+    assert mock_get.call_args.args[1].endswith(
+        "?after=2024-07-06T09:19:22.100000000Z&order=received_at"
+    )
+    assert list(ttn_values) == ["dev1"]
+    assert ttn_values["dev1"]["voltage"].value == 3.0
+
+    with mock_aiohttp_client_session_get([], 200) as mock_get:
+        assert await dummy_client.fetch_data() == {}
+    assert mock_get.call_args.args[1].endswith(
+        "?after=2024-07-06T09:19:22.100000000Z&order=received_at"
+    )
+
+
+@pytest.mark.asyncio
+async def test_cursor_without_uplinks(dummy_client, mock_aiohttp_client_session_get):
+    """Test the fetch window is based on the last fetch until an uplink arrives."""
+    with mock_aiohttp_client_session_get([], 200) as mock_get:
+        await dummy_client.fetch_data()
+        await dummy_client.fetch_data()
+    assert "?last=24h" in mock_get.call_args_list[0].args[1]
+    assert "?last=60." in mock_get.call_args_list[1].args[1]
+
+
+@pytest.mark.asyncio
+async def test_cursor_history_bounded(
+    dummy_client, mock_aiohttp_client_session_get, monkeypatch, uplink
+):
+    """Test only the most recent uplink identities are remembered."""
+    monkeypatch.setattr(ttn_client.client, "DUPLICATE_HISTORY_SIZE", 1)
+    with mock_aiohttp_client_session_get(
+        [
+            uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+            uplink("dev2", "2024-07-06T09:19:21Z", voltage=3.2),
+            uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+        ],
+        200,
+    ):
+        ttn_values = await dummy_client.fetch_data()
+    assert set(ttn_values) == {"dev1", "dev2"}
+
+
+@pytest.mark.asyncio
+async def test_fetch_data_single_flight(
+    dummy_client, mock_aiohttp_client_session_get, uplink
+):
+    """Test concurrent fetch_data calls share one request and its result."""
+    with mock_aiohttp_client_session_get(
+        [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200
+    ) as mock_get:
+        first, second = await asyncio.gather(
+            dummy_client.fetch_data(), dummy_client.fetch_data()
+        )
+        assert mock_get.call_count == 1
+        assert first is second
+        assert first["dev1"]["voltage"].value == 3.1
+
+        # Later calls start a new fetch after the cursor
+        assert await dummy_client.fetch_data() == {}
+        assert mock_get.call_count == 2
+        assert "?after=2024-07-06T09:19:21Z" in mock_get.call_args.args[1]
+
+
+@pytest.mark.asyncio
+async def test_fetch_data_single_flight_cancel(
+    dummy_client, mock_aiohttp_client_session_get, uplink
+):
+    """Test cancelling one caller does not cancel the shared fetch."""
+    with mock_aiohttp_client_session_get(
+        [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200
+    ) as mock_get:
+        cancelled = asyncio.create_task(dummy_client.fetch_data())
+        waiting = asyncio.create_task(dummy_client.fetch_data())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        ttn_values = await waiting
+    assert cancelled.cancelled()
+    assert mock_get.call_count == 1
+    assert ttn_values["dev1"]["voltage"].value == 3.1
+
+
+@pytest.mark.asyncio
+async def test_fetch_data_single_flight_timeout(mock_aiohttp_responses, uplink):
+    """Test the values of a fetch whose callers timed out are not lost."""
+    requested = asyncio.Event()
+
+    @asynccontextmanager
+    async def slow_request():
+        await requested.wait()
+        yield
+
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        request_limiter=slow_request,
+    ) as client:
+        with mock_aiohttp_responses(
+            ([uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1, current=1)], 200, {}),
+            (
+                [
+                    uplink("dev1", "2024-07-06T09:19:22Z", voltage=3.2),
+                    uplink("dev2", "2024-07-06T09:19:22Z", voltage=3.0),
+                ],
+                200,
+                {},
+            ),
+            ([], 200, {}),
+        ) as mock_get:
+            with pytest.raises(TimeoutError):
+                await asyncio.wait_for(client.fetch_data(), 0.01)
+            # The orphaned fetch completes in the background
+            (orphaned,) = asyncio.all_tasks() - {asyncio.current_task()}
+            requested.set()
+            await orphaned
+            ttn_values = await client.fetch_data()
+            assert {
+                device_id: {field: value.value for field, value in values.items()}
+                for device_id, values in ttn_values.items()
+            } == {"dev1": {"voltage": 3.2, "current": 1}, "dev2": {"voltage": 3.0}}
+            assert not await client.fetch_data()
+            assert mock_get.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_data_single_flight_error(
+    dummy_client, mock_aiohttp_client_session_get
+):
+    """Test the error of a shared fetch is raised to every caller."""
+    with mock_aiohttp_client_session_get({}, 403) as mock_get:
+        results = await asyncio.gather(
+            dummy_client.fetch_data(),
+            dummy_client.fetch_data(),
+            return_exceptions=True,
+        )
+    assert mock_get.call_count == 1
+    assert all(isinstance(result, ttn_client.TTNAuthError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_iter_uplinks(dummy_client, mock_aiohttp_client_session_get, uplink):
+    """Test uplinks are yielded one by one."""
+    with mock_aiohttp_client_session_get(
+        [
+            uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+            uplink("dev1", "2024-07-06T09:19:22Z", voltage=3.0),
+        ],
+        200,
+    ):
+        uplinks = [
+            (device_id, ttn_output["voltage"].value)
+            async for device_id, ttn_output in dummy_client.iter_uplinks()
+        ]
+    assert uplinks == [("dev1", 3.1), ("dev1", 3.0)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_series(dummy_client, mock_aiohttp_client_session_get, uplink):
+    """Test every sample is kept as a columnar series."""
+    with mock_aiohttp_client_session_get(
+        [
+            uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1, state="on"),
+            uplink("dev2", "2024-07-06T09:19:21.5Z", voltage=2.0),
+            uplink("dev1", "2024-07-06T09:19:22Z", voltage=3, state=True),
+        ],
+        200,
+    ):
+        ttn_series = await dummy_client.fetch_series()
+
+    voltage = ttn_series["dev1"]["voltage"]
+    assert isinstance(voltage, ttn_client.TTNValueSeries)
+    assert voltage.device_id == "dev1"
+    assert voltage.field_id == "voltage"
+    assert len(voltage) == 2
+    assert voltage.timestamps.typecode == "q"
+    assert voltage.values.typecode == "d"
+    assert list(voltage) == [
+        (1720257561000000000, 3.1),
+        (1720257562000000000, 3.0),
+    ]
+    assert repr(voltage) == "TTN_Series(voltage, 2 samples)"
+
+    # Non-numeric values are kept as a list
+    assert ttn_series["dev1"]["state"].values == ["on", True]
+    assert list(ttn_series["dev2"]["voltage"].values) == [2.0]
+
+
+@pytest.mark.asyncio
+async def test_fetch_series_without_received_at(
+    dummy_client, mock_aiohttp_client_session_get, uplink
+):
+    """Test uplinks without received_at are left out of the series."""
+    entries = [
+        uplink("dev1", None, voltage=3.0),
+        uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+    ]
+    del entries[0]["result"]["received_at"]
+    with mock_aiohttp_client_session_get(entries, 200):
+        ttn_series = await dummy_client.fetch_series()
+    assert list(ttn_series["dev1"]["voltage"]) == [(1720257561000000000, 3.1)]
+
+
+@pytest.mark.asyncio
+async def test_without_uplink_retention(mock_aiohttp_client_session_get, uplink):
+    """Test the client can drop the raw uplink from parsed values."""
+    async with ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="home-assistant-casa",
+        access_key="NNSXS.dummy",
+        retain_uplink=False,
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200
+        ):
+            ttn_values = await client.fetch_data()
+    assert ttn_values["dev1"]["voltage"].uplink is None
+
+
+@pytest.mark.asyncio
+async def test_custom_json_loads(mock_aiohttp_client_session_get, uplink):
+    """Test storage entries are decoded with the given decoder."""
+    json_loads = MagicMock(side_effect=json.loads)
+    async with ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="home-assistant-casa",
+        access_key="NNSXS.dummy",
+        json_loads=json_loads,
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200
+        ):
+            ttn_values = await client.fetch_data()
+    assert ttn_values["dev1"]["voltage"].value == 3.1
+    json_loads.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_retry_server_error(dummy_client, mock_aiohttp_responses, uplink):
+    """Test server errors are retried."""
+    with mock_aiohttp_responses(
+        ([], 503, None),
+        ([uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200, None),
+    ) as mock_get:
+        ttn_values = await dummy_client.fetch_data()
+    assert mock_get.call_count == 2
+    assert ttn_values["dev1"]["voltage"].value == 3.1
+
+
+@pytest.mark.asyncio
+async def test_retry_rate_limit(
+    dummy_client, mock_aiohttp_responses, monkeypatch, uplink
+):
+    """Test rate limited requests wait as long as requested by Retry-After."""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr("ttn_client.client.asyncio.sleep", sleep)
+    with mock_aiohttp_responses(
+        ([], 429, {"Retry-After": "7"}),
+        ([], 429, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+        ([], 429, {"Retry-After": "soon"}),
+        ([uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200, None),
+    ):
+        ttn_values = await dummy_client.fetch_data()
+    # Dates in the past retry at once, invalid values use the backoff
+    assert delays == [7, 0, 0]
+    assert "dev1" in ttn_values
+
+    # Waits longer than RETRY_MAX_DELAY are left to the caller
+    with mock_aiohttp_responses(([], 429, {"Retry-After": "86400"})):
+        with pytest.raises(ttn_client.TTNRateLimitError) as err:
+            await dummy_client.fetch_data()
+    assert err.value.retry_after == 86400
+    assert delays == [7, 0, 0]
+
+
+@pytest.mark.asyncio
+async def test_retries_exhausted(mock_aiohttp_responses):
+    """Test the typed error is raised once the retries are exhausted."""
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", max_retries=1
+    ) as client:
+        with mock_aiohttp_responses(([], 500, None), ([], 502, None)) as mock_get:
+            with pytest.raises(ttn_client.TTNServerError) as err:
+                await client.fetch_data()
+        assert mock_get.call_count == 2
+        assert err.value.status == 502
+
+        with mock_aiohttp_responses(([], 429, None), ([], 429, None)):
+            with pytest.raises(ttn_client.TTNRateLimitError):
+                await client.fetch_data()
+
+        with mock_aiohttp_responses(
+            ([aiohttp.ClientPayloadError("truncated")], 200, None),
+            ([aiohttp.ClientPayloadError("truncated")], 200, None),
+        ):
+            with pytest.raises(ttn_client.TTNConnectionError):
+                await client.fetch_data()
+
+        # Authentication errors are not retried
+        with mock_aiohttp_responses(([], 401, None)) as mock_get:
+            with pytest.raises(ttn_client.TTNAuthError):
+                await client.fetch_data()
+        assert mock_get.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_resumes_stream(dummy_client, mock_aiohttp_responses, uplink):
+    """Test an interrupted stream resumes after the last uplink processed."""
+    with mock_aiohttp_responses(
+        (
+            [
+                uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+                aiohttp.ClientPayloadError("connection reset"),
+            ],
+            200,
+            None,
+        ),
+        (
+            [
+                uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+                uplink("dev2", "2024-07-06T09:19:22Z", voltage=3.2),
+            ],
+            200,
+            None,
+        ),
+    ) as mock_get:
+        uplinks = [device_id async for device_id, _ in dummy_client.iter_uplinks()]
+    assert uplinks == ["dev1", "dev2"]
+    assert mock_get.call_args_list[0].args[1].endswith("?last=24h&order=received_at")
+    assert (
+        mock_get.call_args_list[1]
+        .args[1]
+        .endswith("?after=2024-07-06T09:19:21Z&order=received_at")
+    )
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_keeps_cursor(dummy_client, mock_aiohttp_responses, uplink):
+    """Test the uplinks of a fetch which failed midway are fetched again."""
+    interrupted = [
+        uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+        aiohttp.ClientPayloadError("connection reset"),
+    ]
+    failure = [aiohttp.ClientPayloadError("connection reset")]
+    with mock_aiohttp_responses(
+        (interrupted, 200, None),
+        *[(failure, 200, None)] * 3,
+        ([uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200, None),
+        ([uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200, None),
+    ) as mock_get:
+        with pytest.raises(ttn_client.TTNConnectionError):
+            await dummy_client.fetch_data()
+
+        ttn_values = await dummy_client.fetch_data()
+        assert mock_get.call_args.args[1].endswith("?last=24h&order=received_at")
+        assert ttn_values["dev1"]["voltage"].value == 3.1
+
+        # Committed once the fetch completed
+        assert not await dummy_client.fetch_data()
+        assert mock_get.call_args.args[1].endswith(
+            "?after=2024-07-06T09:19:21Z&order=received_at"
+        )
+
+
+@pytest.mark.asyncio
+async def test_backfill(dummy_client, mock_storage, uplink):
+    """Test a backfill fetches windows concurrently and yields them in order."""
+    entries = [
+        uplink(f"dev{hour % 2}", f"2024-07-06T{hour:02}:00:00Z", voltage=hour)
+        for hour in range(12)
+    ]
+    with mock_storage(entries) as mock_get:
+        uplinks = [
+            (device_id, values["voltage"].value)
+            async for device_id, values in dummy_client.backfill(
+                datetime(2024, 7, 6, tzinfo=timezone.utc),
+                datetime(2024, 7, 6, 12, tzinfo=timezone.utc),
+                window=timedelta(hours=4),
+                max_concurrency=2,
+            )
+        ]
+    assert uplinks == [(f"dev{hour % 2}", hour) for hour in range(12)]
+    assert mock_get.call_count == 3
+    assert (
+        mock_get.call_args_list[0]
+        .args[1]
+        .endswith(
+            "?after=2024-07-06T00:00:00.000000Z"
+            "&before=2024-07-06T04:00:00.000000Z&order=received_at"
+        )
+    )
+
+    # The backfill does not move the fetch_data cursor
+    with mock_storage(entries) as mock_get:
+        await dummy_client.fetch_data()
+    assert mock_get.call_args.args[1].endswith("?last=24h&order=received_at")
+
+
+@pytest.mark.asyncio
+async def test_backfill_checkpoint(dummy_client, mock_storage, uplink):
+    """Test an interrupted backfill resumes from its checkpoint."""
+    entries = [
+        uplink("dev1", f"2024-07-06T{hour:02}:30:00Z", voltage=hour)
+        for hour in range(4)
+    ]
+    start = datetime(2024, 7, 6, tzinfo=timezone.utc)
+    end = datetime(2024, 7, 6, 4, tzinfo=timezone.utc)
+    checkpoint = set()
+
+    with mock_storage(entries):
+        async for _, values in dummy_client.backfill(
+            start, end, window=timedelta(hours=1), checkpoint=checkpoint
+        ):
+            if values["voltage"].value == 2:
+                break
+    assert checkpoint == {
+        (start, start + timedelta(hours=1)),
+        (start + timedelta(hours=1), start + timedelta(hours=2)),
+    }
+
+    with mock_storage(entries) as mock_get:
+        voltages = [
+            values["voltage"].value
+            async for _, values in dummy_client.backfill(
+                start, end, window=timedelta(hours=1), checkpoint=checkpoint
+            )
+        ]
+    assert voltages == [2, 3]
+    assert mock_get.call_count == 2
+    assert len(checkpoint) == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_type", [ThreadPoolExecutor, ProcessPoolExecutor])
+async def test_executor(
+    mock_aiohttp_client_session_get, monkeypatch, executor_type, uplink
+):
+    """Test decoding and parsing in an executor keeps the order and history."""
+    monkeypatch.setattr("ttn_client.stream.EXECUTOR_BATCH_SIZE", 2)
+    entries = [
+        uplink(f"dev{index % 3}", f"2024-07-06T09:19:{index:02}Z", voltage=index)
+        for index in range(7)
+    ]
+    with executor_type(max_workers=2) as executor:
+        async with ttn_client.TTNClient(
+            "eu1.cloud.thethings.network", "app", "NNSXS.dummy", executor=executor
+        ) as client:
+            with mock_aiohttp_client_session_get(
+                entries + [{}, {"missing_result": {}}], 200
+            ):
+                uplinks = [
+                    (device_id, values["voltage"].value, values["voltage"].received_at)
+                    async for device_id, values in client.iter_uplinks()
+                ]
+            assert uplinks == [
+                (
+                    f"dev{index % 3}",
+                    index,
+                    datetime(2024, 7, 6, 9, 19, index, tzinfo=timezone.utc),
+                )
+                for index in range(7)
+            ]
+
+            # Uplinks already processed are dropped
+            with mock_aiohttp_client_session_get(
+                entries[-2:] + [uplink("dev1", "2024-07-06T09:20:00Z", voltage=9)],
+                200,
+            ) as mock_get:
+                ttn_values = await client.fetch_data()
+            assert mock_get.call_args.args[1].endswith(
+                "?after=2024-07-06T09:19:06Z&order=received_at"
+            )
+            assert ttn_values["dev1"]["voltage"].value == 9
+            assert list(ttn_values) == ["dev1"]
+
+            # Pending batches are cancelled when the iteration stops early
+            with mock_aiohttp_client_session_get(
+                [
+                    uplink("dev1", f"2024-07-06T09:21:{index:02}Z", voltage=index)
+                    for index in range(20)
+                ],
+                200,
+            ):
+                async for _, values in client.iter_uplinks():
+                    assert values["voltage"].value == 0
+                    break
+
+
+@pytest.mark.asyncio
+async def test_server_side_filters(mock_storage, uplink):
+    """Test the device subset, field_mask and limit are sent to the storage API."""
+    entries = [
+        uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+        uplink("dev2", "2024-07-06T09:19:22Z", voltage=3.2),
+    ]
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        device_ids=["dev1", "dev2"],
+        field_mask=ttn_client.const.TTN_DECODED_FIELD_MASK,
+        limit=100,
+    ) as client:
+        with mock_storage(entries) as mock_get:
+            ttn_values = await client.fetch_data()
+        assert set(ttn_values) == {"dev1", "dev2"}
+
+        urls = [call.args[1] for call in mock_get.call_args_list]
+        field_mask = ",".join(ttn_client.const.TTN_DECODED_FIELD_MASK)
+        assert urls == [
+            "https://eu1.cloud.thethings.network/api/v3/as/applications/app/devices/"
+            f"{device_id}/packages/storage/uplink_message"
+            f"?last=24h&order=received_at&limit=100&field_mask={field_mask}"
+            for device_id in ("dev1", "dev2")
+        ]
+
+
+@pytest.mark.asyncio
+async def test_device_limit(mock_storage, uplink):
+    """Test a device cut by the limit is continued while others are ahead."""
+    entries = [
+        uplink(
+            "dev1" if index % 3 else "dev2",
+            f"2024-07-06T09:19:{index:02}Z",
+            voltage=index,
+        )
+        for index in range(30)
+    ]
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        device_ids=["dev1", "dev2"],
+        limit=3,
+    ) as client:
+        voltages = []
+        with mock_storage(entries):
+            for _ in range(15):
+                voltages += [
+                    values["voltage"].value async for _, values in client.iter_uplinks()
+                ]
+    assert sorted(voltages) == list(range(30))
+
+
+@pytest.mark.asyncio
+async def test_device_backfill_order(mock_storage, uplink):
+    """Test a backfill of several devices is yielded in received_at order."""
+    start = datetime(2024, 7, 6, 9, tzinfo=timezone.utc)
+    entries = [
+        uplink(
+            f"dev{index % 2}",
+            format_timestamp(start + timedelta(minutes=index)),
+            voltage=index,
+        )
+        for index in range(10)
+    ]
+    entries.append(uplink("dev1", None, voltage=-1))
+    del entries[-1]["result"]["received_at"]
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        device_ids=["dev0", "dev1"],
+    ) as client:
+        with mock_storage(entries):
+            voltages = [
+                values["voltage"].value
+                async for _, values in client.backfill(
+                    start, start + timedelta(hours=1)
+                )
+            ]
+    # Uplinks without received_at come first
+    assert voltages == [-1, *range(10)]
+
+
+@pytest.mark.asyncio
+async def test_changes_only(mock_aiohttp_client_session_get, uplink):
+    """Test fetch_data only returns the fields whose value changed."""
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", changes_only=True
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [
+                uplink("dev1", "2024-07-06T09:19:21Z", voltage=3, open=True),
+                uplink("dev2", "2024-07-06T09:19:22Z", voltage=3.2),
+            ],
+            200,
+        ):
+            ttn_values = await client.fetch_data()
+        assert {
+            device_id: list(device_values)
+            for device_id, device_values in ttn_values.items()
+        } == {"dev1": ["voltage", "open"], "dev2": ["voltage"]}
+
+        with mock_aiohttp_client_session_get(
+            [
+                uplink("dev1", "2024-07-06T09:20:21Z", voltage=3.0, open=True),
+                uplink("dev2", "2024-07-06T09:20:22Z", voltage=3.2),
+                uplink("dev1", "2024-07-06T09:21:21Z", voltage=3.0, open=False),
+            ],
+            200,
+        ):
+            ttn_values = await client.fetch_data()
+        assert list(ttn_values) == ["dev1"]
+        assert list(ttn_values["dev1"]) == ["open"]
+        assert ttn_values["dev1"]["open"].value is False
+
+
+@pytest.mark.asyncio
+async def test_push_changes_only(mqtt_broker):
+    """Test uplinks without changed values are not pushed."""
+    pushed = asyncio.Queue()
+
+    async def push_callback(data):
+        await pushed.put(data)
+
+    client = ttn_client.TTNClient(
+        hostname="eu1.cloud.thethings.network",
+        application_id="app",
+        access_key="NNSXS.dummy",
+        push_callback=push_callback,
+        mqtt_transport=mqtt_broker.transport,
+        changes_only=True,
+    )
+    task = asyncio.create_task(client.run_push())
+    try:
+        await mqtt_broker.wait_connections(1)
+        for received_at, voltage, rssi in (
+            ("2024-07-06T09:19:21Z", 3.1, -90),
+            ("2024-07-06T09:20:21Z", 3.1, -90),
+            ("2024-07-06T09:21:21Z", 3.1, -85),
+        ):
+            mqtt_broker.publish(
+                {
+                    "end_device_ids": {"device_id": "dev1"},
+                    "received_at": received_at,
+                    "uplink_message": {
+                        "decoded_payload": {"voltage": voltage, "rssi": rssi}
+                    },
+                }
+            )
+        assert list((await pushed.get())["dev1"]) == ["voltage", "rssi"]
+        assert list((await pushed.get())["dev1"]) == ["rssi"]
+        assert pushed.empty()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_backfill_until_now(dummy_client, mock_aiohttp_responses, uplink):
+    """Test a backfill until now resumes interrupted windows without duplicates."""
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    first = uplink("dev1", format_timestamp(start + timedelta(minutes=1)), voltage=1)
+    second = uplink("dev1", format_timestamp(start + timedelta(minutes=2)), voltage=2)
+    with mock_aiohttp_responses(
+        ([first, aiohttp.ClientPayloadError("connection reset")], 200, None),
+        ([first, second], 200, None),
+    ):
+        voltages = [
+            values["voltage"].value async for _, values in dummy_client.backfill(start)
+        ]
+    assert voltages == [1, 2]
+
+
+class RecordingMetrics(ttn_client.TTNMetrics):
+    """Record the calls of the metrics hooks."""
+
+    def __init__(self):
+        self.calls = []
+
+    def request(self, application_id, status, latency):
+        self.calls.append(("request", application_id, status))
+        assert latency >= 0
+
+    def first_byte(self, application_id, latency):
+        self.calls.append(("first_byte", application_id))
+        assert latency >= 0
+
+    def streamed(self, application_id, size, lines, duration):
+        self.calls.append(("streamed", application_id, size, lines))
+
+    def decoded(self, application_id, lines, duration):
+        self.calls.append(("decoded", application_id, lines))
+
+    def parsed(self, application_id, parser, uplinks, values, duration):
+        self.calls.append(("parsed", application_id, parser, uplinks, values))
+
+    def skipped(self, application_id, reason, count):
+        self.calls.append(("skipped", application_id, reason, count))
+
+    def retried(self, application_id, reason, delay):
+        self.calls.append(("retried", application_id, reason, delay))
+
+
+def test_metrics_noop():
+    """Test the default hooks do nothing."""
+    metrics = ttn_client.TTNMetrics()
+    metrics.request("app", 200, 0.1)
+    metrics.first_byte("app", 0.1)
+    metrics.streamed("app", 100, 1, 0.1)
+    metrics.decoded("app", 1, 0.1)
+    metrics.parsed("app", "default_parser", 1, 2, 0.1)
+    metrics.skipped("app", "duplicate", 1)
+    metrics.retried("app", "connection", 0.1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_type", [None, ThreadPoolExecutor])
+async def test_metrics(mock_aiohttp_responses, executor_type, uplink):
+    """Test the cost of each request is reported to the metrics hooks."""
+    metrics = RecordingMetrics()
+    entries = [
+        uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1, current=0.2),
+        uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1, current=0.2),
+        uplink("dev2", "2024-07-06T09:19:22Z"),
+        {"missing_result": {}},
+    ]
+    sensecap = uplink("dev3", "2024-07-06T09:19:23Z", valid=False)
+    sensecap["result"]["uplink_message"]["version_ids"] = {"brand_id": "sensecap"}
+    entries.append(sensecap)
+    size = sum(len(json.dumps(entry).encode()) for entry in entries)
+
+    executor = executor_type() if executor_type else None
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        metrics=metrics,
+        executor=executor,
+    ) as client:
+        with mock_aiohttp_responses(
+            ([], 503, None),
+            ([], 429, {"Retry-After": "0"}),
+            ([aiohttp.ClientPayloadError("connection reset")], 200, None),
+            (entries, 200, None),
+        ):
+            assert list(await client.fetch_data()) == ["dev1"]
+    if executor:
+        executor.shutdown()
+
+    assert [call for call in metrics.calls if call[0] == "retried"] == [
+        ("retried", "app", "server_error", 0),
+        ("retried", "app", "rate_limit", 0),
+        ("retried", "app", "connection", 0),
+    ]
+    # Calls of the successful request
+    calls = metrics.calls[-9:]
+    assert calls[:-3] == [
+        ("request", "app", 200),
+        ("first_byte", "app"),
+        ("streamed", "app", size, 5),
+        ("decoded", "app", 5),
+        # Duplicates are only dropped after parsing in the executor
+        ("parsed", "app", "default_parser", *((3, 4) if executor else (2, 2))),
+        ("parsed", "app", "sensecap_parser", 1, 0),
+    ]
+    assert sorted(calls[-3:]) == [
+        ("skipped", "app", "duplicate", 1),
+        ("skipped", "app", "no_result", 1),
+        ("skipped", "app", "no_values", 2),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_type", [None, ThreadPoolExecutor])
+async def test_without_metrics(
+    mock_aiohttp_client_session_get, monkeypatch, executor_type, uplink
+):
+    """Test nothing is timed per uplink when no metrics are reported."""
+    timings = 0
+    perf_counter = time.perf_counter
+
+    def counting_perf_counter():
+        nonlocal timings
+        timings += 1
+        return perf_counter()
+
+    monkeypatch.setattr("time.perf_counter", counting_perf_counter)
+    entries = [
+        uplink("dev1", f"2024-07-06T09:19:{index:02}Z", voltage=index)
+        for index in range(5)
+    ]
+    executor = executor_type() if executor_type else None
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", executor=executor
+    ) as client:
+        with mock_aiohttp_client_session_get(entries + [{}], 200):
+            ttn_values = await client.fetch_data()
+    if executor:
+        executor.shutdown()
+
+    assert ttn_values["dev1"]["voltage"].value == 4
+    # Only the start of the request
+    assert timings == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_type", [None, ThreadPoolExecutor])
+async def test_diagnostics(
+    mock_aiohttp_client_session_get, caplog, executor_type, uplink
+):
+    """Test parser rejects are counted per device and rate limited in the logs."""
+    entries = [
+        uplink(f"dev{index % 2}", f"2024-07-06T09:19:{index:02}Z", voltage=None)
+        for index in range(6)
+    ]
+    entries += [uplink("dev2", "2024-07-06T09:19:30Z"), {"missing_result": {}}]
+    del entries[-2]["result"]["uplink_message"]["decoded_payload"]
+
+    executor = executor_type() if executor_type else None
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", executor=executor
+    ) as client:
+        with mock_aiohttp_client_session_get(entries, 200):
+            assert await client.fetch_data() == {}
+    if executor:
+        executor.shutdown()
+
+    assert client.diagnostics.counts == {
+        ("dev0", "null_value"): 3,
+        ("dev1", "null_value"): 3,
+        ("dev2", "no_decoded_payload"): 1,
+        (None, "no_result"): 1,
+    }
+    # One warning per device and reason, then the summary of the fetch
+    assert len(caplog.messages) == 5
+    assert caplog.messages[-1] == (
+        "Uplinks of app rejected while parsing: null_value 6x (2 devices),"
+        " no_decoded_payload 1x (1 devices), no_result 1x (1 devices)"
+    )
+
+
+@pytest.mark.asyncio
+async def test_diagnostics_summary_rate_limited(
+    dummy_client, mock_aiohttp_client_session_get, caplog
+):
+    """Test the summary of rejects is a warning at most once per interval."""
+    with mock_aiohttp_client_session_get([{"missing_result": {}}], 200):
+        with caplog.at_level(logging.DEBUG, "ttn_client.client"):
+            await dummy_client.fetch_data()
+            await dummy_client.fetch_data()
+    assert [
+        record.levelno
+        for record in caplog.records
+        if record.message.startswith("Uplinks of")
+    ] == [logging.WARNING, logging.DEBUG]
+
+
+@pytest.mark.asyncio
+async def test_debug_logs(
+    dummy_client, mock_aiohttp_client_session_get, caplog, uplink
+):
+    """Test entries and parsed values are only logged at debug level."""
+    entries = [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)]
+    with mock_aiohttp_client_session_get(entries, 200):
+        await dummy_client.fetch_data()
+    assert not caplog.records
+
+    caplog.set_level(logging.DEBUG, "ttn_client.stream")
+    entries = [uplink("dev1", "2024-07-06T09:19:22Z", voltage=3.2)]
+    with mock_aiohttp_client_session_get(entries, 200):
+        await dummy_client.fetch_data()
+    assert [
+        message.split(":")[0]
+        for message in caplog.messages
+        if message.startswith("TTN ")
+    ] == ["TTN entry", "TTN parsed values"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor_type", [None, ThreadPoolExecutor])
+async def test_backfill_without_received_at(
+    mock_aiohttp_client_session_get, executor_type, uplink
+):
+    """Test entries without received_at do not abort a backfill."""
+    start = datetime.now(timezone.utc) - timedelta(hours=1)
+    entries = [
+        uplink("dev1", None, voltage=1),
+        uplink("dev1", format_timestamp(start + timedelta(minutes=1)), voltage=2),
+    ]
+    del entries[0]["result"]["received_at"]
+
+    executor = executor_type() if executor_type else None
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", executor=executor
+    ) as client:
+        with mock_aiohttp_client_session_get(entries, 200):
+            uplinks = [values async for _, values in client.backfill(start)]
+    if executor:
+        executor.shutdown()
+
+    assert [values["voltage"].value for values in uplinks] == [1, 2]
+    with pytest.raises(KeyError):
+        assert uplinks[0]["voltage"].metadata.received_at_ns
@@ -0,0 +1,160 @@
+"""Test diagnostics."""
+
+import contextvars
+import functools
+import logging
+import pickle
+
+from ttn_client import TTNDiagnostics
+from ttn_client import diagnostics as diagnostics_module
+from ttn_client.diagnostics import report
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def test_diagnostics_counts():
+    """Test rejects are counted per device and reason."""
+    diagnostics = TTNDiagnostics()
+    diagnostics.report(_LOGGER, "dev1", "null_value", "msg")
+    diagnostics.report(_LOGGER, "dev1", "null_value", "msg")
+    diagnostics.report(_LOGGER, "dev2", "null_value", "msg")
+    diagnostics.report(_LOGGER, None, "no_result", "msg")
+
+    assert diagnostics.counts == {
+        ("dev1", "null_value"): 2,
+        ("dev2", "null_value"): 1,
+        (None, "no_result"): 1,
+    }
+    assert diagnostics.count() == 4
+    assert diagnostics.count("dev1") == 2
+    assert diagnostics.count(reason="null_value") == 3
+    assert diagnostics.count("dev2", "no_result") == 0
+    assert diagnostics.fetch_summary() == {"null_value": (3, 2), "no_result": (1, 1)}
+    assert not diagnostics.fetch_summary()
+
+    diagnostics.report(_LOGGER, "dev1", "null_value", "msg")
+    diagnostics.clear()
+    assert not diagnostics.counts
+    assert not diagnostics.fetch_summary()
+
+
+def test_diagnostics_rate_limited(caplog, monkeypatch):
+    """Test each device and reason is logged at most once per interval."""
+    now = [1000.0]
+    monkeypatch.setattr("ttn_client.diagnostics.time.monotonic", lambda: now[0])
+    diagnostics = TTNDiagnostics(log_interval=60)
+
+    for device_id in ("dev1", "dev1", "dev1", "dev2"):
+        diagnostics.report(
+            _LOGGER, device_id, "null_value", "Null value for %s", device_id
+        )
+    diagnostics.report(_LOGGER, None, "no_result", "No result", level=logging.ERROR)
+    assert [(record.levelno, record.message) for record in caplog.records] == [
+        (logging.WARNING, "Null value for dev1"),
+        (logging.WARNING, "Null value for dev2"),
+        (logging.ERROR, "No result"),
+    ]
+
+    caplog.clear()
+    now[0] += 60
+    diagnostics.report(_LOGGER, "dev1", "null_value", "Null value for %s", "dev1")
+    assert caplog.messages == ["Null value for dev1 (2 similar messages suppressed)"]
+    assert diagnostics.count("dev1") == 4
+
+
+def test_diagnostics_devices_capped(caplog, monkeypatch):
+    """Test at most log_devices devices are logged per reason and interval."""
+    now = [1000.0]
+    monkeypatch.setattr("ttn_client.diagnostics.time.monotonic", lambda: now[0])
+    diagnostics = TTNDiagnostics(log_interval=60, log_devices=2)
+
+    for device_id in ("dev1", "dev2", "dev3", "dev4"):
+        diagnostics.report(
+            _LOGGER, device_id, "null_value", "Null value for %s", device_id
+        )
+    diagnostics.report(_LOGGER, "dev3", "no_result", "No result for %s", "dev3")
+    assert caplog.messages == [
+        "Null value for dev1",
+        "Null value for dev2",
+        "No result for dev3",
+    ]
+    assert diagnostics.count(reason="null_value") == 4
+
+    caplog.clear()
+    now[0] += 60
+    for device_id in ("dev3", "dev4", "dev1"):
+        diagnostics.report(
+            _LOGGER, device_id, "null_value", "Null value for %s", device_id
+        )
+    assert caplog.messages == [
+        "Null value for dev3 (1 similar messages suppressed)",
+        "Null value for dev4 (1 similar messages suppressed)",
+    ]
+
+
+def test_diagnostics_lazy_format(caplog):
+    """Test messages are only formatted when logged."""
+
+    class Payload:  # pylint: disable=too-few-public-methods
+        """Payload counting its formatting."""
+
+        formatted = 0
+
+        def __str__(self):
+            Payload.formatted += 1
+            return "payload"
+
+    diagnostics = TTNDiagnostics()
+    diagnostics.report(_LOGGER, "dev1", "ignored", "Ignored %s", Payload())
+    formatted = Payload.formatted
+    assert formatted
+    for _ in range(3):
+        diagnostics.report(_LOGGER, "dev1", "ignored", "Ignored %s", Payload())
+    assert Payload.formatted == formatted
+    assert caplog.messages == ["Ignored payload"]
+
+
+def test_diagnostics_deferred(caplog):
+    """Test executor batches keep samples which are logged when merged."""
+    batch = TTNDiagnostics(defer_logs=True)
+    with batch:
+        report(_LOGGER, "dev1", "null_value", "Null value for %s", "dev1")
+        report(_LOGGER, "dev1", "null_value", "Null value for %s", "dev1")
+        report(_LOGGER, "dev2", "no_messages", "No messages for %s", "dev2")
+    assert not caplog.records
+
+    diagnostics = TTNDiagnostics()
+    diagnostics.merge(pickle.loads(pickle.dumps(batch)))
+    assert diagnostics.counts == {("dev1", "null_value"): 2, ("dev2", "no_messages"): 1}
+    assert caplog.messages == [
+        "Null value for dev1 (1 similar messages suppressed)",
+        "No messages for dev2",
+    ]
+
+
+def test_diagnostics_active(diagnostics):
+    """Test report counts in the innermost active diagnostics."""
+    client_diagnostics = TTNDiagnostics()
+    with client_diagnostics:
+        report(_LOGGER, "dev1", "null_value", "msg")
+        with client_diagnostics:
+            report(_LOGGER, "dev1", "null_value", "msg")
+    report(_LOGGER, "dev2", "null_value", "msg")
+    assert client_diagnostics.counts == {("dev1", "null_value"): 2}
+    assert diagnostics.counts == {("dev2", "null_value"): 1}
+
+
+def test_diagnostics_default(monkeypatch):
+    """Test parsers outside of a client report to a diagnostics made on first use."""
+    default_diagnostics = diagnostics_module._default_diagnostics
+    monkeypatch.setattr(
+        diagnostics_module,
+        "_default_diagnostics",
+        functools.cache(default_diagnostics.__wrapped__),
+    )
+    context = contextvars.Context()
+    context.run(report, _LOGGER, "dev1", "null_value", "msg")
+    context.run(report, _LOGGER, "dev1", "null_value", "msg")
+    assert diagnostics_module._default_diagnostics().counts == {
+        ("dev1", "null_value"): 2
+    }
@@ -0,0 +1,44 @@
+"""Test JSON decoders."""
+
+import json
+import pathlib
+import sys
+
+import pytest
+
+from ttn_client.json_decoder import default_loads, storage_entry_loads
+
+
+def test_default_loads(monkeypatch):
+    """Test the fastest installed decoder is selected."""
+    orjson = pytest.importorskip("orjson")
+    assert default_loads() is orjson.loads
+
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    msgspec = pytest.importorskip("msgspec")
+    assert default_loads() == msgspec.json.decode
+
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    assert default_loads() is json.loads
+
+
+def test_storage_entry_loads():
+    """Test only the fields used by the parsers are decoded."""
+    pytest.importorskip("msgspec")
+    test_file = pathlib.Path(__file__).parent.joinpath(
+        "parsers", "test_data", "default_valid.json"
+    )
+    uplink_data = json.loads(test_file.read_text(encoding="utf-8"))["data"]
+    line = json.dumps({"result": uplink_data}).encode()
+
+    application_up = storage_entry_loads()(line)["result"]
+    assert application_up["end_device_ids"] == {"device_id": "distance-03"}
+    assert application_up["received_at"] == uplink_data["received_at"]
+    uplink_message = application_up["uplink_message"]
+    assert set(uplink_message) == {"decoded_payload", "f_port", "frm_payload"}
+    assert (
+        uplink_message["decoded_payload"]
+        == uplink_data["uplink_message"]["decoded_payload"]
+    )
+
+    assert storage_entry_loads()(b"{}") == {}
@@ -0,0 +1,116 @@
+"""Test MQTT transport."""
+
+import sys
+import types
+from unittest.mock import MagicMock
+
+import pytest
+
+from ttn_client import TTNAuthError, TTNConnectionError
+from ttn_client.mqtt import aiomqtt_transport
+
+
+class MockMqttError(Exception):
+    """Stand-in for aiomqtt.MqttError."""
+
+
+class MockMqttCodeError(MockMqttError):
+    """Stand-in for aiomqtt.MqttCodeError."""
+
+    def __init__(self, rc):
+        super().__init__(f"code {rc}")
+        self.rc = rc
+
+
+class MockMessages:
+    """Stand-in for the aiomqtt message iterator."""
+
+    def __init__(self, payloads, error):
+        self._payloads = list(payloads)
+        self._error = error
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._payloads:
+            return MagicMock(payload=self._payloads.pop(0))
+        if self._error:
+            raise self._error
+        raise StopAsyncIteration
+
+
+def mock_aiomqtt(payloads=(), error=None):
+    """Build a fake aiomqtt module."""
+    module = types.ModuleType("aiomqtt")
+    module.MqttError = MockMqttError
+    module.MqttCodeError = MockMqttCodeError
+    module.TLSParameters = MagicMock()
+    module.subscriptions = []
+
+    class Client:
+        """Stand-in for aiomqtt.Client."""
+
+        def __init__(self, hostname, **kwargs):
+            self.hostname = hostname
+            self.kwargs = kwargs
+            self.messages = MockMessages(payloads, error)
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            pass
+
+        async def subscribe(self, topic):
+            module.subscriptions.append(topic)
+
+    module.Client = Client
+    return module
+
+
+async def collect(topic="v3/app@ttn/devices/+/up"):
+    """Collect all payloads from the transport."""
+    return [
+        payload
+        async for payload in aiomqtt_transport(
+            "eu1.cloud.thethings.network", 8883, "app@ttn", "NNSXS.dummy", topic
+        )
+    ]
+
+
+@pytest.mark.asyncio
+async def test_aiomqtt_transport(monkeypatch):
+    """Test payloads are yielded from the subscribed topic."""
+    module = mock_aiomqtt([b"1", b"2"])
+    monkeypatch.setitem(sys.modules, "aiomqtt", module)
+    assert await collect() == [b"1", b"2"]
+    assert module.subscriptions == ["v3/app@ttn/devices/+/up"]
+
+
+@pytest.mark.asyncio
+async def test_aiomqtt_transport_errors(monkeypatch):
+    """Test aiomqtt errors are translated."""
+    monkeypatch.setitem(sys.modules, "aiomqtt", mock_aiomqtt(error=MockMqttError()))
+    with pytest.raises(TTNConnectionError):
+        await collect()
+
+    monkeypatch.setitem(
+        sys.modules, "aiomqtt", mock_aiomqtt(error=MockMqttCodeError(7))
+    )
+    with pytest.raises(TTNConnectionError):
+        await collect()
+
+    monkeypatch.setitem(
+        sys.modules, "aiomqtt", mock_aiomqtt(error=MockMqttCodeError(5))
+    )
+    with pytest.raises(TTNAuthError):
+        await collect()
+
+
+@pytest.mark.asyncio
+async def test_aiomqtt_missing(monkeypatch):
+    """Test a clear error is raised when aiomqtt is not installed."""
+    monkeypatch.setitem(sys.modules, "aiomqtt", None)
+    with pytest.raises(ImportError):
+        await collect()
@@ -0,0 +1,166 @@
+"""Test TTN poller."""
+
+import asyncio
+from unittest.mock import patch
+
+import aiohttp
+import pytest
+
+import ttn_client
+
+pytest_plugins = "pytest_asyncio"
+
+
+def application_ids(poller):
+    """Return the application_id of every client of the poller."""
+    return [client.application_id for client in poller.clients]
+
+
+@pytest.mark.asyncio
+async def test_poller_stream():
+    """Test results of all applications are merged in one stream."""
+    async with ttn_client.TTNPoller(interval=0.01) as poller:
+        poller.add_application("eu1.cloud.thethings.network", "app1", "NNSXS.1")
+        poller.add_application("nam1.cloud.thethings.network", "app2", "NNSXS.2")
+        assert application_ids(poller) == ["app1", "app2"]
+        clients = poller.clients
+
+        async def fetch_data(client):
+            return {client.application_id: {}}
+
+        with patch.object(ttn_client.TTNClient, "fetch_data", fetch_data):
+            received = set()
+            async for client, data in poller.stream():
+                assert client in clients
+                assert client.hostname.endswith(".cloud.thethings.network")
+                received |= set(data)
+                if received == {"app1", "app2"}:
+                    break
+
+
+class StorageResponse:
+    """Empty storage integration response taking delay seconds."""
+
+    def __init__(self, status=200, headers=None, delay=0.0, running=None):
+        self.content = self
+        self.status = status
+        self.reason = None
+        self.headers = headers or {}
+        self._delay = delay
+        # Counters of the requests in progress
+        self._running = running or {}
+
+    async def __aenter__(self):
+        for key in self._running:
+            self._running[key][0] += 1
+            self._running[key][1] = max(self._running[key])
+        await asyncio.sleep(self._delay)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for key in self._running:
+            self._running[key][0] -= 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+@pytest.mark.asyncio
+async def test_poller_concurrency():
+    """Test the global and per host concurrency limits of storage requests."""
+    # Requests in progress and their maximum
+    running = {"total": [0, 0], "eu1": [0, 0]}
+    requests = 0
+
+    def get(_session, url, **_kwargs):
+        nonlocal requests
+        requests += 1
+        keys = ["total"] + (["eu1"] if url.startswith("https://eu1/") else [])
+        return StorageResponse(delay=0.005, running={key: running[key] for key in keys})
+
+    async with ttn_client.TTNPoller(
+        interval=0.001, jitter=0, max_concurrency=3, max_host_concurrency=2
+    ) as poller:
+        for app in range(4):
+            poller.add_application("eu1", f"eu-{app}", "NNSXS.dummy")
+            poller.add_application("nam1", f"nam-{app}", "NNSXS.dummy")
+
+        with patch("ttn_client.client.aiohttp.ClientSession.get", get):
+            task = asyncio.create_task(poller.run(None))
+            while requests < 20:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    assert {key: maximum for key, (_, maximum) in running.items()} == {
+        "total": 3,
+        "eu1": 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_poller_backoff_releases_slot():
+    """Test an application waiting to retry does not hold its request slot."""
+    requests = []
+
+    def get(_session, url, **_kwargs):
+        application_id = url.split("/")[7]
+        requests.append(application_id)
+        if application_id == "limited" and requests.count("limited") == 1:
+            return StorageResponse(429, {"Retry-After": "60"})
+        return StorageResponse()
+
+    async with ttn_client.TTNPoller(
+        interval=0.001, jitter=0, max_concurrency=1, max_host_concurrency=1
+    ) as poller:
+        poller.add_application("eu1", "limited", "NNSXS.dummy")
+        poller.add_application("eu1", "working", "NNSXS.dummy")
+
+        with patch("ttn_client.client.aiohttp.ClientSession.get", get):
+            task = asyncio.create_task(poller.run(None))
+            while requests.count("working") < 3:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    # Only the first request of the rate limited application was made
+    assert requests.count("limited") == 1
+
+
+@pytest.mark.asyncio
+async def test_poller_errors(caplog):
+    """Test a failing application or callback does not stop the others."""
+    results = asyncio.Queue()
+
+    async def fetch_data(client):
+        if client.application_id == "broken":
+            raise ttn_client.TTNAuthError
+        return {"dev": {}}
+
+    async def callback(client, data):
+        if client.application_id == "rejected":
+            raise ValueError("rejected")
+        await results.put(client.application_id)
+
+    async with aiohttp.ClientSession() as session:
+        poller = ttn_client.TTNPoller(interval=0.001, session=session)
+        poller.add_application("eu1", "broken", "NNSXS.dummy")
+        poller.add_application("eu1", "rejected", "NNSXS.dummy")
+        poller.add_application("eu1", "working", "NNSXS.dummy")
+        with patch.object(ttn_client.TTNClient, "fetch_data", fetch_data):
+            task = asyncio.create_task(poller.run(callback))
+            assert await results.get() == "working"
+            assert await results.get() == "working"
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        await poller.close()
+        assert not session.closed
+
+    assert "Polling application broken failed" in caplog.text
+    assert "Callback of application rejected failed" in caplog.text
@@ -0,0 +1,175 @@
+"""Test poll schedulers."""
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+import ttn_client
+from ttn_client.parsers import ttn_parse
+from ttn_client.timestamp import timestamp_ns
+
+pytest_plugins = "pytest_asyncio"
+
+NS_PER_S = 1_000_000_000
+
+
+def poll_result(**received_at):
+    """Build the result of a poll with one value per device."""
+    return {
+        device_id: {
+            "voltage": ttn_client.TTNSensorValue(
+                {"end_device_ids": {"device_id": device_id}, "received_at": value},
+                "voltage",
+                3.1,
+            )
+        }
+        for device_id, value in received_at.items()
+    }
+
+
+def test_fixed_scheduler():
+    """Test the fixed scheduler jitters around the interval."""
+    scheduler = ttn_client.TTNFixedScheduler(100, 0.1)
+    scheduler.record({})
+    assert 90 <= scheduler.next_delay() <= 110
+
+
+def test_adaptive_scheduler():
+    """Test polls are planned after the next expected uplink."""
+    scheduler = ttn_client.TTNAdaptiveScheduler(
+        initial_interval=30, min_interval=10, max_interval=3600, grace=15
+    )
+    now = timestamp_ns("2024-07-06T10:00:00Z")
+    assert scheduler.next_delay(now) == 30
+    assert scheduler.expected_uplink_ns(now) is None
+
+    # dev1 reports every 10 minutes, dev2 every hour
+    scheduler.record(
+        poll_result(dev1="2024-07-06T09:40:00Z", dev2="2024-07-06T08:10:00Z")
+    )
+    assert scheduler.next_delay(now) == 30
+    scheduler.record(
+        poll_result(dev1="2024-07-06T09:50:00Z", dev2="2024-07-06T09:10:00Z")
+    )
+    scheduler.record({"dev3": {}})
+    assert scheduler.expected_uplink_ns(now) == now
+    assert scheduler.next_delay(now) == 15
+    assert scheduler.next_delay(now + 5 * NS_PER_S) == 10
+    assert scheduler.next_delay(now + 60 * NS_PER_S) == 540 + 15
+
+    # The interval is smoothed: 10min + 0.3 * (20min - 10min)
+    scheduler.record(poll_result(dev1="2024-07-06T10:10:00Z"))
+    later = timestamp_ns("2024-07-06T10:15:00Z")
+    assert scheduler.expected_uplink_ns(later) == timestamp_ns("2024-07-06T10:23:00Z")
+
+    # Values older than the last known uplink are ignored
+    scheduler.record(poll_result(dev1="2024-07-06T10:00:00Z"))
+    assert scheduler.expected_uplink_ns(later) == timestamp_ns("2024-07-06T10:23:00Z")
+
+    # Defaults to the current time
+    with patch("ttn_client.scheduler.time.time_ns", return_value=later):
+        assert scheduler.expected_uplink_ns() == timestamp_ns("2024-07-06T10:23:00Z")
+
+
+def test_adaptive_scheduler_quiet():
+    """Test quiet applications are polled less and less often."""
+    scheduler = ttn_client.TTNAdaptiveScheduler(min_interval=10, max_interval=100)
+    scheduler.record(poll_result(dev1="2024-07-06T09:40:00Z"))
+    scheduler.record(poll_result(dev1="2024-07-06T09:50:00Z"))
+    now = timestamp_ns("2024-07-06T12:00:00Z")
+    assert scheduler.next_delay(now) == 10
+    scheduler.record({})
+    assert scheduler.next_delay(now) == 20
+    scheduler.record({})
+    scheduler.record({})
+    assert scheduler.next_delay(now) == 80
+    scheduler.record({})
+    assert scheduler.next_delay(now) == 100
+    assert scheduler.next_delay() == 100
+
+
+def test_adaptive_scheduler_metadata():
+    """Test lazy values are not built and values without received_at are ignored."""
+    scheduler = ttn_client.TTNAdaptiveScheduler()
+    lazy_values = ttn_parse(
+        {
+            "end_device_ids": {"device_id": "dev1"},
+            "received_at": "2024-07-06T09:40:00Z",
+            "uplink_message": {"decoded_payload": {"voltage": 3.1, "current": 1}},
+        }
+    )
+    assert isinstance(lazy_values, ttn_client.TTNLazyValues)
+    scheduler.record(
+        {
+            "dev1": lazy_values,
+            "dev2": {
+                "voltage": ttn_client.TTNSensorValue(
+                    {"end_device_ids": {"device_id": "dev2"}}, "voltage", 3.1
+                )
+            },
+        }
+    )
+    assert all(type(value) is tuple for value in dict.values(lazy_values))
+    # Built and pending values share the metadata of the uplink
+    assert lazy_values["voltage"].value == 3.1
+    assert list(lazy_values.iter_metadata()) == [lazy_values["voltage"].metadata] * 2
+
+    scheduler.record(poll_result(dev1="2024-07-06T09:50:00Z"))
+    assert scheduler.expected_uplink_ns(0) == timestamp_ns("2024-07-06T10:00:00Z")
+
+
+@pytest.mark.asyncio
+async def test_poller_scheduler():
+    """Test the poller uses the given scheduler."""
+    scheduler = ttn_client.TTNFixedScheduler(0.001, 0)
+    recorded = asyncio.Queue()
+
+    def record(data):
+        recorded.put_nowait(data)
+
+    async def fetch_data(client):
+        return {}
+
+    async with ttn_client.TTNPoller(
+        interval=0.001, scheduler_factory=lambda: scheduler
+    ) as poller:
+        poller.add_application("eu1", "app", "NNSXS.dummy")
+        with (
+            patch.object(scheduler, "record", record),
+            patch.object(ttn_client.TTNClient, "fetch_data", fetch_data),
+        ):
+            task = asyncio.create_task(poller.run(None))
+            assert await recorded.get() == {}
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+
+@pytest.mark.asyncio
+async def test_poller_scheduler_error(caplog):
+    """Test a failing scheduler does not stop polling its application."""
+    recorded = asyncio.Queue()
+
+    class FailingScheduler(ttn_client.TTNFixedScheduler):
+        """Scheduler failing to record every poll."""
+
+        def record(self, data):
+            recorded.put_nowait(data)
+            raise KeyError("received_at")
+
+    async def fetch_data(client):
+        return {}
+
+    async with ttn_client.TTNPoller(
+        interval=0.001, scheduler_factory=lambda: FailingScheduler(0.001, 0)
+    ) as poller:
+        poller.add_application("eu1", "app", "NNSXS.dummy")
+        with patch.object(ttn_client.TTNClient, "fetch_data", fetch_data):
+            task = asyncio.create_task(poller.run(None))
+            assert await recorded.get() == {}
+            assert await recorded.get() == {}
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+    assert "Scheduler of application app failed" in caplog.text
@@ -0,0 +1,234 @@
+"""Test the persistent state store."""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+import ttn_client
+from ttn_client import (
+    TTNBinarySensorValue,
+    TTNDeviceTrackerValue,
+    TTNSensorValue,
+    TTNStateStore,
+)
+
+pytest_plugins = "pytest_asyncio"
+
+
+def test_save_and_load(tmp_path):
+    """Test values are restored with their type and received_at."""
+    metadata = {"end_device_ids": {"device_id": "dev1"}}
+    older = metadata | {"received_at": "2024-07-06T09:19:21.381960868Z"}
+    newer = metadata | {"received_at": "2024-07-06T09:20:00Z"}
+
+    store = TTNStateStore(tmp_path / "state.db")
+    store.save(
+        "eu1",
+        "app",
+        "2024-07-06T09:20:00Z",
+        {
+            "dev1": {
+                "voltage": TTNSensorValue(newer, "voltage", 3.1),
+                "open": TTNBinarySensorValue(older, "open", True),
+                "gps": TTNDeviceTrackerValue(
+                    older, "gps", {"latitude": 1.5, "longitude": 2.5}
+                ),
+            }
+        },
+    )
+    # Older values do not replace newer ones
+    store.save(
+        "eu1", "app", None, {"dev1": {"voltage": TTNSensorValue(older, "voltage", 2)}}
+    )
+    store.close()
+
+    store = TTNStateStore(tmp_path / "state.db")
+    cursor, ttn_values = store.load("eu1", "app")
+    assert cursor == "2024-07-06T09:20:00Z"
+    assert ttn_values["dev1"]["voltage"].value == 3.1
+    assert (
+        ttn_values["dev1"]["voltage"].metadata.raw_received_at == newer["received_at"]
+    )
+    assert isinstance(ttn_values["dev1"]["open"], TTNBinarySensorValue)
+    assert ttn_values["dev1"]["open"].value is True
+    assert ttn_values["dev1"]["gps"].latitude == 1.5
+    assert ttn_values["dev1"]["open"].metadata is ttn_values["dev1"]["gps"].metadata
+    assert ttn_values["dev1"]["open"].uplink is None
+
+    assert store.load("eu1", "other") == (None, {})
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_warm_start(tmp_path, mock_aiohttp_client_session_get, uplink):
+    """Test a restarted client restores its values and fetches only newer uplinks."""
+    store = TTNStateStore(tmp_path / "state.db")
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", state_store=store
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [
+                uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1),
+                uplink("dev2", "2024-07-06T09:19:22Z", voltage=3.2),
+            ],
+            200,
+        ):
+            await client.fetch_data()
+
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", state_store=store
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [uplink("dev1", "2024-07-06T09:19:30Z", voltage=3.0)], 200
+        ) as mock_get:
+            ttn_values = await client.fetch_data()
+        assert mock_get.call_args.args[1].endswith(
+            "?after=2024-07-06T09:19:22Z&order=received_at"
+        )
+        assert ttn_values["dev1"]["voltage"].value == 3.0
+        assert ttn_values["dev2"]["voltage"].value == 3.2
+
+        # Stored values are only returned by the first fetch
+        with mock_aiohttp_client_session_get([], 200):
+            assert await client.fetch_data() == {}
+
+    _, ttn_values = store.load("eu1.cloud.thethings.network", "app")
+    assert ttn_values["dev1"]["voltage"].value == 3.0
+
+    # Restored by iter_uplinks but still returned by the first fetch_data
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", state_store=store
+    ) as client:
+        with mock_aiohttp_client_session_get([], 200):
+            assert not [uplink async for uplink in client.iter_uplinks()]
+            ttn_values = await client.fetch_data()
+        assert ttn_values["dev2"]["voltage"].value == 3.2
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_unstorable_values(tmp_path, mock_aiohttp_client_session_get, uplink):
+    """Test values which cannot be stored do not fail the fetch."""
+    entries = [
+        uplink("dev1", None, voltage=3.0),
+        uplink("dev2", "2024-07-06T09:19:21Z", voltage=3.1),
+    ]
+    del entries[0]["result"]["received_at"]
+    store = TTNStateStore(tmp_path / "state.db")
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", state_store=store
+    ) as client:
+        with mock_aiohttp_client_session_get(entries, 200):
+            ttn_values = await client.fetch_data()
+    assert ttn_values["dev1"]["voltage"].value == 3.0
+
+    received = {
+        "end_device_ids": {"device_id": "dev3"},
+        "received_at": "2024-07-06T09:19:22Z",
+    }
+    store.save(
+        "eu1.cloud.thethings.network",
+        "app",
+        None,
+        {"dev3": {"custom": TTNSensorValue(received, "custom", object())}},
+    )
+    cursor, ttn_values = store.load("eu1.cloud.thethings.network", "app")
+    assert cursor == "2024-07-06T09:19:21Z"
+    assert list(ttn_values) == ["dev2"]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_save_keeps_cursor(
+    tmp_path, mock_aiohttp_client_session_get, uplink
+):
+    """Test the uplinks of a fetch whose state failed to save are fetched again."""
+
+    class FailingStore(TTNStateStore):
+        """State store failing its first save."""
+
+        failures = 1
+
+        def save(self, *args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise sqlite3.OperationalError("disk I/O error")
+            super().save(*args, **kwargs)
+
+    store = FailingStore(tmp_path / "state.db")
+    async with ttn_client.TTNClient(
+        "eu1.cloud.thethings.network", "app", "NNSXS.dummy", state_store=store
+    ) as client:
+        with mock_aiohttp_client_session_get(
+            [uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)], 200
+        ) as mock_get:
+            with pytest.raises(sqlite3.OperationalError):
+                await client.fetch_data()
+            ttn_values = await client.fetch_data()
+        assert mock_get.call_args.args[1].endswith("?last=24h&order=received_at")
+        assert ttn_values["dev1"]["voltage"].value == 3.1
+    assert store.load("eu1.cloud.thethings.network", "app")[0] == (
+        "2024-07-06T09:19:21Z"
+    )
+    store.close()
+
+
+def test_unknown_value_type(tmp_path):
+    """Test values of types unknown to the store are not restored."""
+
+    class CustomValue(TTNSensorValue):
+        """Value of a custom parser."""
+
+        __slots__ = ()
+
+    received = {
+        "end_device_ids": {"device_id": "dev1"},
+        "received_at": "2024-07-06T09:19:21Z",
+    }
+    store = TTNStateStore(tmp_path / "state.db")
+    store.save(
+        "eu1",
+        "app",
+        None,
+        {
+            "dev1": {
+                "custom": CustomValue(received, "custom", 1),
+                "voltage": TTNSensorValue(received, "voltage", 3.1),
+            }
+        },
+    )
+    assert list(store.load("eu1", "app")[1]["dev1"]) == ["voltage"]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_push_saves_state(tmp_path, mqtt_broker, uplink):
+    """Test uplinks received over MQTT are stored."""
+    store = TTNStateStore(tmp_path / "state.db")
+    pushed = asyncio.Queue()
+    client = ttn_client.TTNClient(
+        "eu1.cloud.thethings.network",
+        "app",
+        "NNSXS.dummy",
+        push_callback=pushed.put,
+        mqtt_transport=mqtt_broker.transport,
+        state_store=store,
+    )
+    task = asyncio.create_task(client.run_push())
+    try:
+        await mqtt_broker.wait_connections(1)
+        mqtt_broker.publish(
+            uplink("dev1", "2024-07-06T09:19:21Z", voltage=3.1)["result"]
+        )
+        await pushed.get()
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    cursor, ttn_values = store.load("eu1.cloud.thethings.network", "app")
+    # Pushed uplinks do not move the cursor of the storage integration fetches
+    assert cursor is None
+    assert ttn_values["dev1"]["voltage"].value == 3.1
+    store.close()
@@ -0,0 +1,21 @@
+"""Test timestamp helpers."""
+
+import datetime
+
+from ttn_client.timestamp import ns_to_datetime, timestamp_ns
+
+
+def test_timestamp_ns():
+    """Test TTN timestamps are parsed with nanosecond precision."""
+    assert timestamp_ns("2024-07-06T09:19:21.381960868Z") == 1720257561381960868
+    assert timestamp_ns("2024-07-06T09:19:21Z") == 1720257561000000000
+    assert timestamp_ns("2024-07-06T09:19:21.38Z") == 1720257561380000000
+    assert timestamp_ns("2024-07-06T11:19:21.381960868+02:00") == 1720257561381960868
+    assert timestamp_ns("2024-07-06T09:19:21.3819608681") == 1720257561381960868
+
+
+def test_ns_to_datetime():
+    """Test nanoseconds are converted to a UTC datetime."""
+    assert ns_to_datetime(1720257561381960868) == datetime.datetime(
+        2024, 7, 6, 9, 19, 21, 381960, tzinfo=datetime.timezone.utc
+    )